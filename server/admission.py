@@ -0,0 +1,123 @@
+"""
+Admission control for /ingest based on the queue backlog.
+
+The backlog is the length of the 'events' list (LLEN), or of the events
+stream (XLEN; writers XDEL what they have acked). It is read at most once per
+DEPTH_TTL_MS, in the background: requests are decided on the last value read,
+so admission adds no Redis round-trip to a request.
+
+The watermarks count events whatever the codec. A queue entry is one event
+with VISAGEUX_CODEC=json but a whole request with the binary codecs
+(codec.py), so the entry count is scaled by the events per entry this
+process has pushed recently (a decayed average; 1 until the first push).
+
+Past HIGH the API is shedding until the backlog is back at LOW (hysteresis,
+so it does not flap around one threshold). While shedding, only SAMPLE_RATE
+of the low-value event types (LOW_VALUE, e.g. mousemove) is kept. Past REJECT
+whole requests get 429 with Retry-After. HIGH=0 turns admission control off.
+"""
+import asyncio
+import math
+import os
+import random
+import time
+
+from .coalesce import LIST_KEY
+from .streams import STREAM_KEY
+
+HIGH = int(os.environ.get("VISAGEUX_INGEST_HIGH", "500000"))           # queued events
+LOW = int(os.environ.get("VISAGEUX_INGEST_LOW", str(HIGH // 2)))
+REJECT = int(os.environ.get("VISAGEUX_INGEST_REJECT", str(2 * HIGH)))
+DEPTH_TTL_MS = float(os.environ.get("VISAGEUX_DEPTH_TTL_MS", "250"))
+SAMPLE_RATE = float(os.environ.get("VISAGEUX_SHED_SAMPLE", "0.1"))      # low-value events kept while shedding
+LOW_VALUE = tuple(os.environ.get("VISAGEUX_LOW_VALUE_EVENTS", "mousemove").split(","))
+RETRY_AFTER = int(os.environ.get("VISAGEUX_RETRY_AFTER", "2"))          # seconds
+RATIO_DECAY = 0.999   # per push; the events-per-entry average follows the last ~1000 requests
+
+class AdmissionControl:
+    def __init__(self, client, mode: str = "list", high: int = HIGH, low: int = LOW, reject: int = REJECT,
+                 ttl_ms: float = DEPTH_TTL_MS, sample_rate: float = SAMPLE_RATE, low_value=LOW_VALUE,
+                 retry_after: int = RETRY_AFTER):
+        self.client, self.mode = client, mode
+        self.high, self.low, self.reject = high, min(low, high), max(reject, high)
+        self.ttl = ttl_ms / 1000.0
+        self.sample_rate = sample_rate
+        self.low_value = frozenset(low_value)
+        self.retry_after = retry_after
+        self.depth = 0          # queued entries, as read
+        self.depth_events = 0   # the same in events
+        self._pushed = [0.0, 0.0]   # decayed (events, entries) pushed
+        self.shedding = False
+        self._checked = -math.inf
+        self._refresh = None
+        self.metrics = {"requests_accepted": 0, "requests_rejected": 0, "events_accepted": 0,
+                        "events_sampled_out": 0, "events_rejected": 0, "depth_checks": 0,
+                        "depth_errors": 0, "shed_transitions": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.high > 0
+
+    def _poll(self):
+        # at most one depth read in flight, at most one per ttl
+        if self._refresh is None and time.monotonic() - self._checked >= self.ttl:
+            self._refresh = asyncio.ensure_future(self._read_depth())
+
+    async def _read_depth(self):
+        try:
+            depth = await (self.client.xlen(STREAM_KEY) if self.mode == "stream" else self.client.llen(LIST_KEY))
+            self.depth = int(depth)
+            self.depth_events = int(round(self.depth * self.events_per_entry))
+            self.metrics["depth_checks"] += 1
+            d = self.depth_events
+            shedding = d >= self.high or (self.shedding and d > self.low)
+            if shedding != self.shedding:
+                self.shedding = shedding
+                self.metrics["shed_transitions"] += 1
+        except Exception:
+            # keep deciding on the last known depth; the push itself reports Redis errors
+            self.metrics["depth_errors"] += 1
+        finally:
+            self._checked = time.monotonic()
+            self._refresh = None
+
+    @property
+    def events_per_entry(self) -> float:
+        ev, en = self._pushed
+        return ev / en if en else 1.0
+
+    def record(self, n_events: int, n_entries: int):
+        """Events and queue entries of one accepted request, once pushed."""
+        if n_entries:
+            ev, en = self._pushed
+            self._pushed = [ev * RATIO_DECAY + n_events, en * RATIO_DECAY + n_entries]
+
+    def admit(self, events):
+        """
+        The events to queue, or None when the request is rejected (429 with
+        Retry-After: self.retry_after). Call from the event loop.
+        """
+        if not self.enabled:
+            return events
+        self._poll()
+        m = self.metrics
+        if self.depth_events >= self.reject:
+            m["requests_rejected"] += 1
+            m["events_rejected"] += len(events)
+            return None
+        kept = events
+        if self.shedding:
+            kept = [e for e in events if e.ev not in self.low_value or random.random() < self.sample_rate]
+            m["events_sampled_out"] += len(events) - len(kept)
+        m["requests_accepted"] += 1
+        m["events_accepted"] += len(kept)
+        return kept
+
+    def stats(self) -> dict:
+        m = dict(self.metrics)
+        m.update({"enabled": self.enabled, "depth": self.depth, "depth_events": self.depth_events,
+                  "events_per_entry": round(self.events_per_entry, 2), "shedding": self.shedding,
+                  "high": self.high, "low": self.low, "reject": self.reject,
+                  "depth_age_ms": round(1000 * (time.monotonic() - self._checked), 1)
+                  if self._checked > -math.inf else None})
+        return m
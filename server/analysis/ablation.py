@@ -1,58 +1,107 @@
+"""
+Ablation / weight-sensitivity engine for UFI and RCS.
+
+The normalized component matrix (workers/metrics.py `components`) is built
+once per window. Every variant — each of the 2^5 subsets of UFI terms, the
+2^3 subsets of RCS terms (calm, flow, oscillation penalty) and random
+perturbations of the weights — is a row of a weight matrix, so a chunk of
+variants is one matrix multiply. Windows are averaged per session with one
+reduceat, and Spearman's r against the full metric is computed for all
+variants at once from column ranks.
+
+    python -m server.analysis.ablation [--perturb 200 --scale 0.2] [--res 5s]
+"""
 from __future__ import annotations
+import itertools
 import pandas as pd
 import numpy as np
 from pathlib import Path
+import argparse
+
+from ..workers.rawstore import time_filters, parse_time
+from ..workers.feature_primitives import WINDOW, res_name, parse_res, window_path
+from ..workers.metrics import (UFI_TERMS, UFI_WEIGHTS, RCS_TERMS, RCS_WEIGHTS,
+                               components, ufi_score, rcs_score)
+from .resample import spearman_batch
 
 REPO = Path(__file__).resolve().parents[2]
-WIN_PATH = REPO / "data" / "features" / "windows_5s.parquet"
-MET_PATH = REPO / "data" / "metrics" / "metrics_5s.parquet"
+WIN_PATH = window_path(WINDOW)
 OUT = REPO / "data" / "reports" / "ablation_stability.csv"
+RCS_PARTS = RCS_TERMS + ("osc_penalty",)
+CHUNK = 64  # variants per matrix multiply
+
+def term_subsets(terms):
+    """[2^T, T] keep-masks (1 = term kept), full set first."""
+    masks = np.array(list(itertools.product([1.0, 0.0], repeat=len(terms))))
+    names = ["all" if m.all() else "drop:" + "+".join(t for t, k in zip(terms, m) if not k) for m in masks]
+    return names, masks
+
+def perturbed_weights(base: np.ndarray, n: int, scale: float, seed: int = 0) -> np.ndarray:
+    # multiplicative log-normal noise, rescaled to the original total weight
+    rng = np.random.default_rng(seed)
+    w = base * np.exp(rng.normal(0.0, scale, size=(n, len(base))))
+    return w * (base.sum() / w.sum(axis=1, keepdims=True))
+
+def variants(n_perturb: int = 0, scale: float = 0.2, seed: int = 0) -> dict:
+    """metric → (names, kinds, weights [K, T], penalty [K] or None)."""
+    u_names, u_masks = term_subsets(UFI_TERMS)
+    r_names, r_masks = term_subsets(RCS_PARTS)
+    uw = np.vstack([u_masks * UFI_WEIGHTS, perturbed_weights(UFI_WEIGHTS, n_perturb, scale, seed)])
+    rw = np.vstack([r_masks[:, :2] * RCS_WEIGHTS, perturbed_weights(RCS_WEIGHTS, n_perturb, scale, seed + 1)])
+    rp = np.r_[r_masks[:, 2], np.ones(n_perturb)]
+    perturb = [f"perturb:{i:03d}" for i in range(n_perturb)]
+    kinds = lambda k: ["subset"] * k + ["perturb"] * n_perturb
+    return {"UFI": (u_names + perturb, kinds(len(u_names)), uw, None),
+            "RCS": (r_names + perturb, kinds(len(r_names)), rw, rp)}
+
+def session_means(codes: np.ndarray, v: np.ndarray) -> np.ndarray:
+    # codes: session code per window; v [N, K] → [S, K]
+    order = np.argsort(codes, kind="stable")
+    c = codes[order]
+    starts = np.flatnonzero(np.r_[True, c[1:] != c[:-1]])
+    sums = np.add.reduceat(v[order], starts, axis=0)
+    return sums / np.diff(np.r_[starts, len(c)])[:, None]
+
+def run(w: pd.DataFrame, n_perturb: int = 0, scale: float = 0.2, seed: int = 0) -> pd.DataFrame:
+    codes, _ = pd.factorize(w["sess_key"])
+    c = components(w)
+    c_ufi, c_rcs, osc = c[list(UFI_TERMS)].to_numpy(), c[list(RCS_TERMS)].to_numpy(), c["osc"].to_numpy()
+    rows = []
+    for metric, (names, kinds, weights, penalty) in variants(n_perturb, scale, seed).items():
+        per_sess = []
+        for i in range(0, len(weights), CHUNK):
+            wk = weights[i:i + CHUNK]
+            v = (ufi_score(c_ufi, wk) if penalty is None
+                 else rcs_score(c_rcs, osc, wk, penalty[i:i + CHUNK]))
+            per_sess.append(session_means(codes, v))
+        s = np.hstack(per_sess)
+        r, p = spearman_batch(s[:, 0], s)   # variant 0 is the full metric
+        terms = UFI_TERMS if penalty is None else RCS_PARTS
+        for k, name in enumerate(names):
+            wts = list(weights[k]) + ([] if penalty is None else [penalty[k]])
+            rows.append({"metric": metric, "variant": name, "kind": kinds[k],
+                         "weights": " ".join(f"{t}={x:.3f}" for t, x in zip(terms, wts)),
+                         "spearman_r": float(r[k]), "pval": float(p[k])})
+    return pd.DataFrame(rows)
 
-def compute_metrics_from_windows(w: pd.DataFrame, drop_cursor=False, drop_scroll=False):
-    # Recompute UFI/RCS with terms zeroed depending on ablation
-    out = pd.DataFrame()
-    out["sess_key"] = w["sess_key"]
-    # terms from metrics.py formula:
-    rage = np.clip(w["rage_clicks"]/2.0, 0, 1)
-    dead = np.clip(w["dead_clicks"]/2.0, 0, 1)
-    stall= np.clip(w["hover_stall"]/1.0, 0, 1)
-    osc  = np.clip(w["scroll_oscillations"]/3.0, 0, 1)
-    jitter = 1.0 / (1.0 + np.exp(-(w["speed_std"].fillna(0.0))/150.0)) * (w["clicks"]==0).astype(float)
-
-    if drop_cursor:
-      jitter = 0.0
-    if drop_scroll:
-      osc = 0.0
-      v = 0.0
-    else:
-      v = w["scroll_velocity"].fillna(0.0)
-
-    UFI = 0.35*rage + 0.20*dead + 0.15*stall + 0.15*osc + 0.15*jitter
-    rcs_base = 0.6*(1.0/(1.0+np.exp(-( -w["speed_std"].fillna(0.0)/150.0)))) + 0.4*(1.0/(1.0+np.exp(-(v/200.0))))
-    RCS = np.clip(rcs_base, 0, 1) * (1.0 - osc)
-    return pd.DataFrame({"sess_key":w["sess_key"], "UFI":UFI, "RCS":RCS})
-
-def main():
-    w = pd.read_parquet(WIN_PATH)
-    met = pd.read_parquet(MET_PATH)[["sess_key","UFI","RCS"]].copy()
-    base = met.groupby("sess_key")[["UFI","RCS"]].mean()
-
-    cur0 = compute_metrics_from_windows(w, drop_cursor=True, drop_scroll=False).groupby("sess_key")[["UFI","RCS"]].mean()
-    scr0 = compute_metrics_from_windows(w, drop_cursor=False, drop_scroll=True).groupby("sess_key")[["UFI","RCS"]].mean()
-
-    # Spearman correlation between base and ablated (session-level)
-    from scipy.stats import spearmanr
-    rows=[]
-    for name, df2 in [("drop_cursor", cur0), ("drop_scroll", scr0)]:
-        for col in ["UFI","RCS"]:
-            a = base[col].reindex(df2.index).dropna()
-            b = df2[col].reindex(a.index).dropna()
-            r,p = spearmanr(a, b)
-            rows.append({"ablation":name, "metric":col, "spearman_r": float(r), "pval": float(p)})
-    out = pd.DataFrame(rows)
-    OUT.parent.mkdir(parents=True, exist_ok=True)
-    out.to_csv(OUT, index=False)
-    print(f"[ablation] wrote {OUT}:\n", out.to_string(index=False))
+def main(start=None, end=None, res=WINDOW, n_perturb=0, scale=0.2, seed=0, out=OUT):
+    w = pd.read_parquet(window_path(res), filters=time_filters("w_start", start, end))
+    df = run(w, n_perturb, scale, seed)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(out, index=False)
+    print(f"[ablation] {len(df)} variants over {w['sess_key'].nunique()} sessions "
+          f"({res_name(res)} windows) → {out}")
+    print(df[df["kind"] == "subset"].to_string(index=False))
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--start", help="epoch seconds or ISO time (inclusive)")
+    ap.add_argument("--end", help="epoch seconds or ISO time (exclusive)")
+    ap.add_argument("--res", default=res_name(WINDOW), help="window resolution, e.g. 5s, 30s, session")
+    ap.add_argument("--perturb", type=int, default=0, help="random weight vectors per metric")
+    ap.add_argument("--scale", type=float, default=0.2, help="log-normal sd of weight perturbations")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", type=Path, default=OUT)
+    args = ap.parse_args()
+    main(parse_time(args.start), parse_time(args.end), parse_res(args.res), args.perturb, args.scale,
+         args.seed, args.out)
@@ -2,6 +2,9 @@ from __future__ import annotations
 import pandas as pd
 import numpy as np
 from pathlib import Path
+import argparse
+from ..workers.rawstore import time_filters, parse_time
+from .resample import WORKERS, correlation_intervals
 
 REPO = Path(__file__).resolve().parents[2]
 EV_PATH = REPO / "data" / "features" / "events_sessionized.parquet"
@@ -41,10 +44,12 @@ def our_metrics(met: pd.DataFrame):
     })
     return out
 
-def main():
-    ev = pd.read_parquet(EV_PATH)
-    w  = pd.read_parquet(WIN_PATH)
-    met= pd.read_parquet(MET_PATH)
+FEATURES = ["bounce","dwell_s","events_n","UFI_mean","RCS_mean","MIV_median"]
+
+def main(start=None, end=None, n_boot=1000, n_perm=1000, seed=0, workers=WORKERS):
+    ev = pd.read_parquet(EV_PATH, columns=["sess_key","ts","ev"], filters=time_filters("ts", start, end))
+    w  = pd.read_parquet(WIN_PATH, columns=["sess_key","w_start","w_end"], filters=time_filters("w_start", start, end))
+    met= pd.read_parquet(MET_PATH, columns=["sess_key","w_start","UFI","RCS","MIV"], filters=time_filters("w_start", start, end))
 
     tgt = build_targets(ev, w)
     ga  = ga_baselines(ev)
@@ -53,20 +58,23 @@ def main():
     df = ga.join(ours, how="inner").join(tgt["drop_10s"], how="inner")
     df = df.dropna()
 
-    # correlations with drop_10s
-    # Spearman rank corr is robust
-    from scipy.stats import spearmanr
-    rows=[]
-    for col in ["bounce","dwell_s","events_n","UFI_mean","RCS_mean","MIV_median"]:
-        try:
-            r,p = spearmanr(df[col], df["drop_10s"])
-            rows.append({"feature": col, "spearman_r": float(r), "pval": float(p)})
-        except Exception as e:
-            rows.append({"feature": col, "spearman_r": np.nan, "pval": np.nan, "err": str(e)})
-    out = pd.DataFrame(rows)
+    # correlations with drop_10s (Spearman rank corr is robust), with session
+    # bootstrap CIs and permutation p-values for every feature at once
+    stats = correlation_intervals(df[FEATURES].to_numpy(dtype=float), df["drop_10s"].to_numpy(dtype=float),
+                                  n_boot, n_perm, seed, workers) if len(df) > 2 else {"spearman_r": np.nan, "pval": np.nan}
+    out = pd.DataFrame({"feature": FEATURES, **stats})
+    out["sessions"] = len(df)
     OUT.parent.mkdir(parents=True, exist_ok=True)
     out.to_csv(OUT, index=False)
     print(f"[report] wrote {OUT}:\n", out.to_string(index=False))
 
 if __name__ == "__main__":
-    main()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--start", help="epoch seconds or ISO time (inclusive)")
+    ap.add_argument("--end", help="epoch seconds or ISO time (exclusive)")
+    ap.add_argument("--boot", type=int, default=1000, help="bootstrap resamples (0: none)")
+    ap.add_argument("--perm", type=int, default=1000, help="permutations (0: none)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    args = ap.parse_args()
+    main(parse_time(args.start), parse_time(args.end), args.boot, args.perm, args.seed, args.workers)
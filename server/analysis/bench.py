@@ -0,0 +1,390 @@
+"""
+End-to-end pipeline benchmark on seeded synthetic traffic (synthetic/scale.py).
+
+Every stage runs in-process on the previous stage's output and is timed;
+a background sampler records peak RSS while it runs. Generated events are
+streamed to disk in sess shards (SHARD_EVENTS each) and the per-session
+stages go shard by shard, so their peak memory follows SHARD_EVENTS, not
+--events. The JSON report
+carries the environment (commit, library versions) next to the numbers,
+so two reports can be compared:
+
+    python -m server.analysis.bench --events 1e6 --seed 0
+    python -m server.analysis.bench --compare old.json new.json
+    python -m server.analysis.bench --startup    # API cold start vs STARTUP_BUDGET
+    python -m server.analysis.bench --writer     # list-mode writer events/s, pandas vs Arrow
+    python -m server.analysis.bench --stream-procs 1 2 4   # stream writer events/s by --procs
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ..synthetic.scale import generate, iter_events, event_dicts
+from ..workers.sessionize import prepare_events, sessionize
+from ..workers.feature_primitives import compute_windows
+from ..workers.metrics import compute_metrics
+from ..workers.cube import write_cube
+from ..workers.shards import shard_ids, part_path
+from ..privacy.aggregator import MetricsCache, CubeCache, dp_group_aggregate, dp_batch_aggregate
+from ..models.utils import compute_next_event_gap, make_labels, build_sequences, sequence_batches
+from ..models.gru_numpy import NPZ, NumpyGRU
+
+REPO = Path(__file__).resolve().parents[2]
+OUT_DIR = REPO / "data" / "reports" / "bench"
+SAMPLE_EVERY = 0.01     # seconds between RSS samples
+TOLERANCE = 0.15        # --compare flags stages slower by more than this
+DP_QUERIES = [(["sess_key"], "UFI", "mean", 0.0, 1.0), (["hour"], "RCS", "sum", 0.2, 0.5),
+              (["day"], "MIV", "count", 0.0, 5.0), (["sess_key"], "UFI", "mean", 0.33, 0.9)]
+# one dashboard page: every metric × agg over one grouping, as a single batch
+DP_BATCH = [{"metric": m, "agg": a} for m in ("UFI", "RCS", "MIV") for a in ("mean", "sum", "count")]
+
+SHARD_EVENTS = 1_000_000      # run(): events per shard; per-session stages hold one shard at a time
+WRITER_EVENTS = 50_000
+STREAM_DRAIN_TIMEOUT = 120.0   # seconds per --procs run
+
+# ingest-only API process: import, lifespan startup/shutdown, one event encoded
+STARTUP_BUDGET = {"seconds": 1.0, "rss_mb": 64.0}
+STARTUP_RUNS = 5
+HEAVY_MODULES = ("pandas", "numpy", "pyarrow", "scipy", "torch")
+_STARTUP_PROBE = """
+import asyncio, json, resource, sys, time
+t0 = time.perf_counter()
+from server.app import app, Event, CODEC, encode_batch
+async def cycle():
+    async with app.router.lifespan_context(app):
+        ev = Event(sid="s", uid="u", ts=0.0, ev="click")
+        ev.model_dump_json() if CODEC == "json" else encode_batch([ev.model_dump()], CODEC)
+asyncio.run(cycle())
+secs = time.perf_counter() - t0
+try:   # VmHWM: ru_maxrss would carry the parent's peak across exec
+    rss = next(int(l.split()[1]) for l in open("/proc/self/status") if l.startswith("VmHWM")) / 1024
+except OSError:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps({"seconds": secs, "rss_mb": rss,
+                  "heavy": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        import resource   # peak, not current, outside Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class Stage:
+    """Context manager: wall time plus peak RSS sampled on a thread."""
+    def __init__(self, report: dict, name: str):
+        self.report, self.name = report, name
+        self.rows = None
+
+    def _sample(self):
+        while not self._done.wait(SAMPLE_EVERY):
+            self.peak = max(self.peak, _rss_mb())
+
+    def __enter__(self):
+        self.start_rss = self.peak = _rss_mb()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self.t0
+        self._done.set(); self._thread.join()
+        end = _rss_mb()
+        self.report[self.name] = {
+            "seconds": round(dt, 4),
+            "peak_rss_mb": round(max(self.peak, end), 1),
+            "peak_over_start_mb": round(max(self.peak, end) - self.start_rss, 1),
+            "rows": self.rows,
+        }
+        print(f"[bench] {self.name:<20} {dt:8.3f}s  peak +{self.report[self.name]['peak_over_start_mb']:.0f} MB")
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def _spool(blocks, out: Path, n_shards: int) -> int:
+    # generator blocks → one parquet file per shard of (uid, sid), appended a
+    # row group per block; a session never spans (uid, sid) pairs, so shards
+    # can be sessionized independently
+    out.mkdir(parents=True)
+    writers, rows = {}, 0
+    try:
+        for df in blocks:
+            shard = shard_ids(df["uid"].astype(str) + "@" + df["sid"].astype(str), n_shards)
+            for s in np.unique(shard):
+                t = pa.Table.from_pandas(df[shard == s], preserve_index=False)
+                if s not in writers:
+                    writers[s] = pq.ParquetWriter(part_path(out, s), t.schema)
+                writers[s].write_table(t.cast(writers[s].schema))
+            rows += len(df)
+    finally:
+        for w in writers.values():
+            w.close()
+    return rows
+
+def _each(src: Path, dst: Path, fn) -> int:
+    # fn over every shard of src, one shard in memory at a time
+    dst.mkdir(parents=True, exist_ok=True)
+    rows = 0
+    for f in sorted(src.glob("part-*.parquet")):
+        out = fn(pd.read_parquet(f), f.name)
+        if out is not None:
+            out.to_parquet(dst / f.name, index=False)
+            rows += len(out)
+    return rows
+
+def run(n_events: int, seed: int = 0, out: Path = None) -> dict:
+    """
+    Generated blocks are streamed into ceil(n_events / SHARD_EVENTS) shards on
+    disk and every per-session stage runs shard by shard, so peak memory
+    follows SHARD_EVENTS, not n_events. The cube and DP stages load the
+    metrics dataset whole, as the API does.
+    """
+    stages = {}
+    n_shards = max(1, -(-n_events // SHARD_EVENTS))
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        with Stage(stages, "generate") as st:
+            st.rows = _spool(iter_events(n_events, seed=seed), tmp / "raw", n_shards)
+        with Stage(stages, "sessionize") as st:
+            st.rows = _each(tmp / "raw", tmp / "sess", lambda df, _: sessionize(prepare_events(df)))
+        with Stage(stages, "feature_primitives") as st:
+            st.rows = _each(tmp / "sess", tmp / "windows", lambda df, _: compute_windows(df))
+        met_path = tmp / "metrics_5s.parquet"
+        with Stage(stages, "metrics") as st:
+            st.rows = _each(tmp / "windows", met_path, lambda df, _: compute_metrics(df))
+
+        m = pd.read_parquet(met_path)
+        with Stage(stages, "cube") as st:
+            write_cube(m, met_path, tmp / "cube")
+            st.rows = len(m)
+        del m
+        cache = MetricsCache(met_path)
+        no_cube = CubeCache(tmp / "none")
+        cubes = CubeCache(tmp / "cube")
+        # cold: load + first group pass; warm: memoized stats, fresh noise
+        for name, cb in (("dp_aggregate_cold", no_cube), ("dp_aggregate_warm", no_cube),
+                         ("dp_aggregate_cube", cubes)):
+            with Stage(stages, name) as st:
+                st.rows = sum(len(dp_group_aggregate(g, met, agg, 1.0, 5, lo, hi, cache=cache, cubes=cb))
+                              for g, met, agg, lo, hi in DP_QUERIES)
+        with Stage(stages, "dp_aggregate_batch") as st:
+            batch = dp_batch_aggregate(["sess_key"], DP_BATCH, 5, cache=MetricsCache(met_path), cubes=no_cube)
+            st.rows = len(batch["groups"]) * len(DP_BATCH)
+        del cache, cubes
+
+        def labels(w, name):
+            w = w.sort_values(["sess_key", "w_start"]).reset_index(drop=True)
+            ev = pd.read_parquet(tmp / "sess" / name, columns=["sess_key", "ts"])
+            ev = ev.sort_values(["sess_key", "ts"]).reset_index(drop=True)
+            return w.assign(y=make_labels(w, compute_next_event_gap(ev, w)))
+
+        with Stage(stages, "labels") as st:
+            st.rows = _each(tmp / "windows", tmp / "labeled", labels)
+        model = NumpyGRU.load(NPZ)
+        parts = sorted((tmp / "labeled").glob("part-*.parquet"))
+        with Stage(stages, "build_sequences") as st:
+            st.rows = 0
+            for f in parts:
+                idx_seq, _ = build_sequences(w := pd.read_parquet(f, columns=["sess_key", "y"]), w["y"],
+                                             L=model.seqlen)
+                np.save(f.with_suffix(".npy"), idx_seq)
+                st.rows += len(idx_seq)
+        with Stage(stages, "inference") as st:
+            st.rows = 0
+            for f in parts:
+                X = model.zscore(pd.read_parquet(f, columns=model.features).to_numpy(dtype=np.float32))
+                p = [model.predict(xb) for xb in sequence_batches(X, np.load(f.with_suffix(".npy")), 4096)]
+                st.rows += int(sum(len(b) for b in p))
+
+    report = {
+        "meta": {
+            "events": int(n_events), "seed": int(seed), "shards": n_shards, "commit": _git_commit(),
+            "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "cpus": os.cpu_count(), "when": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "stages": stages,
+    }
+    out = out or OUT_DIR / f"bench-{n_events}-{report['meta']['commit'] or 'local'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"[bench] wrote {out}")
+    return report
+
+def startup(runs: int = STARTUP_RUNS, budget: dict = STARTUP_BUDGET) -> bool:
+    """Cold-start each run in a fresh interpreter; False if over budget or analytics got imported."""
+    res = []
+    for _ in range(runs):
+        p = subprocess.run([sys.executable, "-c", _STARTUP_PROBE], cwd=REPO, capture_output=True, text=True)
+        if p.returncode:
+            raise RuntimeError(f"startup probe failed:\n{p.stderr}")
+        res.append(json.loads(p.stdout.strip().splitlines()[-1]))
+    secs = float(np.median([r["seconds"] for r in res]))
+    rss = max(r["rss_mb"] for r in res)
+    heavy = sorted({m for r in res for m in r["heavy"]})
+    ok = secs <= budget["seconds"] and rss <= budget["rss_mb"] and not heavy
+    print(f"[bench] startup: {secs:.3f}s (budget {budget['seconds']}s), peak RSS {rss:.0f} MB "
+          f"(budget {budget['rss_mb']:.0f} MB), analytics modules loaded: {heavy or 'none'} → "
+          f"{'ok' if ok else 'OVER BUDGET'}")
+    return ok
+
+def writer(n_events: int = WRITER_EVENTS, seed: int = 0, codec: str = "json") -> dict:
+    """
+    Events/s of the two list-mode writers (workers/events_writer.py) on the same
+    queue entries: decode + DataFrame + write_events every BATCH_SIZE events
+    (run) against entries_table + PartitionWriter per ARROW_BATCH entries,
+    closed after each batch (run_arrow). Redis is left out; files go to a temp dir.
+    """
+    from ..codec import decode, encode_batch
+    from ..workers.arrow_writer import PartitionWriter, entries_table
+    from ..workers.events_writer import ARROW_BATCH, BATCH_SIZE
+    from ..workers.rawstore import list_files, read_files, write_events
+    events = list(event_dicts(generate(n_events, seed=seed)))
+    if codec == "json":
+        entries = [json.dumps(e).encode("utf-8") for e in events]
+    else:
+        entries = [encode_batch(events[i:i + 100], codec) for i in range(0, len(events), 100)]
+    res = {"events": len(events), "codec": codec}
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "pandas"
+        t0, buf = time.perf_counter(), []
+        for raw in entries:
+            buf.extend(decode(raw))
+            if len(buf) >= BATCH_SIZE:
+                write_events(pd.DataFrame(buf), root=root)
+                buf = []
+        if buf:
+            write_events(pd.DataFrame(buf), root=root)
+        res["pandas_events_per_s"] = len(events) / (time.perf_counter() - t0)
+        res["pandas_rows"] = len(read_files(list_files(root=root)))
+
+        root = Path(tmp) / "arrow"
+        t0 = time.perf_counter()
+        w = PartitionWriter(root=root, background=False)
+        for i in range(0, len(entries), ARROW_BATCH):
+            w.write(entries_table(entries[i:i + ARROW_BATCH]))
+            w.flush()
+        w.close()
+        res["arrow_events_per_s"] = len(events) / (time.perf_counter() - t0)
+        res["arrow_rows"] = len(read_files(list_files(root=root)))
+    if res["pandas_rows"] != res["arrow_rows"]:
+        raise RuntimeError(f"writers stored different row counts: {res}")
+    res["speedup"] = res["arrow_events_per_s"] / res["pandas_events_per_s"]
+    print(f"[bench] writer ({codec}, {len(events)} events): pandas {res['pandas_events_per_s']:,.0f} ev/s, "
+          f"arrow {res['arrow_events_per_s']:,.0f} ev/s → {res['speedup']:.1f}×")
+    return res
+
+def stream_procs(procs=(1, 2, 4), n_events: int = WRITER_EVENTS, seed: int = 0, arrow: bool = False) -> dict:
+    """
+    Events/s of `events_writer --stream --procs N` for each N, against the
+    Redis at VISAGEUX_REDIS_URL. Each run refills the stream with the same
+    events, starts the writers on a temp root and stops the clock once the
+    stream is down to the tail the writers hold until FLUSH_SECONDS; the run
+    then drains fully and the stored row count is checked.
+    """
+    import signal
+    import redis
+    from ..streams import STREAM_KEY, xadd_events
+    from ..workers.events_writer import REDIS_URL, ARROW_BATCH, BATCH_SIZE, FLUSH_SECONDS
+    from ..workers.rawstore import list_files, read_files
+    r = redis.Redis.from_url(REDIS_URL)
+    payloads = [json.dumps(e).encode("utf-8") for e in event_dicts(generate(n_events, seed=seed))]
+    res = {"events": len(payloads), "arrow": arrow, "events_per_s": {}}
+    for n in procs:
+        r.delete(STREAM_KEY)
+        for i in range(0, len(payloads), 1000):
+            xadd_events(r, payloads[i:i + 1000])
+        tail = n * (ARROW_BATCH if arrow else BATCH_SIZE)
+        if len(payloads) < 2 * tail:
+            raise ValueError(f"--procs {n}: need at least {2 * tail} events to time more than the tail")
+        with tempfile.TemporaryDirectory() as tmp:
+            cmd = [sys.executable, "-m", "server.workers.events_writer", "--stream",
+                   "--procs", str(n), "--consumer", f"bench-{n}", "--root", tmp] + (["--arrow"] if arrow else [])
+            log = Path(tmp) / "writers.log"   # outside the store; killed writers log connection errors
+            p = subprocess.Popen(cmd, cwd=REPO, stdout=subprocess.DEVNULL, stderr=log.open("w"),
+                                 start_new_session=True)
+            try:
+                t0 = time.perf_counter()
+                while (left := r.xlen(STREAM_KEY)) > tail:
+                    if p.poll() is not None or time.perf_counter() - t0 > STREAM_DRAIN_TIMEOUT:
+                        raise RuntimeError(f"--procs {n}: writers exited or stalled with {left} entries "
+                                           f"left:\n{log.read_text()[-2000:]}")
+                    time.sleep(0.01)
+                rate = (len(payloads) - left) / (time.perf_counter() - t0)
+                deadline = time.perf_counter() + FLUSH_SECONDS + 10
+                while r.xlen(STREAM_KEY) and time.perf_counter() < deadline:
+                    time.sleep(0.1)
+            finally:
+                os.killpg(p.pid, signal.SIGTERM)
+                p.wait()
+            stored = len(read_files(list_files(root=Path(tmp))))
+        if stored != len(payloads):
+            raise RuntimeError(f"--procs {n}: stored {stored} of {len(payloads)} events")
+        res["events_per_s"][n] = rate
+        print(f"[bench] stream writer --procs {n}{' --arrow' if arrow else ''}: {rate:,.0f} ev/s")
+    r.delete(STREAM_KEY)
+    return res
+
+def compare(old: Path, new: Path, tolerance: float = TOLERANCE) -> pd.DataFrame:
+    a, b = json.loads(Path(old).read_text()), json.loads(Path(new).read_text())
+    if a["meta"]["events"] != b["meta"]["events"] or a["meta"]["seed"] != b["meta"]["seed"]:
+        print("[bench] warning: reports were run with different --events/--seed")
+    rows = []
+    for name in a["stages"].keys() & b["stages"].keys():
+        s0, s1 = a["stages"][name], b["stages"][name]
+        rows.append({"stage": name, "old_s": s0["seconds"], "new_s": s1["seconds"],
+                     "ratio": s1["seconds"] / max(s0["seconds"], 1e-9),
+                     "old_peak_mb": s0["peak_over_start_mb"], "new_peak_mb": s1["peak_over_start_mb"]})
+    out = pd.DataFrame(rows).set_index("stage").reindex([s for s in b["stages"] if s in a["stages"]])
+    out["regression"] = out["ratio"] > 1 + tolerance
+    print(out.to_string(float_format=lambda v: f"{v:.3f}"))
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic traffic")
+    ap.add_argument("--events", type=float, default=1e5, help="approximate event count, e.g. 1e6")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", type=Path, default=None)
+    ap.add_argument("--compare", nargs=2, type=Path, metavar=("OLD", "NEW"))
+    ap.add_argument("--tolerance", type=float, default=TOLERANCE)
+    ap.add_argument("--startup", action="store_true", help="check the API cold start against STARTUP_BUDGET")
+    ap.add_argument("--writer", default=None, metavar="CODEC", nargs="?", const="json",
+                    help="list-mode writer events/s, pandas vs Arrow (json, msgpack, msgpack+zstd)")
+    ap.add_argument("--stream-procs", type=int, nargs="+", default=None, metavar="N",
+                    help="stream writer events/s for each --procs N (Redis at VISAGEUX_REDIS_URL)")
+    ap.add_argument("--arrow", action="store_true", help="with --stream-procs: run the writers with --arrow")
+    args = ap.parse_args()
+    if args.startup:
+        raise SystemExit(0 if startup() else 1)
+    if args.writer:
+        writer(int(args.events), args.seed, args.writer)
+        return
+    if args.stream_procs:
+        stream_procs(args.stream_procs, int(args.events), args.seed, args.arrow)
+        return
+    if args.compare:
+        res = compare(*args.compare, tolerance=args.tolerance)
+        raise SystemExit(1 if res["regression"].any() else 0)
+    run(int(args.events), args.seed, args.out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Session-level resampling for rank correlations.
+
+Features and target are rank-transformed (and standardized) once. A chunk of
+resamples is a matrix: bootstrap draws are an [b, n] index matrix turned into
+per-session counts, so weighted moments of every feature are one
+counts @ [x, x², x·y, y, y²] product. Permutations of a target with few distinct values (drop_10s is
+binary) only draw where the minority values land, m = n - (largest group)
+positions without replacement, and sum the feature ranks there; other
+targets are permuted in full as a [b, n] matrix. Chunks run on a
+process pool with independent seeds from one SeedSequence, so results do not
+depend on the worker count.
+
+Bootstrap correlations use the full-sample ranks of the resampled sessions
+(ranks are not recomputed per resample), the usual shortcut for large n.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.stats import rankdata, t as t_dist
+
+CHUNK = 16           # resamples per matrix product
+MAX_LEVELS = 256     # targets with at most this many distinct values use grouped permutations
+WORKERS = os.cpu_count() or 1
+ALPHA = 0.05
+
+def spearman_batch(base: np.ndarray, x: np.ndarray):
+    """Spearman r and two-sided p of `base` [S] against every column of x [S, K]."""
+    n = len(base)
+    rb = rankdata(base)
+    rx = rankdata(x, axis=0)
+    rb = rb - rb.mean()
+    rx = rx - rx.mean(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = (rb @ rx) / (np.sqrt((rb ** 2).sum()) * np.sqrt((rx ** 2).sum(axis=0)))
+        r = np.clip(r, -1.0, 1.0)
+        tt = r * np.sqrt((n - 2) / np.maximum(1.0 - r ** 2, 1e-300))
+    p = 2 * t_dist.sf(np.abs(tt), n - 2) if n > 2 else np.full(len(r), np.nan)
+    return r, p
+
+def standard_ranks(a: np.ndarray) -> np.ndarray:
+    # ranks per column, centred and scaled to unit variance (constant → NaN)
+    r = rankdata(a, axis=0)
+    r = r - r.mean(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.ascontiguousarray(r / r.std(axis=0))   # row gathers need C order
+
+_X = _Y = _M = _LEVELS = None
+
+def _init(x, y):
+    # per worker: ranks and the moment columns, shipped once
+    global _X, _Y, _M, _LEVELS
+    _X, _Y = x, y
+    _M = np.hstack([x, x * x, x * y[:, None], y[:, None], (y * y)[:, None]])
+    vals, counts = np.unique(y, return_counts=True)
+    _LEVELS = None
+    if len(vals) <= MAX_LEVELS:
+        major = np.argmax(counts)
+        rest = np.arange(len(vals)) != major
+        _LEVELS = (vals[rest] - vals[major], np.r_[0, np.cumsum(counts[rest])])
+
+def _boot(seed, b):
+    n, f = _X.shape
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, n, size=(b, n))
+    counts = np.bincount((idx + n * np.arange(b)[:, None]).ravel(), minlength=b * n).reshape(b, n)
+    s = (counts.astype(float) @ _M) / n
+    mx, mxx, mxy = s[:, :f], s[:, f:2 * f], s[:, 2 * f:3 * f]
+    my, myy = s[:, -2:-1], s[:, -1:]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return (mxy - mx * my) / np.sqrt((mxx - mx ** 2) * (myy - my ** 2))
+
+def _perm(seed, b):
+    # standardized ranks: the permuted correlation is mean(x · y[perm])
+    n = len(_Y)
+    rng = np.random.default_rng(seed)
+    if _LEVELS is None:
+        yp = _Y[rng.permuted(np.broadcast_to(np.arange(n), (b, n)), axis=1)]
+        return yp @ _X / n
+    # x columns sum to 0, so only the non-majority groups contribute:
+    # Σ_d (y_d - y_major) · Σ_{i in group d} x_i
+    delta, bounds = _LEVELS
+    out = np.empty((b, _X.shape[1]))
+    for j in range(b):
+        pick = rng.choice(n, bounds[-1], replace=False)
+        out[j] = delta @ np.add.reduceat(np.take(_X, pick, axis=0), bounds[:-1], axis=0) / n if bounds[-1] else 0.0
+    return out
+
+def _map(fn, x, y, n_total, seed, workers):
+    sizes = [min(CHUNK, n_total - i) for i in range(0, n_total, CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    if workers <= 1 or len(sizes) <= 1:
+        _init(x, y)
+        return np.vstack([fn(s, b) for s, b in zip(seeds, sizes)] or [np.zeros((0, x.shape[1]))])
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init, initargs=(x, y)) as ex:
+        return np.vstack(list(ex.map(fn, seeds, sizes)))
+
+def correlation_intervals(features: np.ndarray, target: np.ndarray, n_boot: int = 1000, n_perm: int = 1000,
+                          seed: int = 0, workers: int = WORKERS, alpha: float = ALPHA) -> dict:
+    """
+    Spearman r of each feature column with `target`, its analytic p, a
+    percentile bootstrap CI and a permutation p (add-one estimate).
+    """
+    r, p = spearman_batch(target, features)
+    x, y = standard_ranks(features), standard_ranks(target)
+    out = {"spearman_r": r, "pval": p}
+    if n_boot:
+        boot = _map(_boot, x, y, n_boot, [seed, 0], workers)
+        out["ci_low"], out["ci_high"] = np.nanpercentile(boot, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+    if n_perm:
+        perm = _map(_perm, x, y, n_perm, [seed, 1], workers)
+        obs = x.T @ y / len(y)
+        out["perm_pval"] = (1 + (np.abs(perm) >= np.abs(obs) - 1e-12).sum(axis=0)) / (1 + n_perm)
+        out["perm_pval"][~np.isfinite(obs)] = np.nan
+    return out
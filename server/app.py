@@ -1,15 +1,51 @@
-from fastapi import FastAPI, Body
+"""
+VisageUX API.
+
+Startup stays light so replicas are ready quickly: the analytics stack
+(pandas, pyarrow, numpy) is imported on the first /privacy call, and the
+Redis pool is opened by the lifespan handler rather than at import.
+/health is liveness; /ready answers 503 until Redis responds. /ingest sheds
+load by queue depth (admission.py).
+
+    python -m server.analysis.bench --startup    # import time / RSS budget of the ingest path
+"""
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional, Union
+
+import redis.asyncio as aioredis
+from fastapi import FastAPI, Body, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from typing import List, Union
-import redis
-from fastapi import Query
-from typing import List, Literal
-from .privacy.aggregator import dp_group_aggregate, DEFAULTS
 
-from .events import Event
+from .privacy.config import DEFAULTS
+from .events import Event, Window, DPBatch
+from .streams import QUEUE_MODE
+from .coalesce import IngestCoalescer
+from .admission import AdmissionControl
+from .codec import CODEC, encode_batch
 
-app = FastAPI(title="VisageUX API", version="0.1.0")
+REDIS_URL = os.environ.get("VISAGEUX_REDIS_URL", "redis://localhost:6379/0")
+POOL_SIZE = int(os.environ.get("VISAGEUX_REDIS_POOL", "64"))   # connections per process
+READY_TIMEOUT = 1.0
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # one async connection pool per process; connections open on first use
+    pool = aioredis.ConnectionPool.from_url(REDIS_URL, max_connections=POOL_SIZE, decode_responses=False)
+    app.state.redis = aioredis.Redis(connection_pool=pool)
+    app.state.coalescer = IngestCoalescer(app.state.redis, mode=QUEUE_MODE)
+    app.state.admission = AdmissionControl(app.state.redis, mode=QUEUE_MODE)
+    try:
+        yield
+    finally:
+        await app.state.coalescer.drain()
+        await app.state.redis.aclose()
+        await pool.disconnect()
+
+app = FastAPI(title="VisageUX API", version="0.1.0", lifespan=lifespan)
 
 # CORS so the extension/front-end can POST later
 app.add_middleware(
@@ -20,40 +56,107 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Connect to local Redis once at startup
-def _redis():
-    return redis.Redis(host="localhost", port=6379, db=0, decode_responses=False)
+def aggregator():
+    # pandas/pyarrow are loaded by the first /privacy query, not at startup
+    from .privacy import aggregator
+    return aggregator
 
-r = _redis()
+def parse_time(s):
+    from .workers.rawstore import parse_time
+    return parse_time(s)
 
-@app.get("/health")
-def health():
-    ok = True
-    redis_ok = False
+# online drop-off scorer; weights are loaded on first use
+_dropper = None
+_dropper_lock = threading.Lock()
+
+def dropper():
+    global _dropper
+    if _dropper is None:
+        with _dropper_lock:
+            if _dropper is None:
+                from .models.online import OnlineDropper
+                _dropper = OnlineDropper()
+    return _dropper
+
+async def _redis_ok() -> bool:
     try:
-        r.ping()
-        redis_ok = True
+        await asyncio.wait_for(app.state.redis.ping(), READY_TIMEOUT)
+        return True
     except Exception:
-        pass
-    return {"ok": ok, "service": "visageux-api", "redis": redis_ok}
+        return False
+
+@app.get("/health")
+async def health():
+    return {"ok": True, "service": "visageux-api", "redis": await _redis_ok()}
+
+@app.get("/ready")
+async def ready():
+    # readiness: take traffic only once Redis answers
+    if not await _redis_ok():
+        return JSONResponse(status_code=503, content={"ready": False, "redis": False})
+    return {"ready": True, "redis": True}
 
 @app.post("/ingest")
-def ingest(payload: Union[Event, List[Event]] = Body(...)):
+async def ingest(payload: Union[Event, List[Event]] = Body(...)):
     """
     Accept either a single Event object or a list of Events.
-    Push each JSON string to Redis list 'events'.
+    Each JSON string goes to Redis list 'events' (or the events stream when
+    VISAGEUX_QUEUE=stream), batched with concurrent requests (coalesce.py);
+    the response is sent once the events are in Redis. With a binary
+    VISAGEUX_CODEC the whole request is one entry (codec.py).
+    When the queue is backed up, low-value events are sampled and past the
+    reject watermark the request gets 429 + Retry-After (admission.py).
     """
+    evs = payload if isinstance(payload, list) else [payload]
+    admission = app.state.admission
+    kept = admission.admit(evs)
+    if kept is None:
+        return JSONResponse(status_code=429, content={"error": "ingest queue is backed up, retry later"},
+                            headers={"Retry-After": str(admission.retry_after)})
     try:
-        if isinstance(payload, list):
-            for ev in payload:
-                # Pydantic v2
-                r.rpush("events", ev.model_dump_json())
-            return {"status": "queued", "count": len(payload)}
+        # Pydantic v2
+        if not kept:
+            entries = []
+        elif CODEC == "json":
+            entries = [ev.model_dump_json() for ev in kept]
         else:
-            r.rpush("events", payload.model_dump_json())
-            return {"status": "queued", "count": 1}
+            entries = [encode_batch([ev.model_dump() for ev in kept], CODEC)]
+        await app.state.coalescer.submit(entries)
+        admission.record(len(kept), len(entries))
+        out = {"status": "queued", "count": len(kept)}
+        if len(kept) < len(evs):
+            out["sampled_out"] = len(evs) - len(kept)
+        return out
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@app.get("/ingest/stats")
+def ingest_stats():
+    # batch sizes achieved by the coalescer since start; accepted/shed counts
+    return {**app.state.coalescer.stats(), "admission": app.state.admission.stats()}
+
+@app.post("/predict/drop")
+def predict_drop(payload: Union[Window, List[Window]] = Body(...)):
+    """
+    Score finished 5s windows as they arrive. Each session's GRU state is kept
+    server-side and advanced one step per window (models/online.py).
+    """
+    wins = payload if isinstance(payload, list) else [payload]
+    try:
+        return {"rows": dropper().update([w.model_dump() for w in wins])}
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
+
+def parse_where(items: List[str]) -> dict:
+    # ["col=value", ...] → {col: value}; values are cast to the column type by the aggregator
+    out = {}
+    for it in items:
+        col, sep, value = it.partition("=")
+        if not sep or not col:
+            raise ValueError(f"filter must be col=value: {it!r}")
+        out[col] = value
+    return out
+
 @app.get("/privacy/config")
 def privacy_config():
     return DEFAULTS
@@ -67,9 +170,13 @@ def privacy_aggregate(
     k: int = Query(DEFAULTS["k"]),
     clip_lo: float = Query(DEFAULTS["clip_lo"]),
     clip_hi: float = Query(DEFAULTS["clip_hi"]),
+    start: Optional[str] = Query(None, description="w_start >= start (epoch seconds or ISO time)"),
+    end: Optional[str] = Query(None, description="w_start < end (epoch seconds or ISO time)"),
+    where: List[str] = Query([], description="equality filters col=value, e.g. sess_key=abc or hour=1700000000"),
 ):
     try:
-        df = dp_group_aggregate(group_by, metric, agg, epsilon, k, clip_lo, clip_hi)
+        df = aggregator().dp_group_aggregate(group_by, metric, agg, epsilon, k, clip_lo, clip_hi, start=parse_time(start),
+                                end=parse_time(end), where=parse_where(where))
         return {"rows": df.to_dict(orient="records")}
     except Exception as e:
         return JSONResponse(status_code=400, content={"error": str(e)})
@@ -83,9 +190,38 @@ def privacy_aggregate_get(
     k: int = Query(DEFAULTS["k"]),
     clip_lo: float = Query(DEFAULTS["clip_lo"]),
     clip_hi: float = Query(DEFAULTS["clip_hi"]),
+    start: Optional[str] = Query(None, description="w_start >= start (epoch seconds or ISO time)"),
+    end: Optional[str] = Query(None, description="w_start < end (epoch seconds or ISO time)"),
+    where: List[str] = Query([], description="equality filters col=value, e.g. sess_key=abc or hour=1700000000"),
 ):
     try:
-        df = dp_group_aggregate(group_by, metric, agg, epsilon, k, clip_lo, clip_hi)
+        df = aggregator().dp_group_aggregate(group_by, metric, agg, epsilon, k, clip_lo, clip_hi, start=parse_time(start),
+                                end=parse_time(end), where=parse_where(where))
         return {"rows": df.to_dict(orient="records")}
     except Exception as e:
         return JSONResponse(status_code=400, content={"error": str(e)})
+
+def _json_floats(a) -> list:
+    # NaN (e.g. a mean over no values) → null; JSON has no NaN
+    return [None if v != v else float(v) for v in a]
+
+@app.post("/privacy/aggregate/batch")
+def privacy_aggregate_batch(req: DPBatch):
+    """
+    Several metric/agg/epsilon/clip specs over one grouping in one grouped
+    pass. Columnar response: group key columns once, then per spec its
+    values and noisy counts in the same row order.
+    """
+    try:
+        out = aggregator().dp_batch_aggregate(req.group_by, [sp.model_dump() for sp in req.specs], req.k,
+                                 start=parse_time(req.start), end=parse_time(req.end), where=req.where)
+        groups = out["groups"]
+        return {
+            "group_by": req.group_by,
+            "groups": {c: groups[c].tolist() for c in groups.columns},
+            "results": [{**{key: r[key] for key in ("name", "metric", "agg", "epsilon", "clip_lo", "clip_hi")},
+                         "values": _json_floats(r["value"]), "n_dp": _json_floats(r["n_dp"])}
+                        for r in out["results"]],
+        }
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
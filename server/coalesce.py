@@ -0,0 +1,106 @@
+"""
+Cross-request micro-batching for /ingest.
+
+Concurrent requests hand their encoded events to one IngestCoalescer. The
+first events to arrive open a batch; it is pushed to Redis when it reaches
+MAX_EVENTS or MAX_WAIT_MS after it opened, whichever comes first, as one
+variadic RPUSH (list mode) or one pipelined round-trip of XADDs (stream
+mode). Each request is acknowledged only after its batch is in Redis, so
+coalescing adds at most MAX_WAIT_MS to a request's latency plus the push
+itself. Events of one request stay in order and in the same batch.
+"""
+import asyncio
+import os
+import time
+
+from .streams import xadd_events
+
+MAX_WAIT_MS = float(os.environ.get("VISAGEUX_COALESCE_MS", "2"))
+MAX_EVENTS = int(os.environ.get("VISAGEUX_COALESCE_MAX", "1000"))
+LIST_KEY = "events"
+SIZE_BUCKETS = (1, 10, 100, 1000, 10000)   # batch-size histogram upper bounds
+
+class IngestCoalescer:
+    def __init__(self, client, mode: str = "list", max_wait_ms: float = MAX_WAIT_MS,
+                 max_events: int = MAX_EVENTS):
+        self.client, self.mode = client, mode
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_events = max_events
+        self._payloads, self._waiters = [], []
+        self._timer = None
+        self._opened = 0.0
+        self._inflight = set()
+        self.metrics = {"batches": 0, "events": 0, "requests": 0, "errors": 0,
+                        "max_batch": 0, "wait_ms_max": 0.0, "push_ms_total": 0.0,
+                        "size_hist": {str(b): 0 for b in SIZE_BUCKETS + ("inf",)}}
+
+    async def submit(self, payloads) -> int:
+        """Queue a request's encoded events; returns once they are in Redis."""
+        if not payloads:
+            return 0
+        fut = asyncio.get_running_loop().create_future()
+        if not self._payloads:
+            self._opened = time.perf_counter()
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        self._payloads.extend(payloads)
+        self._waiters.append(fut)
+        if len(self._payloads) >= self.max_events:
+            self._flush()
+        await fut
+        return len(payloads)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._payloads:
+            return
+        payloads, waiters = self._payloads, self._waiters
+        self._payloads, self._waiters = [], []
+        # the push runs concurrently with the next batch filling up
+        task = asyncio.ensure_future(self._push(payloads, waiters, time.perf_counter() - self._opened))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _push(self, payloads, waiters, waited: float):
+        t0 = time.perf_counter()
+        try:
+            if self.mode == "stream":
+                await xadd_events(self.client, payloads)
+            else:
+                await self.client.rpush(LIST_KEY, *payloads)
+        except Exception as e:
+            self.metrics["errors"] += 1
+            for w in waiters:
+                if not w.done():
+                    w.set_exception(e)
+            return
+        self._record(len(payloads), len(waiters), waited, time.perf_counter() - t0)
+        for w in waiters:
+            if not w.done():
+                w.set_result(None)
+
+    async def drain(self):
+        """Push the open batch and wait for every push in flight (at shutdown)."""
+        self._flush()
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    def _record(self, n: int, n_req: int, waited: float, pushed: float):
+        m = self.metrics
+        m["batches"] += 1; m["events"] += n; m["requests"] += n_req
+        m["max_batch"] = max(m["max_batch"], n)
+        m["wait_ms_max"] = max(m["wait_ms_max"], 1000 * waited)
+        m["push_ms_total"] += 1000 * pushed
+        bucket = next((str(b) for b in SIZE_BUCKETS if n <= b), "inf")
+        m["size_hist"][bucket] += 1
+
+    def stats(self) -> dict:
+        m = dict(self.metrics)
+        b = max(m["batches"], 1)
+        m["mean_batch"] = round(m["events"] / b, 2)
+        m["mean_requests_per_batch"] = round(m["requests"] / b, 2)
+        m["mean_push_ms"] = round(m.pop("push_ms_total") / b, 3)
+        m["max_wait_ms"] = self.max_wait * 1000
+        m["max_events"] = self.max_events
+        return m
@@ -0,0 +1,106 @@
+"""
+Queue entry codec.
+
+Legacy entries are one event each, as `Event.model_dump_json()`. With
+VISAGEUX_CODEC=msgpack (or msgpack+zstd) /ingest stores one entry per
+request instead: MAGIC, a flag byte, then the events column-packed as
+msgpack {"n": rows, "cols": {field: [values]}} with all-null fields left
+out, optionally zstd-compressed. `decode()` accepts both forms, so writers
+drain a queue holding a mix of old and new entries during rollout.
+
+    python -m server.codec --events 100000     # bytes/event and decode rate per codec
+"""
+import argparse
+import json
+import os
+import time
+
+from .events import Event
+
+CODEC = os.environ.get("VISAGEUX_CODEC", "json")
+CODECS = ("json", "msgpack", "msgpack+zstd")
+MAGIC = b"VXB1"
+FLAG_MSGPACK, FLAG_ZSTD = 0, 1
+ZSTD_LEVEL = 3
+EVENT_FIELDS = list(Event.model_fields)
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError as e:
+        raise RuntimeError("VISAGEUX_CODEC=msgpack needs the msgpack package") from e
+    return msgpack
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError("VISAGEUX_CODEC=msgpack+zstd needs the zstandard package") from e
+    return zstandard
+
+def pack_columns(events) -> dict:
+    fields = {}
+    for ev in events:
+        for k, v in ev.items():
+            if v is not None:
+                fields.setdefault(k, None)
+    return {"n": len(events), "cols": {k: [ev.get(k) for ev in events] for k in fields}}
+
+def unpack_columns(obj, fields=EVENT_FIELDS) -> list:
+    # every Event field is present, as in the JSON entries (null → None)
+    n, cols = obj["n"], dict(obj["cols"])
+    for f in fields:
+        cols.setdefault(f, [None] * n)
+    names = list(cols)
+    return [dict(zip(names, row)) for row in zip(*cols.values())]
+
+def encode_batch(events, codec: str = CODEC) -> bytes:
+    """One queue entry for a list of event dicts."""
+    if codec not in CODECS[1:]:
+        raise ValueError(f"not a batch codec: {codec}")
+    body = _msgpack().packb(pack_columns(events), use_bin_type=True)
+    if codec == "msgpack+zstd":
+        return MAGIC + bytes([FLAG_ZSTD]) + _zstd().ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return MAGIC + bytes([FLAG_MSGPACK]) + body
+
+def decode(raw) -> list:
+    """Event dicts held by one queue entry (legacy JSON or batch)."""
+    if isinstance(raw, (bytes, bytearray)) and raw[:len(MAGIC)] == MAGIC:
+        flag, body = raw[len(MAGIC)], raw[len(MAGIC) + 1:]
+        if flag == FLAG_ZSTD:
+            body = _zstd().ZstdDecompressor().decompress(body)
+        elif flag != FLAG_MSGPACK:
+            raise ValueError(f"unknown queue entry flag {flag}")
+        return unpack_columns(_msgpack().unpackb(body, raw=False))
+    return [json.loads(raw)]
+
+def measure(events, batch: int = 100) -> list:
+    """bytes/event and decode events/s for each codec on `events` (dicts)."""
+    rows = []
+    for codec in CODECS:
+        if codec == "json":
+            entries = [json.dumps(ev).encode("utf-8") for ev in events]   # as model_dump_json
+        else:
+            entries = [encode_batch(events[i:i + batch], codec) for i in range(0, len(events), batch)]
+        size = sum(len(e) for e in entries)
+        t0 = time.perf_counter()
+        n = sum(len(decode(e)) for e in entries)
+        dt = time.perf_counter() - t0
+        rows.append({"codec": codec, "entries": len(entries), "bytes_per_event": round(size / n, 1),
+                     "decode_events_per_s": round(n / dt)})
+    return rows
+
+def main():
+    from .synthetic.scale import generate
+    from .synthetic.scale import event_dicts
+    ap = argparse.ArgumentParser(description="Compare queue codecs on synthetic events")
+    ap.add_argument("--events", type=float, default=1e5)
+    ap.add_argument("--batch", type=int, default=100, help="events per ingest request")
+    args = ap.parse_args()
+    events = [Event(**rec).model_dump() for rec in event_dicts(generate(int(args.events)).head(int(args.events)))]
+    for row in measure(events, args.batch):
+        print(f"[codec] {row['codec']:<13} {row['bytes_per_event']:7.1f} B/event  "
+              f"{row['decode_events_per_s']:>10,} events/s decoded  ({row['entries']} entries)")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Literal, Union
 
 class Event(BaseModel):
     # minimal, privacy-first
@@ -11,6 +11,29 @@ class Event(BaseModel):
     y: Optional[int] = None
     el: Optional[str] = None
     dom: Optional[str] = None
-    view: Optional[Dict] = None
+    view: Optional[Dict] = None   # stored flat as view_w/h/y (schema.py)
     aff: Optional[str] = None
-    perf: Optional[Dict] = None
+    perf: Optional[Dict] = None   # known keys stored flat as perf_<key>
+
+class Window(BaseModel):
+    # one finished 5s window for online scoring (columns of windows_5s)
+    sess_key: str = Field(..., description="uid|sid|session start")
+    w_start: float = Field(..., description="epoch seconds")
+    w_end: float = Field(..., description="epoch seconds")
+    features: Dict[str, float] = Field(default_factory=dict, description="FEATURES values; missing → 0")
+
+class DPSpec(BaseModel):
+    # one statistic of a batch DP query; unset epsilon/clip → privacy DEFAULTS
+    metric: Literal["UFI", "RCS", "MIV"] = "UFI"
+    agg: Literal["mean", "sum", "count"] = "mean"
+    epsilon: Optional[float] = None
+    clip_lo: Optional[float] = None
+    clip_hi: Optional[float] = None
+
+class DPBatch(BaseModel):
+    group_by: List[str] = Field(..., description="columns to group by, e.g. sess_key, hour, day")
+    specs: List[DPSpec] = Field(..., min_length=1)
+    k: Optional[int] = None
+    start: Optional[Union[float, str]] = Field(None, description="w_start >= start (epoch seconds or ISO time)")
+    end: Optional[Union[float, str]] = Field(None, description="w_start < end (epoch seconds or ISO time)")
+    where: Dict[str, Union[float, str]] = Field(default_factory=dict, description="equality filters")
@@ -0,0 +1,210 @@
+"""
+Out-of-core training data for the drop-off GRU.
+
+`prepare()` turns windows_5s + events_sessionized into memory-mapped arrays
+under PREP_DIR, one sess_key shard at a time (workers/shards.py), so memory
+stays at one shard (plus 24 bytes per session) whatever the history length.
+Windows written in the same sharded layout are read part by part; otherwise
+they are first split by shard in one streaming pass.
+
+    X.npy         [N, F] float32   z-scored window features, sessions contiguous
+    y.npy         [N]    int8      drop label of each window
+    sessions.npy  [S, 3] int64     (first row, n windows, is_val) per session
+    meta.json                      FEATURES, z-score stats, HORIZON, N, S
+
+Sessions are assigned to train/val by a stable hash of sess_key, so no
+session contributes sequences to both. `SequenceDataset` serves batches of
+[B, L, F] sequences sliced from the memmaps on the fly; open it in
+DataLoader workers, the arrays are only mapped inside the worker.
+
+    python -m server.models.dataset
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as pds
+import torch
+from torch.utils.data import Dataset
+
+from .utils import RAW_EVENTS, WIN5, FEATURES, compute_next_event_gap, make_labels, zscore_apply
+from ..workers.shards import N_SHARDS, PART, shard_ids, shard_layout, read_shard, remove_path
+
+REPO = Path(__file__).resolve().parents[2]
+PREP_DIR = REPO / "data" / "training"
+HORIZON = 10.0
+VAL_BUCKETS = 20       # sess_key hash buckets out of 100 that go to validation
+CHUNK_SESSIONS = 100_000
+WINDOW_COLUMNS = ["sess_key", "w_start", "w_end"] + FEATURES
+
+def _windows(path: Path) -> pds.Dataset:
+    # windows_5s is a single file or a directory of parts (workers/parallel.py)
+    return pds.dataset(str(path), format="parquet")
+
+def window_stats(ds: pds.Dataset) -> dict:
+    """zscore_fit over all windows, streamed: {feature: (mean, std ddof=0)}"""
+    n = np.zeros(len(FEATURES)); mean = np.zeros(len(FEATURES)); m2 = np.zeros(len(FEATURES))
+    for b in ds.to_batches(columns=FEATURES):
+        x = np.column_stack([b.column(c).to_numpy(zero_copy_only=False).astype(float) for c in FEATURES])
+        ok = ~np.isnan(x)
+        nb = ok.sum(axis=0)
+        if not nb.any():
+            continue
+        mb = np.where(nb > 0, np.nansum(x, axis=0) / np.maximum(nb, 1), 0.0)
+        m2b = np.nansum((x - mb) ** 2, axis=0)
+        # Chan et al. pairwise merge of (n, mean, M2)
+        tot = n + nb
+        d = mb - mean
+        mean = np.where(tot > 0, mean + d * nb / np.maximum(tot, 1), mean)
+        m2 = m2 + m2b + d ** 2 * n * nb / np.maximum(tot, 1)
+        n = tot
+    std = np.sqrt(m2 / np.maximum(n, 1))
+    return {c: (float(mean[i]), float(std[i] or 1.0)) for i, c in enumerate(FEATURES)}
+
+def _shards(path: Path):
+    # shards with a part; a legacy unsharded file is one shard
+    layout = shard_layout(path)
+    return sorted(layout) if layout is not None else [None]
+
+def _bucket_windows(ds: pds.Dataset, out: Path, n_shards: int = N_SHARDS):
+    # one pass over windows not written sharded: batch i of shard s → out/part-s/i.parquet
+    if out.exists():
+        remove_path(out)
+    for i, b in enumerate(ds.to_batches(columns=WINDOW_COLUMNS)):
+        w = b.to_pandas()
+        for s, part in w.groupby(shard_ids(w["sess_key"].to_numpy(), n_shards), sort=False):
+            d = out / PART.format(s)
+            d.mkdir(parents=True, exist_ok=True)
+            part.to_parquet(d / f"{i:06d}.parquet", index=False)
+
+def _shard_windows(shard, ds: pds.Dataset, win_path: Path, buckets: Path):
+    if shard is None:
+        return ds.to_table(columns=WINDOW_COLUMNS).to_pandas()
+    if buckets is None:
+        return read_shard(win_path, shard, columns=WINDOW_COLUMNS)
+    d = buckets / PART.format(shard)
+    return pd.read_parquet(d) if d.exists() else None
+
+def prepare(out_dir: Path = PREP_DIR, win_path: Path = WIN5, ev_path: Path = RAW_EVENTS,
+            horizon_sec: float = HORIZON) -> dict:
+    ds = _windows(win_path)
+    stats = window_stats(ds)
+    cap = max(ds.count_rows(), 1)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    X = np.lib.format.open_memmap(out_dir / "X.npy", mode="w+", dtype=np.float32, shape=(cap, len(FEATURES)))
+    Y = np.lib.format.open_memmap(out_dir / "y.npy", mode="w+", dtype=np.int8, shape=(cap,))
+    sessions = []   # one int64 triple per session, written out at the end
+    row = 0
+    shards = _shards(ev_path)
+    buckets = None
+    if shards != [None] and shard_layout(win_path) is None:
+        buckets = out_dir / "_windows_by_shard"
+        _bucket_windows(ds, buckets)
+    for s in shards:
+        ev = read_shard(ev_path, s, columns=["sess_key", "ts"]) if s is not None \
+            else pd.read_parquet(ev_path, columns=["sess_key", "ts"])
+        if ev is None or ev.empty:
+            continue
+        ev["ts"] = pd.to_numeric(ev["ts"], errors="coerce")
+        ev = ev.dropna(subset=["sess_key", "ts"])
+        w = _shard_windows(s, ds, win_path, buckets)
+        if w is None:
+            continue
+        w = w[w["sess_key"].isin(ev["sess_key"].unique())]
+        for c in ["w_start", "w_end"]:
+            w[c] = pd.to_numeric(w[c], errors="coerce")
+        w = w.dropna(subset=["w_start", "w_end"]).sort_values(["sess_key", "w_start"]).reset_index(drop=True)
+        if w.empty:
+            continue
+        y = make_labels(w, compute_next_event_gap(ev, w), horizon_sec=horizon_sec)
+        X[row:row + len(w)] = zscore_apply(w, stats)
+        Y[row:row + len(w)] = y.to_numpy()
+        first = np.flatnonzero(np.r_[True, w["sess_key"].to_numpy()[1:] != w["sess_key"].to_numpy()[:-1]])
+        sizes = np.diff(np.r_[first, len(w)])
+        val = shard_ids(w["sess_key"].to_numpy()[first], 100) < VAL_BUCKETS
+        sessions.append(np.column_stack([row + first, sizes, val]).astype(np.int64))
+        row += len(w)
+    X.flush(); Y.flush()
+    del X, Y
+    if buckets is not None:
+        remove_path(buckets)
+    sessions = np.concatenate(sessions) if sessions else np.zeros((0, 3), dtype=np.int64)
+    np.save(out_dir / "sessions.npy", sessions)
+    meta = {"FEATURES": FEATURES, "stats": stats, "HORIZON": horizon_sec,
+            "n_windows": int(row), "n_sessions": int(len(sessions))}
+    (out_dir / "meta.json").write_text(json.dumps(meta))
+    print(f"[dataset] {row} windows, {len(sessions)} sessions → {out_dir}")
+    return meta
+
+def load_meta(out_dir: Path = PREP_DIR) -> dict:
+    meta = json.loads((out_dir / "meta.json").read_text())
+    meta["stats"] = {c: tuple(v) for c, v in meta["stats"].items()}
+    return meta
+
+def sequence_starts(L: int, val: bool, out_dir: Path = PREP_DIR) -> np.ndarray:
+    """
+    First row of every L-window sequence of the train (val=False) or val
+    split, written to a memmap chunk by chunk of sessions.
+    """
+    sess = np.load(out_dir / "sessions.npy", mmap_mode="r")
+    path = out_dir / f"{'val' if val else 'train'}_seq_L{L}.npy"
+    total = 0
+    for i in range(0, len(sess), CHUNK_SESSIONS):
+        s = sess[i:i + CHUNK_SESSIONS]
+        total += int(np.maximum(s[:, 1] - L + 1, 0)[s[:, 2] == int(val)].sum())
+    out = np.lib.format.open_memmap(path, mode="w+", dtype=np.int64, shape=(total,))
+    pos = 0
+    for i in range(0, len(sess), CHUNK_SESSIONS):
+        s = sess[i:i + CHUNK_SESSIONS]
+        s = s[s[:, 2] == int(val)]
+        per = np.maximum(s[:, 1] - L + 1, 0)
+        k = int(per.sum())
+        out[pos:pos + k] = np.repeat(s[:, 0] - (np.cumsum(per) - per), per) + np.arange(k)
+        pos += k
+    out.flush()
+    del out
+    return np.load(path, mmap_mode="r")
+
+def max_session_windows(out_dir: Path = PREP_DIR) -> int:
+    sess = np.load(out_dir / "sessions.npy", mmap_mode="r")
+    return int(sess[:, 1].max()) if len(sess) else 0
+
+class SequenceDataset(Dataset):
+    """
+    Index with a list of sequence numbers (use a BatchSampler and
+    batch_size=None); returns (x [B, L, F] float32, y [B] float32).
+    """
+    def __init__(self, L: int, val: bool, out_dir: Path = PREP_DIR):
+        self.L, self.val, self.out_dir = L, val, Path(out_dir)
+        self.n = len(np.load(self.out_dir / f"{'val' if val else 'train'}_seq_L{L}.npy", mmap_mode="r"))
+        self._arrays = None
+
+    def __len__(self):
+        return self.n
+
+    def _open(self):
+        # mapped lazily so DataLoader workers don't pickle the arrays
+        if self._arrays is None:
+            d = self.out_dir
+            self._arrays = (np.load(d / "X.npy", mmap_mode="r"), np.load(d / "y.npy", mmap_mode="r"),
+                            np.load(d / f"{'val' if self.val else 'train'}_seq_L{self.L}.npy", mmap_mode="r"))
+        return self._arrays
+
+    def __getstate__(self):
+        return {**self.__dict__, "_arrays": None}
+
+    def labels(self, chunk: int = 1 << 20):
+        # label of every sequence, in order, a chunk at a time
+        X, Y, starts = self._open()
+        for i in range(0, self.n, chunk):
+            yield np.asarray(Y[np.asarray(starts[i:i + chunk]) + self.L - 1])
+
+    def __getitem__(self, idx):
+        X, Y, starts = self._open()
+        s = np.sort(starts[np.asarray(idx)])
+        rows = s[:, None] + np.arange(self.L)
+        return torch.from_numpy(X[rows]), torch.from_numpy(Y[rows[:, -1]].astype(np.float32))
+
+if __name__ == "__main__":
+    prepare()
@@ -0,0 +1,186 @@
+"""
+NumPy-only runtime for the GRUDrop checkpoint.
+
+`export()` (needs torch; this module's CLI) writes the GRU/head weights, the
+z-score stats and the config of dropper_gru.pt to a small .npz, with the
+sha256 of the checkpoint in the config so a stale export can be detected
+without torch (`is_stale`). `NumpyGRU.load()` reads it back without
+importing torch, so inference workers start in milliseconds. Weights may be stored as float32, float16 or int8 (symmetric,
+one scale per output row); they are expanded to float32 at load, so the
+precision only trades file size against accuracy.
+
+Gate layout and equations follow torch.nn.GRU (r, z, n):
+
+    r = σ(W_ir x + b_ir + W_hr h + b_hr)
+    z = σ(W_iz x + b_iz + W_hz h + b_hz)
+    n = tanh(W_in x + b_in + r ⊙ (W_hn h + b_hn))
+    h' = (1 − z) ⊙ n + z ⊙ h
+
+    python -m server.models.gru_numpy [--precision int8] [--check]
+"""
+import argparse
+import hashlib
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+REPO = Path(__file__).resolve().parents[2]
+CHK = REPO / "models" / "checkpoints" / "dropper_gru.pt"
+NPZ = REPO / "models" / "checkpoints" / "dropper_gru.npz"
+PRECISIONS = ("float32", "float16", "int8")
+
+# state_dict key → npz name
+WEIGHTS = {
+    "gru.weight_ih_l0": "w_ih", "gru.weight_hh_l0": "w_hh",
+    "gru.bias_ih_l0": "b_ih", "gru.bias_hh_l0": "b_hh",
+    "head.0.weight": "w1", "head.0.bias": "b1",
+    "head.2.weight": "w2", "head.2.bias": "b2",
+}
+
+def _sigmoid(x):
+    # tanh form: no overflow for large |x|
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+def _pack(name, w, precision, out):
+    if precision == "int8" and w.ndim == 2:
+        scale = np.abs(w).max(axis=1, keepdims=True) / 127.0
+        scale[scale == 0] = 1.0
+        out[name] = np.round(w / scale).astype(np.int8)
+        out[name + "__scale"] = scale.astype(np.float32)
+    elif precision == "float16":
+        out[name] = w.astype(np.float16)
+    else:
+        out[name] = w.astype(np.float32)   # biases stay float32 under int8
+
+def checkpoint_hash(chk: Path = CHK) -> str:
+    h = hashlib.sha256()
+    with open(chk, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def export(chk: Path = CHK, out: Path = NPZ, precision: str = "float32") -> Path:
+    import torch
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision must be one of: {','.join(PRECISIONS)}")
+    ck = torch.load(chk, map_location="cpu", weights_only=False)
+    cfg, stats = ck["config"], ck["stats"]
+    feats = list(cfg["FEATURES"])
+    arrays = {
+        "config": np.frombuffer(json.dumps({**cfg, "precision": precision,
+                                            "checkpoint_sha256": checkpoint_hash(chk)}).encode("utf-8"),
+                                dtype=np.uint8),
+        "mean": np.array([stats[c][0] for c in feats], dtype=np.float32),
+        "std": np.array([stats[c][1] for c in feats], dtype=np.float32),
+    }
+    if ck.get("state_dict") is not None:
+        sd = ck["state_dict"]
+        for key, name in WEIGHTS.items():
+            _pack(name, sd[key].detach().cpu().numpy(), precision, arrays)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.name + ".tmp.npz")
+    np.savez(tmp, **arrays)
+    tmp.replace(out)
+    return out
+
+class NumpyGRU:
+    def __init__(self, arrays: dict):
+        self.config = json.loads(arrays["config"].tobytes().decode("utf-8"))
+        self.features = list(self.config["FEATURES"])
+        self.seqlen = int(self.config["SEQLEN"])
+        self.mean = arrays["mean"].astype(np.float32)
+        std = arrays["std"].astype(np.float32)
+        self.std = np.where(std != 0, std, 1.0).astype(np.float32)
+        self.prior = None
+        if "w_ih" not in arrays:
+            self.prior = float(self.config.get("baseline_prior", 0.5))
+            return
+        w = {}
+        for name in WEIGHTS.values():
+            a = arrays[name].astype(np.float32)
+            if name + "__scale" in arrays:
+                a = a * arrays[name + "__scale"]
+            w[name] = a
+        # transposed once so every step is a plain x @ W
+        self.w_ih, self.w_hh = w["w_ih"].T.copy(), w["w_hh"].T.copy()
+        self.b_ih, self.b_hh = w["b_ih"], w["b_hh"]
+        self.w1, self.b1 = w["w1"].T.copy(), w["b1"]
+        self.w2, self.b2 = w["w2"].T.copy(), w["b2"]
+        self.hidden = self.w_hh.shape[0]
+
+    @classmethod
+    def load(cls, path: Path = NPZ):
+        with np.load(path) as z:
+            return cls({k: z[k] for k in z.files})
+
+    def zscore(self, X: np.ndarray) -> np.ndarray:
+        # raw features [..., F] in self.features order → model input
+        return ((X - self.mean) / self.std).astype(np.float32)
+
+    def _cell(self, gi: np.ndarray, h: np.ndarray) -> np.ndarray:
+        H = self.hidden
+        gh = h @ self.w_hh + self.b_hh
+        r = _sigmoid(gi[:, :H] + gh[:, :H])
+        z = _sigmoid(gi[:, H:2 * H] + gh[:, H:2 * H])
+        n = np.tanh(gi[:, 2 * H:] + r * gh[:, 2 * H:])
+        return (1.0 - z) * n + z * h
+
+    def step(self, x: np.ndarray, h: np.ndarray) -> np.ndarray:
+        """One time step for a batch: x [B, F] (z-scored), h [B, H] → h' [B, H]."""
+        return self._cell(x @ self.w_ih + self.b_ih, h)
+
+    def head(self, h: np.ndarray) -> np.ndarray:
+        """Drop probability from hidden states [B, H] → [B]."""
+        a = np.maximum(h @ self.w1 + self.b1, 0.0)
+        return _sigmoid((a @ self.w2 + self.b2)[:, 0])
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """GRUDrop forward + sigmoid: X [B, L, F] (z-scored) → p [B]."""
+        B, L, _ = X.shape
+        if self.prior is not None:
+            return np.full(B, self.prior)
+        # input projections of every step in one matmul
+        gi = (X.reshape(B * L, -1) @ self.w_ih + self.b_ih).reshape(B, L, -1)
+        h = np.zeros((B, self.hidden), dtype=np.float32)
+        for t in range(L):
+            h = self._cell(gi[:, t], h)
+        return self.head(h)
+
+def is_stale(model: "NumpyGRU", chk: Path = CHK) -> bool:
+    # exported from another checkpoint than the one on disk (or before hashes were recorded)
+    return chk.exists() and model.config.get("checkpoint_sha256") != checkpoint_hash(chk)
+
+def check(npz: Path = NPZ, chk: Path = CHK, n: int = 4096, seed: int = 0) -> float:
+    # max |p_numpy − p_torch| on random inputs
+    import torch
+    from .train_dropper import GRUDrop
+    m = NumpyGRU.load(npz)
+    ck = torch.load(chk, map_location="cpu", weights_only=False)
+    X = np.random.default_rng(seed).standard_normal((n, m.seqlen, len(m.features))).astype(np.float32)
+    if ck.get("state_dict") is None:
+        ref = np.full(n, float(ck["config"].get("baseline_prior", 0.5)))
+    else:
+        model = GRUDrop(in_dim=len(m.features), hidden=int(ck["config"]["HIDDEN"]))
+        model.load_state_dict(ck["state_dict"]); model.eval()
+        with torch.no_grad():
+            ref = torch.sigmoid(model(torch.from_numpy(X))).numpy()
+    return float(np.abs(m.predict(X) - ref).max())
+
+def main():
+    ap = argparse.ArgumentParser(description="Export dropper_gru.pt for the NumPy runtime")
+    ap.add_argument("--precision", choices=PRECISIONS, default="float32")
+    ap.add_argument("--out", type=Path, default=NPZ)
+    ap.add_argument("--check", action="store_true", help="compare against the torch model")
+    args = ap.parse_args()
+    path = export(out=args.out, precision=args.precision)
+    t0 = time.perf_counter()
+    NumpyGRU.load(path)
+    print(f"[gru_numpy] {args.precision} → {path} ({path.stat().st_size / 1024:.1f} KiB, "
+          f"loads in {1000 * (time.perf_counter() - t0):.1f} ms)")
+    if args.check:
+        print(f"[gru_numpy] max |Δp| vs torch: {check(path):.2e}")
+
+if __name__ == "__main__":
+    main()
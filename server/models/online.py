@@ -0,0 +1,144 @@
+"""
+Online drop-off scoring.
+
+infer_dropper.py re-runs the GRU over every L-window sequence. Here each live
+session keeps its GRU hidden state and a new 5s window advances it by one
+GRU step, so scoring costs O(1) per window. The weights are those of the
+GRUDrop checkpoint, run by the NumPy runtime (gru_numpy.py) without torch:
+the .npz export must exist (`python -m server.models.gru_numpy`), and an
+export made from another checkpoint than dropper_gru.pt is reported.
+The state carries the whole session history rather than only the last
+SEQLEN windows; for the first SEQLEN windows of a session the result is
+identical to the batch model. `warm` marks windows with at least SEQLEN steps.
+
+Idle states are dropped after STATE_TTL seconds and the least recently used
+are evicted beyond MAX_SESSIONS. A window that does not start after the last
+one seen for its session (retry, out of order) returns the latest score
+without advancing the state.
+
+    python -m server.models.online        # replay windows_5s, report throughput
+"""
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from .gru_numpy import CHK, NPZ, NumpyGRU, is_stale
+
+MAX_SESSIONS = 100_000
+STATE_TTL = 30 * 60.0   # seconds without a window before a session state is dropped
+
+class OnlineDropper:
+    def __init__(self, npz: Path = NPZ, max_sessions: int = MAX_SESSIONS, ttl: float = STATE_TTL):
+        if not npz.exists():
+            raise FileNotFoundError(f"{npz} not found; export it with `python -m server.models.gru_numpy`")
+        self.model = NumpyGRU.load(npz)
+        if is_stale(self.model, CHK):
+            print(f"[online] warning: {npz.name} was not exported from the current {CHK.name}; "
+                  f"re-run `python -m server.models.gru_numpy`")
+        self.features, self.seqlen = self.model.features, self.model.seqlen
+        # bias-only baseline checkpoint: constant prior, no state to keep
+        self.prior = self.model.prior
+        self.max_sessions, self.ttl = max_sessions, ttl
+        self._states = OrderedDict()   # sess_key → [h, last w_start, steps, p, last seen]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._states)
+
+    def _vectors(self, rows) -> np.ndarray:
+        X = np.array([[r["features"].get(c, 0.0) for c in self.features] for r in rows], dtype=np.float32)
+        return self.model.zscore(np.nan_to_num(X))
+
+    def _step(self, h: np.ndarray, x: np.ndarray):
+        h1 = self.model.step(x, h)
+        return h1, self.model.head(h1)
+
+    def evict(self, now: float = None):
+        now = time.monotonic() if now is None else now
+        st = self._states
+        # least recently used first
+        while st and (len(st) > self.max_sessions or now - next(iter(st.values()))[4] > self.ttl):
+            st.popitem(last=False)
+
+    def end(self, sess_key: str):
+        with self._lock:
+            self._states.pop(sess_key, None)
+
+    def update(self, rows):
+        """
+        rows: dicts with sess_key, w_start, w_end, features. Returns one dict per
+        row with p_drop_next_10s. Rows of different sessions are stepped as one
+        batch; several rows of the same session are applied in w_start order.
+        """
+        out = [None] * len(rows)
+        if not rows:
+            return out
+        X = self._vectors(rows)
+        now = time.monotonic()
+        order = sorted(range(len(rows)), key=lambda i: (rows[i]["sess_key"], rows[i]["w_start"]))
+        with self._lock:
+            # wave r holds the r-th new window of each session in this call
+            waves, rank = [], {}
+            for i in order:
+                k = rows[i]["sess_key"]
+                r = rank.get(k, 0); rank[k] = r + 1
+                if r == len(waves):
+                    waves.append([])
+                waves[r].append(i)
+            for wave in waves:
+                step = []
+                for i in wave:
+                    s = self._states.get(rows[i]["sess_key"])
+                    if s is not None and rows[i]["w_start"] <= s[1]:
+                        out[i] = self._result(rows[i], s, now)
+                    else:
+                        step.append(i)
+                if not step:
+                    continue
+                if self.prior is not None:
+                    h, p = None, np.full(len(step), self.prior)
+                else:
+                    h0 = np.zeros((len(step), self.model.hidden), dtype=np.float32)
+                    for j, i in enumerate(step):
+                        s = self._states.get(rows[i]["sess_key"])
+                        if s is not None:
+                            h0[j] = s[0]
+                    h, p = self._step(h0, X[step])
+                for j, i in enumerate(step):
+                    k = rows[i]["sess_key"]
+                    s = self._states.get(k)
+                    steps = (s[2] if s is not None else 0) + 1
+                    s = [None if h is None else h[j], rows[i]["w_start"], steps, float(p[j]), now]
+                    self._states[k] = s
+                    out[i] = self._result(rows[i], s, now)
+            self.evict(now)
+        return out
+
+    def _result(self, row, s, now):
+        s[4] = now
+        self._states.move_to_end(row["sess_key"])
+        return {"sess_key": row["sess_key"], "w_start": row["w_start"], "w_end": row["w_end"],
+                "p_drop_next_10s": s[3], "steps": s[2], "warm": s[2] >= self.seqlen}
+
+def replay(batch: int = 512):
+    # feed windows_5s in time order, as a live deployment would see them
+    import pandas as pd
+    from .utils import WIN5
+    w = pd.read_parquet(WIN5).sort_values(["w_start", "sess_key"], kind="mergesort")
+    scorer = OnlineDropper()
+    feats = w[scorer.features].to_numpy(dtype=float)
+    rows = [{"sess_key": k, "w_start": float(a), "w_end": float(b), "features": dict(zip(scorer.features, f))}
+            for k, a, b, f in zip(w["sess_key"], w["w_start"], w["w_end"], feats)]
+    t0 = time.perf_counter()
+    out = []
+    for i in range(0, len(rows), batch):
+        out += scorer.update(rows[i:i + batch])
+    dt = time.perf_counter() - t0
+    print(f"[online] {len(rows)} windows in {dt:.2f}s ({len(rows) / max(dt, 1e-9):.0f}/s), {len(scorer)} live states")
+    return pd.DataFrame(out)
+
+if __name__ == "__main__":
+    replay()
@@ -1,7 +1,9 @@
 from pathlib import Path
 import numpy as np
 import pandas as pd
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
+from ..workers.rawstore import time_filters
+from ..workers.feature_primitives import count_before
 
 REPO = Path(__file__).resolve().parents[2]
 RAW_EVENTS = REPO / "data" / "features" / "events_sessionized.parquet"
@@ -21,32 +23,32 @@ FEATURES = [
     "moves",
 ]
 
-def load_sources() -> Tuple[pd.DataFrame, pd.DataFrame]:
-    ev = pd.read_parquet(RAW_EVENTS).copy()
+def load_sources(start: Optional[float] = None, end: Optional[float] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    # start/end (epoch s) are pushed into the parquet reader → row groups outside are skipped
+    ev = pd.read_parquet(RAW_EVENTS, filters=time_filters("ts", start, end))
     ev["ts"] = pd.to_numeric(ev["ts"], errors="coerce")
     ev = ev.dropna(subset=["ts"]).sort_values(["sess_key","ts"]).reset_index(drop=True)
 
-    w = pd.read_parquet(WIN5).copy()
+    w = pd.read_parquet(WIN5, filters=time_filters("w_start", start, end))
     for c in ["w_start","w_end"]:
         w[c] = pd.to_numeric(w[c], errors="coerce")
     w = w.dropna(subset=["w_start","w_end"]).sort_values(["sess_key","w_start"]).reset_index(drop=True)
     return ev, w
 
 def compute_next_event_gap(ev: pd.DataFrame, w: pd.DataFrame) -> pd.Series:
-    # map for quick lookup per sess
-    gaps = []
-    by_sess = {k: g["ts"].to_numpy() for k,g in ev.groupby("sess_key", sort=False)}
-    for sess_key, wstart, wend in w[["sess_key","w_start","w_end"]].itertuples(index=False):
-        ts = by_sess.get(sess_key)
-        if ts is None or ts.size == 0:
-            gaps.append(np.inf)
-            continue
-        # next raw event strictly AFTER w_end
-        nxt = ts[ts > wend]
-        if nxt.size == 0:
-            gaps.append(np.inf)
-        else:
-            gaps.append(float(nxt[0] - wend))
+    # seconds from w_end to the next raw event strictly after it (inf if none);
+    # one lexsort over events + windows instead of a scan per window
+    codes, _ = pd.factorize(pd.concat([ev["sess_key"], w["sess_key"]], ignore_index=True))
+    e_grp, q_grp = codes[:len(ev)], codes[len(ev):]
+    e_t = ev["ts"].to_numpy(dtype=float)
+    keep = e_grp >= 0
+    order = np.lexsort((e_t[keep], e_grp[keep]))
+    e_grp, e_t = e_grp[keep][order], e_t[keep][order]
+    wend = w["w_end"].to_numpy(dtype=float)
+    nxt = np.searchsorted(e_grp, q_grp, side="left") + count_before(e_grp, e_t, q_grp, wend, inclusive=True)
+    has = (q_grp >= 0) & (nxt < np.searchsorted(e_grp, q_grp, side="right"))
+    gaps = np.full(len(w), np.inf)
+    gaps[has] = e_t[nxt[has]] - wend[has]
     return pd.Series(gaps, index=w.index, dtype=float)
 
 def make_labels(w: pd.DataFrame, gaps: pd.Series, horizon_sec: float = 10.0) -> pd.Series:
@@ -72,16 +74,24 @@ def zscore_apply(X: pd.DataFrame, stats: Dict[str, Tuple[float,float]]) -> np.nd
 def build_sequences(w: pd.DataFrame, y: pd.Series, L: int = 6) -> Tuple[np.ndarray, np.ndarray]:
     """
     Returns:
-      X_seq: [N, L, F]
-      y_seq: [N] label for the LAST window in each sequence
+      idx_seq: [N, L] row indices of each sliding sequence (gather with X[idx_seq])
+      y_seq:   [N] label for the LAST window in each sequence
+    Sessions in order of first appearance, windows in row order. Only indices
+    are built; take feature batches with `sequence_batches` instead of
+    stacking all N×L×F values.
     """
-    rows = []
-    labels = []
-    for sk, g in w.reset_index().groupby("sess_key", sort=False):
-        idxs = g["index"].to_numpy()
-        # sliding window indices
-        for i in range(len(idxs) - L + 1):
-            win = idxs[i:i+L]
-            rows.append(win)
-            labels.append(int(y.iloc[win[-1]]))
-    return np.array(rows, dtype=int), np.array(labels, dtype=int)
+    codes, _ = pd.factorize(w["sess_key"])
+    rows = np.flatnonzero(codes >= 0)
+    rows = rows[np.argsort(codes[rows], kind="stable")]
+    sizes = np.bincount(codes[rows], minlength=codes.max() + 1 if len(rows) else 0)
+    starts = np.cumsum(sizes) - sizes
+    per = np.maximum(sizes - L + 1, 0)
+    first = np.repeat(starts - (np.cumsum(per) - per), per) + np.arange(per.sum())
+    idx_seq = w.index.to_numpy()[rows[first[:, None] + np.arange(L)]].astype(int)
+    y_seq = y.to_numpy()[idx_seq[:, -1]].astype(int) if len(idx_seq) else np.zeros(0, dtype=int)
+    return idx_seq, y_seq
+
+def sequence_batches(X: np.ndarray, idx_seq: np.ndarray, batch_size: int):
+    # [B, L, F] slices gathered on demand; peak memory is one batch, not N×L×F
+    for i in range(0, len(idx_seq), batch_size):
+        yield X[idx_seq[i:i + batch_size]]
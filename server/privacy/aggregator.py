@@ -1,42 +1,275 @@
 from __future__ import annotations
+import threading
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
 from pathlib import Path
-from .dp import dp_count, dp_mean, dp_sum, suppress_small_cells
+from .config import DEFAULTS, AGGS
+from .dp import dp_counts, dp_sums, dp_means
+from ..workers.shards import dataset_version
+from ..workers.cube import (CUBE_DIR, GROUPINGS, TIME_BUCKETS, cube_path, cube_version, clip_stats,
+                            group_column)
 
 REPO = Path(__file__).resolve().parents[2]
 METRICS_5S = REPO / "data" / "metrics" / "metrics_5s.parquet"
 
-DEFAULTS = {
-    "epsilon": 1.0,    # tune in dashboard
-    "clip_lo": 0.0,
-    "clip_hi": 1.0,
-    "k": 5
-}
+STATS_CACHE_SIZE = 64
 
-def load_metrics() -> pd.DataFrame:
-    return pd.read_parquet(METRICS_5S).copy()
+def pushdown_filter(schema: pa.Schema, start: float = None, end: float = None, where: dict = None):
+    """
+    A dataset filter for w_start in [start, end) and column == value for each
+    `where` item, or None. Values are cast to the column type; "hour"/"day"
+    (bucket starts) become w_start ranges.
+    """
+    names = set(schema.names)
+    terms = []
+    if start is not None:
+        terms.append(ds.field("w_start") >= float(start))
+    if end is not None:
+        terms.append(ds.field("w_start") < float(end))
+    for col, value in (where or {}).items():
+        if col not in names and col in TIME_BUCKETS:
+            size = TIME_BUCKETS[col]
+            lo = float(value)
+            if lo % size:
+                raise ValueError(f"{col} must be a multiple of {size:g} seconds")
+            terms += [ds.field("w_start") >= lo, ds.field("w_start") < lo + size]
+            continue
+        if col not in names:
+            raise ValueError(f"unknown filter column: {col}")
+        try:
+            v = pa.scalar(value).cast(schema.field(col).type)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            raise ValueError(f"bad value for {col}: {value!r}")
+        terms.append(ds.field(col) == v)
+    expr = None
+    for t in terms:
+        expr = t if expr is None else expr & t
+    return expr
 
-def dp_group_aggregate(group_by, metric: str, agg: str, epsilon: float, k: int, clip_lo: float, clip_hi: float):
-    df = load_metrics()
+class MetricsCache:
+    """
+    Process-wide copy of the metrics table (an Arrow table), keyed on the file
+    (or dataset directory) version. A changed version is loaded off to the side
+    and swapped in with a single reference assignment, so concurrent requests
+    always see a complete table; the grouped-statistics memo is cleared with
+    the swap. Queries never touch parquet: their filters (pushdown_filter) run
+    on the in-memory table, projected to the columns they need.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._snap = (None, None)   # (version, pa.Table)
+        self._stats = OrderedDict()
+        self.loads = 0
+
+    def get(self):
+        """(version, table) of the current metrics; the table is shared and immutable."""
+        version = dataset_version(self.path)
+        snap = self._snap
+        if snap[0] == version:
+            return snap
+        with self._lock:
+            if self._snap[0] != version:
+                table = ds.dataset(self.path, format="parquet").to_table()
+                self._snap = (version, table)
+                self._stats.clear()
+                self.loads += 1
+            return self._snap
+
+    def scan(self, columns, start: float = None, end: float = None, where: dict = None,
+             snap=None) -> pd.DataFrame:
+        """`columns` of the rows matching the filters; time buckets are read as w_start."""
+        table = (snap or self.get())[1]
+        names = set(table.schema.names)
+        read = []
+        for c in columns:
+            c = "w_start" if c not in names and c in TIME_BUCKETS else c
+            if c not in names:
+                raise ValueError(f"unknown column: {c}")
+            if c not in read:
+                read.append(c)
+        flt = pushdown_filter(table.schema, start, end, where)
+        return ds.dataset(table).to_table(columns=read, filter=flt).to_pandas()
+
+    def batch_stats(self, group_by, clips, start: float = None, end: float = None,
+                    where: dict = None) -> pd.DataFrame:
+        """
+        Per group: rows (for k-anonymity) and, for the i-th (metric, clip_lo,
+        clip_hi) of `clips`, n{i} (non-null values) and sum{i} (clipped sum).
+        One filtered pass over the snapshot and one groupby for all of them,
+        memoized until the snapshot is swapped.
+        """
+        snap = self.get()
+        version = snap[0]
+        clips = tuple((m, float(lo), float(hi)) for m, lo, hi in clips)
+        where = dict(where or {})
+        key = (version, tuple(group_by), clips, start, end, tuple(sorted(where.items())))
+        hit = self._stats.get(key)
+        if hit is not None:
+            return hit
+        df = self.scan(list(group_by) + [m for m, _, _ in clips], start, end, where, snap=snap)
+        vals = pd.DataFrame({i: df[m].clip(lower=lo, upper=hi) for i, (m, lo, hi) in enumerate(clips)},
+                            index=df.index)
+        g = vals.groupby([group_column(df, c) for c in group_by], sort=False)
+        n, sums = g.count(), g.sum()
+        stats = pd.DataFrame({"rows": g.size()})
+        for i in range(len(clips)):
+            stats[f"n{i}"], stats[f"sum{i}"] = n[i], sums[i]
+        with self._lock:
+            if self._snap[0] != version:
+                return stats   # swapped meanwhile: don't memoize the old version
+            self._stats[key] = stats
+            while len(self._stats) > STATS_CACHE_SIZE:
+                self._stats.popitem(last=False)
+        return stats
+
+    def group_stats(self, group_by, metric: str, clip_lo: float, clip_hi: float,
+                    start: float = None, end: float = None, where: dict = None) -> pd.DataFrame:
+        """Per group: rows, n (non-null metric values) and the clipped sum."""
+        stats = self.batch_stats(group_by, [(metric, clip_lo, clip_hi)], start, end, where)
+        return stats.rename(columns={"n0": "n", "sum0": "sum"})
+
+class CubeCache:
+    """
+    Rollup cube files (workers/cube.py) kept in memory per grouping. A cube is
+    used only if it was built from the current metrics version, covers the
+    requested grouping and the clip bounds fall on its bucket edges. A w_start
+    range is answered only by time-bucket groupings whose buckets it does not
+    split.
+    """
+    def __init__(self, cube_dir: Path = CUBE_DIR):
+        self.cube_dir = cube_dir
+        self._lock = threading.Lock()
+        self._frames = {}   # grouping → (file version, metrics version, DataFrame)
+
+    def _load(self, cols):
+        path = cube_path(cols, self.cube_dir)
+        try:
+            fv = dataset_version(path)
+        except FileNotFoundError:
+            return None
+        hit = self._frames.get(cols)
+        if hit is None or hit[0] != fv:
+            with self._lock:
+                hit = (fv, cube_version(path), pd.read_parquet(path))
+                self._frames[cols] = hit
+        return hit
+
+    def batch_stats(self, group_by, clips, metrics_version, start: float = None, end: float = None):
+        # MetricsCache.batch_stats layout, or None unless the cube answers every clip
+        if len(set(group_by)) != len(group_by):
+            return None
+        bounded = start is not None or end is not None
+        if bounded:
+            if not all(c in TIME_BUCKETS for c in group_by):
+                return None
+            size = min(TIME_BUCKETS[c] for c in group_by)
+            if any(t is not None and float(t) % size for t in (start, end)):
+                return None
+        cols = next((g for g in GROUPINGS if set(g) == set(group_by)), None)
+        hit = self._load(cols) if cols else None
+        if hit is None or hit[1] != tuple(metrics_version):
+            return None
+        cube = hit[2]
+        if bounded:
+            # a cube row is one finest bucket; aligned bounds never split it
+            t = cube[min(group_by, key=TIME_BUCKETS.get)]
+            cube = cube[(t >= (start if start is not None else -np.inf))
+                        & (t < (end if end is not None else np.inf))]
+        out = {"rows": cube["rows"].to_numpy()}
+        for i, (metric, clip_lo, clip_hi) in enumerate(clips):
+            cs = clip_stats(cube, metric, clip_lo, clip_hi)
+            if cs is None:
+                return None
+            out[f"n{i}"], out[f"sum{i}"] = cs
+        idx = pd.MultiIndex.from_frame(cube[group_by]) if len(group_by) > 1 else pd.Index(cube[group_by[0]])
+        return pd.DataFrame(out, index=idx)
+
+    def group_stats(self, group_by, metric: str, clip_lo: float, clip_hi: float, metrics_version,
+                    start: float = None, end: float = None):
+        stats = self.batch_stats(group_by, [(metric, clip_lo, clip_hi)], metrics_version, start, end)
+        return None if stats is None else stats.rename(columns={"n0": "n", "sum0": "sum"})
+
+CACHE = MetricsCache(METRICS_5S)
+CUBES = CubeCache(CUBE_DIR)
+
+def _release(agg: str, n: np.ndarray, s: np.ndarray, epsilon: float, clip_lo: float, clip_hi: float):
+    # (noisy aggregate, noisy count) per group, one vectorized draw each
+    if agg == "mean":
+        val = dp_means(s, n, epsilon=epsilon, clip_lo=clip_lo, clip_hi=clip_hi)
+    elif agg == "sum":
+        val = dp_sums(s, epsilon=epsilon, clip_lo=clip_lo, clip_hi=clip_hi)
+    else:
+        val = dp_counts(n, epsilon=epsilon)
+    return val, dp_counts(n, epsilon=epsilon)
+
+def dp_group_aggregate(group_by, metric: str, agg: str, epsilon: float, k: int, clip_lo: float, clip_hi: float,
+                       cache: MetricsCache = None, cubes: CubeCache = None,
+                       start: float = None, end: float = None, where: dict = None):
+    # cache/cubes default to the process-wide METRICS_5S ones;
+    # start/end bound w_start, where = {column: value} equality filters
+    if agg not in AGGS:
+        raise ValueError("agg must be one of: mean,sum,count")
+    cache = cache or CACHE
+    cubes = cubes or CUBES
+    group_by = list(group_by)
+    # cube first (O(groups)), raw rows when it can't answer exactly
+    stats = None
+    if not where:
+        stats = cubes.group_stats(group_by, metric, clip_lo, clip_hi, dataset_version(cache.path), start, end)
+    if stats is None:
+        stats = cache.group_stats(group_by, metric, clip_lo, clip_hi, start, end, where)
     # enforce k-anon first
-    df2 = suppress_small_cells(df, group_by, k=k)
-    if df2.empty:
+    stats = stats[stats["rows"].to_numpy() >= k]
+    if stats.empty:
         return pd.DataFrame(columns=group_by + [f"{agg}_{metric}_dp", "n_dp"])
 
-    out_rows = []
-    for keys, g in df2.groupby(group_by, sort=False):
-        s = g[metric].dropna()
-        n = len(s)
-        if agg == "mean":
-            val = dp_mean(s, epsilon=epsilon, clip_lo=clip_lo, clip_hi=clip_hi)
-        elif agg == "sum":
-            val = dp_sum(s, epsilon=epsilon, clip_lo=clip_lo, clip_hi=clip_hi)
-        elif agg == "count":
-            val = dp_count(n, epsilon=epsilon)
-        else:
+    n = stats["n"].to_numpy(dtype=float)
+    s = stats["sum"].to_numpy(dtype=float)
+    val, n_dp = _release(agg, n, s, epsilon, clip_lo, clip_hi)
+    out = stats.index.to_frame(index=False)
+    out.columns = group_by
+    out[f"{agg}_{metric}_dp"] = val
+    out["n_dp"] = n_dp
+    return out
+
+def dp_batch_aggregate(group_by, specs, k: int = None, cache: MetricsCache = None, cubes: CubeCache = None,
+                       start: float = None, end: float = None, where: dict = None) -> dict:
+    """
+    Several {metric, agg, epsilon, clip_lo, clip_hi} specs (missing → DEFAULTS)
+    over one grouping: one grouped pass for all of them (the cube when it
+    answers every spec), one k-anonymity mask and one noise draw per spec.
+    Returns {"groups": DataFrame of group keys, "results": [spec + name,
+    value and n_dp arrays aligned with groups]}.
+    """
+    k = DEFAULTS["k"] if k is None else k
+    cache = cache or CACHE
+    cubes = cubes or CUBES
+    group_by = list(group_by)
+    keys = ("epsilon", "clip_lo", "clip_hi")
+    specs = [{"metric": sp["metric"], "agg": sp.get("agg", "mean"),
+              **{key: float(DEFAULTS[key] if sp.get(key) is None else sp[key]) for key in keys}} for sp in specs]
+    if not specs:
+        raise ValueError("no specs")
+    for sp in specs:
+        if sp["agg"] not in AGGS:
             raise ValueError("agg must be one of: mean,sum,count")
-        rec = dict(zip(group_by, keys if isinstance(keys, tuple) else (keys,)))
-        rec[f"{agg}_{metric}_dp"] = val
-        rec["n_dp"] = dp_count(n, epsilon=epsilon)
-        out_rows.append(rec)
-    return pd.DataFrame(out_rows)
+    clips = list(dict.fromkeys((sp["metric"], sp["clip_lo"], sp["clip_hi"]) for sp in specs))
+    stats = None
+    if not where:
+        stats = cubes.batch_stats(group_by, clips, dataset_version(cache.path), start, end)
+    if stats is None:
+        stats = cache.batch_stats(group_by, clips, start, end, where)
+    stats = stats[stats["rows"].to_numpy() >= k]
+    groups = stats.index.to_frame(index=False)
+    groups.columns = group_by
+    results = []
+    for sp in specs:
+        i = clips.index((sp["metric"], sp["clip_lo"], sp["clip_hi"]))
+        val, n_dp = _release(sp["agg"], stats[f"n{i}"].to_numpy(dtype=float), stats[f"sum{i}"].to_numpy(dtype=float),
+                             sp["epsilon"], sp["clip_lo"], sp["clip_hi"])
+        results.append({**sp, "name": f"{sp['agg']}_{sp['metric']}_dp", "value": val, "n_dp": n_dp})
+    return {"groups": groups, "results": results}
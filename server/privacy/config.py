@@ -0,0 +1,13 @@
+"""
+DP query defaults. Kept free of pandas/numpy so the API can build its
+/privacy routes without importing the analytics stack (aggregator.py).
+"""
+
+DEFAULTS = {
+    "epsilon": 1.0,    # tune in dashboard
+    "clip_lo": 0.0,
+    "clip_hi": 1.0,
+    "k": 5
+}
+
+AGGS = ("mean", "sum", "count")
@@ -29,7 +29,24 @@ def dp_mean(s: pd.Series, epsilon: float, clip_lo: float, clip_hi: float) -> flo
     return float(s.mean() + np.random.laplace(0.0, b))
 
 def suppress_small_cells(df: pd.DataFrame, group_cols, k: int) -> pd.DataFrame:
-    sizes = df.groupby(group_cols).size().rename("n")
-    keep_idx = sizes[sizes >= k].index
-    mask = df.set_index(group_cols).index.isin(keep_idx)
-    return df.loc[mask].copy()
+    # group size broadcast back to rows; rows with a missing key are dropped as before
+    sizes = df.groupby(group_cols)[group_cols[0]].transform("size")
+    return df.loc[sizes.to_numpy() >= k].copy()
+
+# ---- vectorized forms: one Laplace draw per group from grouped sufficient stats ----
+
+def dp_counts(n: np.ndarray, epsilon: float) -> np.ndarray:
+    b = 1.0 / max(epsilon, 1e-6)
+    return n + laplace_noise(b, size=len(n))
+
+def dp_sums(clipped_sum: np.ndarray, epsilon: float, clip_lo: float, clip_hi: float) -> np.ndarray:
+    b = (clip_hi - clip_lo) / max(epsilon, 1e-6)
+    return clipped_sum + laplace_noise(b, size=len(clipped_sum))
+
+def dp_means(clipped_sum: np.ndarray, n: np.ndarray, epsilon: float, clip_lo: float, clip_hi: float) -> np.ndarray:
+    # per-group sensitivity (clip_hi-clip_lo)/n, as dp_mean; empty groups stay NaN
+    n1 = np.maximum(n, 1)
+    b = (clip_hi - clip_lo) / n1 / max(epsilon, 1e-6)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(n > 0, clipped_sum / n1, np.nan)
+    return mean + laplace_noise(b, size=len(n))
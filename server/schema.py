@@ -0,0 +1,98 @@
+"""
+Canonical columnar schema of stored events (version 2).
+
+/ingest accepts `view` and `perf` as free-form objects. The store does not keep
+them nested: the documented `view` keys (w, h, y) and the known `perf` keys
+become float32 columns `view_<key>` / `perf_<key>` (null when absent). `ev` and
+`el` are dictionary-encoded. Every raw file written by rawstore.py or
+arrow_writer.py carries SCHEMA_VERSION in its metadata; older files are
+conformed when read and rewritten by workers/migrate_schema.py.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+SCHEMA_VERSION = 2
+SCHEMA_KEY = b"visageux.schema"
+VIEW_KEYS = ("w", "h", "y")
+PERF_KEYS = ("ttfb", "fcp", "lcp", "cls", "inp")   # web-vitals the client reports
+NESTED = {"view": VIEW_KEYS, "perf": PERF_KEYS}
+
+_DICT = pa.dictionary(pa.int32(), pa.string())
+EVENT_SCHEMA = pa.schema(
+    [("sid", pa.string()), ("uid", pa.string()), ("ts", pa.float64()), ("ev", _DICT),
+     ("x", pa.float32()), ("y", pa.float32()), ("el", _DICT), ("dom", pa.string()), ("aff", pa.string())]
+    + [(f"{n}_{k}", pa.float32()) for n, keys in NESTED.items() for k in keys],
+    metadata={SCHEMA_KEY: str(SCHEMA_VERSION).encode()},
+)
+EVENT_COLUMNS = EVENT_SCHEMA.names
+
+def schema_version(schema: pa.Schema) -> int:
+    # files written before the schema was versioned count as version 1
+    return int((schema.metadata or {}).get(SCHEMA_KEY, b"1"))
+
+def _cast(col, typ):
+    if col.type == typ:
+        return col
+    if pa.types.is_null(col.type) or col.null_count == len(col):
+        # all-null columns of any type (e.g. float64 from an all-NaN pandas column)
+        return pa.nulls(len(col), typ)
+    if pa.types.is_dictionary(col.type):
+        col = col.cast(col.type.value_type)
+    return col.cast(typ, safe=False)
+
+def _child(col, key: str, n: int):
+    # view.y from a struct column; anything else (null, string) → all null
+    if col is not None and pa.types.is_struct(col.type) and col.type.get_field_index(key) >= 0:
+        return pc.struct_field(col, key)
+    return pa.nulls(n)
+
+def conform(table: pa.Table) -> pa.Table:
+    """`table` in EVENT_SCHEMA: nested view/perf flattened, missing columns null, extras dropped."""
+    n, cols = table.num_rows, []
+    for f in EVENT_SCHEMA:
+        if f.name in table.column_names:
+            col = table.column(f.name)
+        else:
+            nested, _, key = f.name.partition("_")
+            src = table.column(nested) if nested in NESTED and nested in table.column_names else None
+            col = _child(src, key, n)
+        cols.append(_cast(col, f.type))
+    return pa.Table.from_arrays(cols, schema=EVENT_SCHEMA)
+
+def _num(v, key):
+    v = v.get(key) if isinstance(v, dict) else None
+    try:
+        return float(v) if v is not None else math.nan
+    except (TypeError, ValueError):
+        return math.nan
+
+def flat_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The canonical columns on a pandas frame (other columns are kept). Dict
+    `view`/`perf` columns, as built from /ingest payloads, are expanded and
+    dropped; rows that already have the flat value keep it.
+    """
+    out = df.copy(deep=False)
+    for nested, keys in NESTED.items():
+        if nested not in out:
+            continue
+        col = out.pop(nested)
+        if not col.notna().any():
+            continue
+        for k in keys:
+            vals = pd.Series([_num(v, k) for v in col], index=out.index, dtype=np.float32)
+            name = f"{nested}_{k}"
+            out[name] = out[name].astype(np.float32).fillna(vals) if name in out else vals
+    for f in EVENT_SCHEMA:
+        if f.name not in out:
+            out[f.name] = np.float32(np.nan) if pa.types.is_floating(f.type) else None
+    return out
+
+def from_frame(df: pd.DataFrame) -> pa.Table:
+    """A pandas frame of events (flat or with dict view/perf) as an EVENT_SCHEMA table."""
+    flat = flat_frame(df)[EVENT_COLUMNS]
+    return conform(pa.Table.from_pandas(flat, preserve_index=False))
@@ -0,0 +1,30 @@
+"""
+Redis Streams queue shared by /ingest and the stream writers.
+
+Each event is one stream entry {FIELD: <event json>}. Writers read through a
+consumer group, so any number of writer processes can share the stream; an
+entry stays pending until its writer has flushed it to parquet and XACKed it.
+"""
+import os
+
+# "list" (legacy RPUSH/BLPOP on 'events') or "stream"
+QUEUE_MODE = os.environ.get("VISAGEUX_QUEUE", "list")
+
+STREAM_KEY = "events:stream"
+GROUP = "writers"
+FIELD = b"e"
+
+def ensure_group(r, stream: str = STREAM_KEY, group: str = GROUP):
+    # create the group (and the stream) once; BUSYGROUP means it already exists
+    try:
+        r.xgroup_create(stream, group, id="0", mkstream=True)
+    except Exception as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+def xadd_events(r, payloads, stream: str = STREAM_KEY):
+    # one pipelined round-trip per batch
+    pipe = r.pipeline(transaction=False)
+    for p in payloads:
+        pipe.xadd(stream, {FIELD: p})
+    return pipe.execute()
@@ -0,0 +1,184 @@
+"""
+Asyncio load generator for /ingest.
+
+Events come from the seeded personas (scale.py) or are replayed from the raw
+event store at N× real time. They are cut into batches and JSON-encoded
+before the clock starts. Every batch has a scheduled send time: a fixed
+rate (--rate events/s), the replay timeline (--speed), or as fast as
+possible. --concurrency workers take the next batch, wait for its slot and
+POST it. In paced runs (--rate/--speed) latency is measured per request from
+its scheduled time, so a server that falls behind shows up in the tail
+rather than slowing the generator down (no coordinated omission).
+Unthrottled runs have no schedule, so latency is measured from the send; the
+report's "latency_from" says which. A side task samples the Redis queue
+depth once per second.
+
+    python -m server.synthetic.loadgen --events 200000 --batch 100 --concurrency 32 --rate 20000
+    python -m server.synthetic.loadgen --source raw --start 2025-06-01 --end 2025-06-02 --speed 60
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+import pandas as pd
+
+from .scale import iter_events, event_dicts
+from ..streams import QUEUE_MODE, STREAM_KEY
+from ..workers.rawstore import list_files, read_files, parse_time
+
+URL = "http://127.0.0.1:8123/ingest"
+REDIS_URL = "redis://localhost:6379/0"
+LIST_KEY = "events"
+QUEUE_SAMPLE_EVERY = 1.0
+MAX_IDLE = 60.0     # replay: recorded gaps longer than this (s) are cut to it
+
+def persona_events(n_events: int, seed: int) -> pd.DataFrame:
+    parts, total = [], 0
+    for df in iter_events(n_events, seed=seed):
+        parts.append(df); total += len(df)
+        if total >= n_events:
+            break
+    df = pd.concat(parts, ignore_index=True).sort_values("ts", kind="mergesort")
+    return df.head(n_events).reset_index(drop=True)
+
+def raw_events(start=None, end=None, limit=None) -> pd.DataFrame:
+    df = read_files(list_files(start, end), start, end)
+    df["ts"] = pd.to_numeric(df["ts"], errors="coerce")
+    df = df.dropna(subset=["ts"]).sort_values("ts", kind="mergesort").reset_index(drop=True)
+    return df.head(limit) if limit else df
+
+def make_batches(df: pd.DataFrame, batch: int, rate: float = None, speed: float = None,
+                 max_idle: float = MAX_IDLE):
+    """[(scheduled offset s, n events, body bytes)], encoded up front."""
+    recs = list(event_dicts(df))
+    # recorded timeline with idle stretches (nights, archive gaps) shortened
+    gaps = np.minimum(np.diff(df["ts"].to_numpy(dtype=float), prepend=df["ts"].iloc[0] if len(df) else 0.0), max_idle)
+    timeline = np.cumsum(gaps)
+    out = []
+    for i in range(0, len(recs), batch):
+        if speed:
+            due = timeline[i] / speed
+        elif rate:
+            due = i / rate
+        else:
+            due = 0.0
+        out.append((due, len(recs[i:i + batch]), json.dumps(recs[i:i + batch]).encode("utf-8")))
+    return out
+
+async def _queue_depth(url: str, samples: list, t0: float, stop: asyncio.Event):
+    try:
+        import redis.asyncio as aioredis
+        r = aioredis.from_url(url)
+        while not stop.is_set():
+            depth = await (r.xlen(STREAM_KEY) if QUEUE_MODE == "stream" else r.llen(LIST_KEY))
+            samples.append((round(time.perf_counter() - t0, 2), int(depth)))
+            try:
+                await asyncio.wait_for(stop.wait(), QUEUE_SAMPLE_EVERY)
+            except asyncio.TimeoutError:
+                pass
+        await r.aclose()
+    except Exception as e:
+        print(f"[loadgen] queue depth unavailable: {e}")
+
+async def _drive(url, batches, concurrency, timeout, redis_url, paced: bool = True):
+    lat, lag, status = [], [], {}
+    sent = [0]
+    it = iter(batches)
+    stop = asyncio.Event()
+    depth = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout,
+                                 headers={"Content-Type": "application/json"}) as client:
+        t0 = time.perf_counter()
+        sampler = asyncio.create_task(_queue_depth(redis_url, depth, t0, stop))
+
+        async def worker():
+            for due, n, body in it:
+                wait = t0 + due - time.perf_counter()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                start = time.perf_counter()
+                ref = t0 + due if paced else start
+                if paced:
+                    lag.append(start - ref)
+                try:
+                    resp = await client.post(url, content=body)
+                    key = str(resp.status_code)
+                except httpx.HTTPError as e:
+                    key = type(e).__name__
+                lat.append(time.perf_counter() - ref)
+                status[key] = status.get(key, 0) + 1
+                if key == "200":
+                    sent[0] += n
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        await sampler
+    return elapsed, np.array(lat), np.array(lag), status, sent[0], depth
+
+def run(df: pd.DataFrame, url: str = URL, batch: int = 100, concurrency: int = 16, rate: float = None,
+        speed: float = None, timeout: float = 10.0, redis_url: str = REDIS_URL, max_idle: float = MAX_IDLE) -> dict:
+    batches = make_batches(df, batch, rate, speed, max_idle)
+    print(f"[loadgen] {len(df)} events in {len(batches)} batches → {url}")
+    paced = bool(rate or speed)
+    elapsed, lat, lag, status, ok_events, depth = asyncio.run(
+        _drive(url, batches, concurrency, timeout, redis_url, paced))
+    n_req = len(lat)
+    pct = lambda a, q: round(1000 * float(np.percentile(a, q)), 2) if len(a) else None
+    report = {
+        "config": {"events": int(len(df)), "batch": batch, "concurrency": concurrency,
+                   "rate": rate, "speed": speed, "url": url, "queue_mode": QUEUE_MODE},
+        "elapsed_s": round(elapsed, 3),
+        "requests": n_req,
+        "events_per_s": round(ok_events / elapsed, 1) if elapsed else None,
+        "requests_per_s": round(n_req / elapsed, 1) if elapsed else None,
+        # paced: from the scheduled send time (includes queueing behind a slow server); unthrottled: from the send
+        "latency_from": "scheduled" if paced else "send",
+        "latency_ms": {"p50": pct(lat, 50), "p95": pct(lat, 95), "p99": pct(lat, 99), "max": pct(lat, 100)},
+        "schedule_lag_ms_p99": pct(lag, 99),
+        "status": status,
+        "error_rate": round(1 - status.get("200", 0) / n_req, 4) if n_req else None,
+        "queue_depth": depth,
+    }
+    if len(depth) > 1:
+        report["queue_growth_per_s"] = round((depth[-1][1] - depth[0][1]) / max(depth[-1][0] - depth[0][0], 1e-9), 1)
+    return report
+
+def main():
+    ap = argparse.ArgumentParser(description="Drive /ingest and report throughput and latency")
+    ap.add_argument("--url", default=URL)
+    ap.add_argument("--source", choices=["personas", "raw"], default="personas")
+    ap.add_argument("--events", type=float, default=1e5, help="persona events (or replay limit)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--start", default=None, help="raw replay window, epoch seconds or ISO time")
+    ap.add_argument("--end", default=None)
+    ap.add_argument("--speed", type=float, default=None, help="replay at N× the recorded timeline")
+    ap.add_argument("--max-idle", type=float, default=MAX_IDLE, help="replay: cap recorded gaps (s)")
+    ap.add_argument("--rate", type=float, default=None, help="target events/s (default: unthrottled)")
+    ap.add_argument("--batch", type=int, default=100)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--timeout", type=float, default=10.0)
+    ap.add_argument("--redis-url", default=REDIS_URL)
+    ap.add_argument("--out", type=Path, default=None, help="write the JSON report here")
+    args = ap.parse_args()
+
+    if args.source == "raw":
+        df = raw_events(parse_time(args.start), parse_time(args.end), int(args.events) if args.events else None)
+    else:
+        df = persona_events(int(args.events), args.seed)
+    report = run(df, args.url, args.batch, args.concurrency, args.rate, args.speed, args.timeout, args.redis_url,
+                 args.max_idle)
+    summary = {k: v for k, v in report.items() if k != "queue_depth"}
+    print(json.dumps(summary, indent=2))
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(report, indent=2))
+        print(f"[loadgen] wrote {args.out}")
+
+if __name__ == "__main__":
+    main()
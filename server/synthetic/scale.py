@@ -0,0 +1,127 @@
+"""
+Seeded, vectorized persona traffic for benchmarks.
+
+Same four personas as personas.py (reader, skimmer, rager, form_lost), but
+every session of a persona is generated at once from a per-persona event
+template: timestamps, jitter and scroll positions are [sessions × events]
+arrays, not Python loops. Output depends only on (n_events, seed, mix, t0),
+never on the wall clock, and is produced in blocks of BLOCK_SESSIONS so
+large runs can be streamed with `iter_events`.
+"""
+from __future__ import annotations
+import math
+from typing import Dict, Iterator
+
+import numpy as np
+import pandas as pd
+
+from ..schema import EVENT_COLUMNS, NESTED
+
+T0 = 1_750_000_000.0        # fixed epoch start
+SPAN = 24 * 3600.0          # session starts are spread over one day
+BLOCK_SESSIONS = 2000
+SESSIONS_PER_USER = 3
+
+# per persona: step (s), steps per session, scroll dy range and modulo,
+# per-step moves (offsets, centre, jitter) and clicks (step rule, offsets, xy, el)
+PERSONAS = {
+    "reader": dict(step=1.0, steps=180, dy=(40, 80), mod=8000,
+                   moves=[0.02], move_xy=(600, 400), jitter=5,
+                   click=lambda i: i % 45 == 10, click_dt=[0.05], click_xy=(600, 400), el="a#next"),
+    "skimmer": dict(step=0.7, steps=257, dy=(120, 240), mod=4000,
+                    moves=[0.02], move_xy=(500, 350), jitter=30,
+                    click=lambda i: i % 50 == 5, click_dt=[0.05], click_xy=(520, 360), el="button#cta"),
+    "rager": dict(step=0.8, steps=150, dy=(30, 60), mod=5000,
+                  moves=[0.02], move_xy=(300, 600), jitter=80,
+                  click=lambda i: i % 12 in (3, 4, 5), click_dt=[0.05, 0.06, 0.07], click_xy=(300, 600), el="div#dead"),
+    "form_lost": dict(step=1.2, steps=150, dy=(40, 80), mod=6000,
+                      moves=[0.03 + 0.02 * k for k in range(10)], move_xy=(700, 420), jitter=3,
+                      click=lambda i: i % 20 == 8, click_dt=[0.4], click_xy=(705, 425), el="label#name"),
+}
+DEFAULT_MIX = {p: 1.0 for p in PERSONAS}
+
+def _template(p: dict) -> dict:
+    # one session's events in time order: offset, kind (0 scroll, 1 move, 2 click), step index
+    off, kind, step = [], [], []
+    for i in range(p["steps"]):
+        t = i * p["step"]
+        rows = [(t, 0)] + [(t + d, 1) for d in p["moves"]]
+        if p["click"](i):
+            rows += [(t + d, 2) for d in p["click_dt"]]
+        rows.sort()
+        off += [r[0] for r in rows]; kind += [r[1] for r in rows]; step += [i] * len(rows)
+    return {"off": np.array(off), "kind": np.array(kind, dtype=np.int8), "step": np.array(step)}
+
+TEMPLATES = {name: _template(p) for name, p in PERSONAS.items()}
+
+def session_counts(n_events: int, mix: Dict[str, float] = None) -> Dict[str, int]:
+    mix = mix or DEFAULT_MIX
+    total = sum(mix.values())
+    return {name: max(1, int(round(n_events * w / total / len(TEMPLATES[name]["off"]))))
+            for name, w in mix.items() if w > 0}
+
+def _block(name: str, first: int, n: int, seed: int, pidx: int, t0: float) -> pd.DataFrame:
+    p, tpl = PERSONAS[name], TEMPLATES[name]
+    rng = np.random.default_rng([seed, pidx, first])
+    E = len(tpl["off"])
+    starts = t0 + rng.random(n) * SPAN
+    ts = (starts[:, None] + tpl["off"][None, :]).ravel()
+    kind = np.tile(tpl["kind"], n)
+
+    # scroll position: running sum of dy per session, wrapped like personas.py
+    lo, hi = p["dy"]
+    pos = np.cumsum(rng.integers(lo, hi + 1, size=(n, p["steps"])), axis=1) % p["mod"]
+    vy = pos[:, tpl["step"]].ravel().astype(float)
+
+    j = p["jitter"]
+    x = np.full(n * E, np.nan, dtype=np.float32); y = np.full(n * E, np.nan, dtype=np.float32)
+    mv, ck = kind == 1, kind == 2
+    x[mv] = p["move_xy"][0] + rng.integers(-j, j + 1, mv.sum())
+    y[mv] = p["move_xy"][1] + rng.integers(-j, j + 1, mv.sum())
+    x[ck], y[ck] = p["click_xy"]
+
+    sess = np.arange(first, first + n)
+    sid = np.array([f"s_{name}_{s}" for s in sess], dtype=object)
+    uid = np.array([f"u_{name}_{s // SESSIONS_PER_USER}" for s in sess], dtype=object)
+    rep = np.repeat(np.arange(n), E)
+    ev = pd.Categorical.from_codes(kind, ["scroll", "mousemove", "click"])
+    el = pd.Categorical.from_codes(np.where(ck, 0, -1), [p["el"]])
+    cols = {"sid": sid[rep], "uid": uid[rep], "ts": ts, "ev": ev, "x": x, "y": y, "el": el,
+            "dom": None, "aff": None, "view_y": np.where(kind == 0, vy, np.nan).astype(np.float32)}
+    # rawstore schema: other view/perf columns are empty
+    nan = np.full(n * E, np.nan, dtype=np.float32)
+    return pd.DataFrame({c: cols.get(c, nan) for c in EVENT_COLUMNS}, columns=EVENT_COLUMNS)
+
+def iter_events(n_events: int, seed: int = 0, mix: Dict[str, float] = None,
+                t0: float = T0, block: int = BLOCK_SESSIONS) -> Iterator[pd.DataFrame]:
+    """Blocks of raw events (rawstore/ingest schema), each sorted by ts."""
+    for pidx, (name, n_sess) in enumerate(session_counts(n_events, mix).items()):
+        for first in range(0, n_sess, block):
+            df = _block(name, first, min(block, n_sess - first), seed, pidx, t0)
+            yield df.sort_values("ts", kind="mergesort").reset_index(drop=True)
+
+def generate(n_events: int, seed: int = 0, mix: Dict[str, float] = None, t0: float = T0) -> pd.DataFrame:
+    """About n_events raw events; same arguments → same frame."""
+    return pd.concat(list(iter_events(n_events, seed, mix, t0)), ignore_index=True)
+
+def _clean(v):
+    if v is None or (isinstance(v, float) and math.isnan(v)):
+        return None
+    if isinstance(v, (np.integer, np.floating)):
+        return v.item()
+    return v
+
+def event_dicts(df: pd.DataFrame):
+    # rows as /ingest Event dicts: NaN/None fields dropped, numpy scalars unboxed,
+    # flat view_*/perf_* columns folded back into {"view": {...}} objects
+    cols = [c for c in EVENT_COLUMNS if c in df.columns]
+    for row in zip(*(df[c].to_numpy(dtype=object) for c in cols)):
+        rec = {c: _clean(v) for c, v in zip(cols, row)}
+        for c in ("x", "y"):
+            if rec.get(c) is not None:
+                rec[c] = int(rec[c])   # Event.x/y are ints
+        for nested, keys in NESTED.items():
+            obj = {k: rec.pop(f"{nested}_{k}") for k in keys if rec.get(f"{nested}_{k}") is not None}
+            if obj:
+                rec[nested] = obj
+        yield {c: v for c, v in rec.items() if v is not None}
@@ -0,0 +1,195 @@
+"""
+Arrow-native path from queue entries to the raw event store.
+
+JSON entries are parsed by pyarrow's C++ JSON reader against INGEST_SCHEMA
+(the /ingest shape); binary batch entries (codec.py) are already
+column-packed and become arrays directly. Both are then flattened into the
+stored schema (server/schema.py). No DataFrame is built on the way.
+
+PartitionWriter keeps one ParquetWriter open per hour partition of
+rawstore.py and appends every batch to it. A file is written
+under its `.tmp-` name (readers skip those) and renamed into place when it
+reaches ROLL_BYTES, is ROLL_SECONDS old, or MAX_OPEN files are open, or on
+flush(). Rows in an open file are lost if the process dies, so a caller that
+has already removed them from the queue must flush() before taking more
+(events_writer.py: every list-mode batch; stream mode before the ack). With
+`background=True` parquet encoding and compression run on a worker thread,
+so the caller only parses and hands over tables.
+
+Only the known `view`/`perf` keys are kept, as in schema.py; other keys and
+non-object values are dropped.
+"""
+import io
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.json as pj
+import pyarrow.parquet as pq
+
+from .rawstore import RAW_DIR, HOUR, partition_dir, _name
+from ..codec import MAGIC, decode
+from ..schema import EVENT_SCHEMA, NESTED, conform
+
+INGEST_SCHEMA = pa.schema([
+    ("sid", pa.string()), ("uid", pa.string()), ("ts", pa.float64()), ("ev", pa.string()),
+    ("x", pa.float64()), ("y", pa.float64()), ("el", pa.string()), ("dom", pa.string()),
+    ("aff", pa.string()),
+] + [(n, pa.struct([(k, pa.float64()) for k in keys])) for n, keys in NESTED.items()])
+PARSE = pj.ParseOptions(explicit_schema=INGEST_SCHEMA, unexpected_field_behavior="ignore")
+
+ROLL_BYTES = 64 << 20       # uncompressed bytes appended before a file is closed
+ROLL_SECONDS = 60.0
+MAX_OPEN = 64
+QUEUE_TABLES = 8            # tables waiting for the encoder thread (backpressure)
+_FLUSH, _STOP = "flush", "stop"
+
+def _json_table(raws) -> pa.Table:
+    try:
+        return pj.read_json(io.BytesIO(b"\n".join(raws)), parse_options=PARSE)
+    except pa.ArrowInvalid:
+        # find and drop the bad entries; only on the error path
+        good = []
+        for raw in raws:
+            try:
+                pj.read_json(io.BytesIO(raw), parse_options=PARSE)
+                good.append(raw)
+            except pa.ArrowInvalid as e:
+                print(f"[arrow_writer] skip bad entry: {e}")
+        return _json_table(good) if good else INGEST_SCHEMA.empty_table()
+
+def _columns_table(events) -> pa.Table:
+    return pa.table({f.name: pa.array([ev.get(f.name) for ev in events], f.type)
+                     for f in INGEST_SCHEMA}, schema=INGEST_SCHEMA)
+
+def entries_table(raws) -> pa.Table:
+    """One EVENT_SCHEMA table from raw queue entries (JSON and binary batches mixed)."""
+    raws = [bytes(r) if not isinstance(r, bytes) else r for r in
+            (x.encode("utf-8") if isinstance(x, str) else x for x in raws)]
+    binary = [r for r in raws if r[:len(MAGIC)] == MAGIC]
+    tables = []
+    plain = [r for r in raws if r[:len(MAGIC)] != MAGIC] if binary else raws
+    if plain:
+        tables.append(_json_table(plain))
+    for r in binary:
+        try:
+            tables.append(_columns_table(decode(r)))
+        except Exception as e:
+            print(f"[arrow_writer] skip bad entry: {e!r}")
+    return conform(pa.concat_tables(tables)) if tables else EVENT_SCHEMA.empty_table()
+
+def partition_keys(table: pa.Table) -> np.ndarray:
+    """Hour index of every row, as rawstore.write_events splits."""
+    ts = pc.fill_null(table.column("ts"), 0.0).to_numpy()
+    return np.floor(ts / HOUR).astype(np.int64)
+
+class PartitionWriter:
+    def __init__(self, root=RAW_DIR, tag: str = "", roll_bytes: int = ROLL_BYTES,
+                 roll_seconds: float = ROLL_SECONDS, max_open: int = MAX_OPEN, background: bool = True):
+        self.root, self.tag = root, tag
+        self.roll_bytes, self.roll_seconds, self.max_open = roll_bytes, roll_seconds, max_open
+        self._open = {}       # key → [ParquetWriter, tmp path, final path, opened at, bytes]
+        self.closed = []      # final paths of files renamed into place
+        self.rows = 0
+        self._error = None
+        self._q = None
+        if background:
+            self._q = queue.Queue(maxsize=QUEUE_TABLES)
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+
+    def write(self, table: pa.Table):
+        if self._error is not None:
+            raise self._error
+        if table.num_rows == 0:
+            return
+        if self._q is not None:
+            self._q.put(table)    # blocks only when the encoder is QUEUE_TABLES behind
+        else:
+            self._write(table)
+
+    def _loop(self):
+        while True:
+            try:
+                item = self._q.get(timeout=1.0)
+            except queue.Empty:
+                item = None
+            try:
+                if item is _FLUSH or item is _STOP:
+                    self._close_all()
+                elif item is not None:
+                    self._write(item)
+                self._roll_due()
+            except Exception as e:
+                self._error = e
+            finally:
+                if item is not None:
+                    self._q.task_done()
+            if item is _STOP:
+                return
+
+    def _write(self, table: pa.Table):
+        keys = partition_keys(table)
+        order = np.argsort(keys, kind="stable")
+        sk = keys[order]
+        bounds = np.flatnonzero(np.r_[True, sk[1:] != sk[:-1], True])
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            part = table.take(pa.array(order[lo:hi]))
+            w = self._writer(int(sk[lo]))
+            w[0].write_table(part)
+            w[4] += part.nbytes
+            if w[4] >= self.roll_bytes:
+                self._close(int(sk[lo]))
+        self.rows += table.num_rows
+
+    def _writer(self, key: int):
+        w = self._open.get(key)
+        if w is None:
+            if len(self._open) >= self.max_open:
+                self._close(min(self._open, key=lambda k: self._open[k][3]))
+            when = datetime.fromtimestamp(key * HOUR, tz=timezone.utc)
+            final = partition_dir(when.strftime("%Y-%m-%d"), when.hour, root=self.root)
+            final = final / _name("part", self.tag)
+            final.parent.mkdir(parents=True, exist_ok=True)
+            tmp = final.with_name(f".tmp-{final.name}")
+            w = self._open[key] = [pq.ParquetWriter(tmp, EVENT_SCHEMA), tmp, final, time.time(), 0]
+        return w
+
+    def _close(self, key: int):
+        w = self._open.pop(key)
+        w[0].close()
+        os.replace(w[1], w[2])
+        self.closed.append(w[2])
+
+    def _roll_due(self):
+        now = time.time()
+        for key in [k for k, w in self._open.items() if now - w[3] >= self.roll_seconds]:
+            self._close(key)
+
+    def _close_all(self):
+        for key in list(self._open):
+            self._close(key)
+
+    def flush(self):
+        """Close every open file; returns once all rows written so far are in place."""
+        if self._q is not None:
+            self._q.put(_FLUSH)
+            self._q.join()
+        else:
+            self._close_all()
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        if self._q is not None:
+            self._q.put(_STOP)
+            self._thread.join()
+        else:
+            self._close_all()
+        if self._error is not None:
+            raise self._error
@@ -0,0 +1,97 @@
+"""
+Background compaction for the raw event store (workers/rawstore.py).
+
+Small files in each partition directory are merged into
+`compacted-*.parquet` files of about TARGET_FILE_BYTES, sorted by ts and
+written with row groups of about ROW_GROUP_BYTES so time-range reads can
+skip most of them. Outputs are split into hour/uid_bucket partitions; the
+writers' hot files are not. Legacy flat `events_*.parquet` files are migrated into
+partitions the same way.
+
+A compacted file lists its source files and the other outputs of the same
+write in its metadata. Readers ignore sources that are still on disk once
+every output is in place; if a run died before that, its outputs are ignored
+instead and removed by the next run before the sources are rewritten. The incremental
+pipeline treats a compacted file as already processed when all of its
+sources were. When incremental state exists only already-processed files
+are compacted, so a compacted file never mixes processed and new events.
+Run it between incremental runs, not concurrently with them.
+
+    python -m server.workers.compact [--target-mb 128] [--row-group-mb 32]
+"""
+import argparse
+from pathlib import Path
+
+from .rawstore import RAW_DIR, write_events, read_files, list_files, partial_compactions
+from .incremental import load_state
+
+TARGET_FILE_BYTES = 128 << 20
+ROW_GROUP_BYTES = 32 << 20
+SMALL_FILE_FRACTION = 0.25  # files below this fraction of the target are candidates
+
+def _rel(f: Path, root: Path = RAW_DIR) -> str:
+    return str(f.relative_to(root))
+
+def _eligible(files, processed, root: Path = RAW_DIR):
+    return [f for f in files if processed is None or _rel(f, root) in processed]
+
+def _groups(files, target):
+    # consecutive (name-ordered, i.e. time-ordered) runs of about `target` bytes
+    group, size = [], 0
+    for f in files:
+        group.append(f); size += f.stat().st_size
+        if size >= target:
+            yield group
+            group, size = [], 0
+    if group:
+        yield group
+
+def _rewrite(files, row_group_bytes, root: Path = RAW_DIR):
+    nbytes = sum(f.stat().st_size for f in files)
+    df = read_files(files)
+    if df.empty:
+        for f in files: f.unlink()
+        return []
+    df = df.sort_values("ts", kind="mergesort").reset_index(drop=True)
+    rows_per_group = max(1024, int(row_group_bytes / max(nbytes / len(df), 1.0)))
+    out = write_events(df, root=root, prefix="compacted", sources=[_rel(f, root) for f in files],
+                       row_group_size=rows_per_group, by_uid=True)
+    # sources go only after every replacement is in place
+    for f in files: f.unlink()
+    return out
+
+def run(target_bytes=TARGET_FILE_BYTES, row_group_bytes=ROW_GROUP_BYTES, root: Path = RAW_DIR):
+    state = load_state()
+    processed = set(state["files"]) if state["files"] else None
+    # leftovers of an interrupted run: their sources are still live and get rewritten below
+    partial = partial_compactions(root)
+    for f in partial: f.unlink()
+    live = list_files(root=root)
+
+    legacy = _eligible([f for f in live if f.parent == root], processed, root)
+    written, merged = 0, 0
+    for group in _groups(legacy, target_bytes):
+        written += len(_rewrite(group, row_group_bytes, root)); merged += len(group)
+
+    small = target_bytes * SMALL_FILE_FRACTION
+    by_part = {}
+    for f in live:
+        if f.parent != root and f.stat().st_size < small:
+            by_part.setdefault(f.parent, []).append(f)
+    for files in by_part.values():
+        for group in _groups(_eligible(files, processed, root), target_bytes):
+            if len(group) < 2:
+                continue
+            written += len(_rewrite(group, row_group_bytes, root)); merged += len(group)
+    print(f"[compact] merged {merged} files → {written} compacted files"
+          + (f" ({len(partial)} partial outputs of an interrupted run removed)" if partial else ""))
+
+def main():
+    ap = argparse.ArgumentParser(description="Compact small raw event files")
+    ap.add_argument("--target-mb", type=float, default=TARGET_FILE_BYTES / (1 << 20))
+    ap.add_argument("--row-group-mb", type=float, default=ROW_GROUP_BYTES / (1 << 20))
+    args = ap.parse_args()
+    run(int(args.target_mb * (1 << 20)), int(args.row_group_mb * (1 << 20)))
+
+if __name__ == "__main__":
+    main()
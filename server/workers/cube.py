@@ -0,0 +1,160 @@
+"""
+Rollup cube over metrics_5s for DP queries.
+
+For each grouping in GROUPINGS one parquet file holds, per group, the row
+count (for k-anonymity) and, per metric, counts and sums of the values in
+fixed buckets (EDGES). For clip bounds that fall on bucket edges the clipped
+sum is exact:
+
+    Σ clip(x, lo, hi) = lo·#(x < lo) + Σ_{lo ≤ x < hi} x + hi·#(x ≥ hi)
+
+so `dp_group_aggregate` can answer from O(groups) rows instead of O(windows).
+"hour" and "day" are time buckets of w_start. Each cube file records the
+metrics version it was built from; the aggregator ignores stale cubes.
+Counts and sums are additive, so `update_cube` applies a change of some
+metrics rows without reading the rest.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .shards import dataset_version, replace_path
+
+CUBE_DIR = Path(__file__).resolve().parents[2] / "data" / "metrics" / "cube"
+
+METRICS = ("UFI", "RCS", "MIV")
+EDGES = {
+    "UFI": np.linspace(0.0, 1.0, 21),
+    "RCS": np.linspace(0.0, 1.0, 21),
+    "MIV": np.linspace(0.0, 5.0, 21),   # seconds
+}
+TIME_BUCKETS = {"hour": 3600.0, "day": 86400.0}
+GROUPINGS = [("sess_key",), ("hour",), ("day",)]
+VERSION_KEY = b"visageux.metrics_version"
+EDGE_TOL = 1e-9
+
+def group_column(df: pd.DataFrame, col: str) -> pd.Series:
+    # time buckets are derived from w_start; anything else must be a real column
+    if col not in df.columns and col in TIME_BUCKETS:
+        size = TIME_BUCKETS[col]
+        return (np.floor(df["w_start"] / size) * size).rename(col)
+    return df[col]
+
+def grouping_name(cols) -> str:
+    return "+".join(cols)
+
+def cube_path(cols, cube_dir: Path = CUBE_DIR) -> Path:
+    return cube_dir / f"{grouping_name(cols)}.parquet"
+
+def _bucket(x: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    # 0: x < edges[0]; i: edges[i-1] <= x < edges[i]; len(edges): x >= edges[-1]
+    return np.searchsorted(edges, x, side="right")
+
+def build_grouping(m: pd.DataFrame, cols) -> pd.DataFrame:
+    keys = [group_column(m, c) for c in cols]
+    code = m.groupby(keys, sort=False).ngroup().to_numpy()
+    valid = code >= 0
+    code = code[valid]
+    n_groups = int(code.max()) + 1 if len(code) else 0
+    first = np.flatnonzero(valid)[np.unique(code, return_index=True)[1]] if len(code) else np.zeros(0, int)
+    out = {c: k.to_numpy()[first] for c, k in zip(cols, keys)}
+    out["rows"] = np.bincount(code, minlength=n_groups)
+    for metric in METRICS:
+        if metric not in m.columns:
+            continue
+        edges = EDGES[metric]
+        nb = len(edges) + 1
+        x = m[metric].to_numpy(dtype=float)[valid]
+        ok = ~np.isnan(x)
+        flat = code[ok] * nb + _bucket(x[ok], edges)
+        cnt = np.bincount(flat, minlength=n_groups * nb).reshape(n_groups, nb)
+        tot = np.bincount(flat, weights=x[ok], minlength=n_groups * nb).reshape(n_groups, nb)
+        for j in range(nb):
+            out[f"{metric}__n{j}"] = cnt[:, j]
+            out[f"{metric}__s{j}"] = tot[:, j]
+    return pd.DataFrame(out)
+
+def _write_grouping(cube: pd.DataFrame, path: Path, version: bytes):
+    table = pa.Table.from_pandas(cube, preserve_index=False)
+    md = dict(table.schema.metadata or {})
+    md[VERSION_KEY] = version
+    table = table.replace_schema_metadata(md)
+    tmp = path.with_name(path.name + ".tmp")
+    pq.write_table(table, tmp)
+    replace_path(tmp, path)
+
+def write_cube(m: pd.DataFrame, metrics_path: Path, cube_dir: Path = CUBE_DIR, groupings=GROUPINGS):
+    version = json.dumps(list(dataset_version(metrics_path))).encode("utf-8")
+    cube_dir.mkdir(parents=True, exist_ok=True)
+    for cols in groupings:
+        _write_grouping(build_grouping(m, cols), cube_path(cols, cube_dir), version)
+
+def update_cube(removed: pd.DataFrame, added: pd.DataFrame, built_from: tuple, metrics_path: Path,
+                cube_dir: Path = CUBE_DIR, groupings=GROUPINGS) -> bool:
+    """
+    Cubes of metrics version `built_from` minus the `removed` rows plus the
+    `added` ones, stamped with the current version of metrics_path. False,
+    with nothing written, when a cube is missing or of another version.
+    """
+    paths = [cube_path(cols, cube_dir) for cols in groupings]
+    if not all(p.exists() and cube_version(p) == tuple(built_from) for p in paths):
+        return False
+    updated = []
+    for cols, path in zip(groupings, paths):
+        cube = pd.read_parquet(path)
+        stats = [c for c in cube.columns if c not in cols]
+        parts = [cube]
+        for m, sign in ((added, 1), (removed, -1)):
+            if len(m):
+                g = build_grouping(m, cols)
+                if not set(g.columns) <= set(cube.columns):
+                    return False
+                g = g.reindex(columns=cube.columns, fill_value=0)
+                parts.append(g if sign > 0 else pd.concat([g[list(cols)], -g[stats]], axis=1))
+        both = pd.concat(parts, ignore_index=True)
+        code = both.groupby(list(cols), sort=False).ngroup().to_numpy()
+        order = np.argsort(code, kind="stable")
+        starts = np.flatnonzero(np.diff(code[order], prepend=-1) != 0)
+        sums = np.add.reduceat(both[stats].to_numpy(dtype=float)[order], starts, axis=0)
+        out = pd.concat([both[list(cols)].iloc[order[starts]].reset_index(drop=True),
+                         pd.DataFrame(sums, columns=stats)], axis=1)
+        out = out[out["rows"] > 0].reset_index(drop=True)
+        for metric in METRICS:
+            # an emptied bucket sums to exactly 0, not to float residue
+            for j in range(len(EDGES[metric]) + 1):
+                if f"{metric}__n{j}" in out.columns:
+                    out.loc[out[f"{metric}__n{j}"] == 0, f"{metric}__s{j}"] = 0.0
+        updated.append((out.astype(cube.dtypes.to_dict()), path))
+    version = json.dumps(list(dataset_version(metrics_path))).encode("utf-8")
+    for out, path in updated:
+        _write_grouping(out, path, version)
+    return True
+
+def cube_version(path: Path):
+    md = pq.read_schema(path).metadata or {}
+    return tuple(json.loads(md[VERSION_KEY])) if VERSION_KEY in md else None
+
+def _edge_index(edges: np.ndarray, v: float):
+    j = int(np.argmin(np.abs(edges - v)))
+    return j if abs(edges[j] - v) <= EDGE_TOL else None
+
+def clip_stats(cube: pd.DataFrame, metric: str, clip_lo: float, clip_hi: float):
+    """(n, clipped sum) per cube row, or None when the bounds are not bucket edges."""
+    if metric not in EDGES or f"{metric}__n0" not in cube.columns or not clip_lo < clip_hi:
+        return None
+    edges = EDGES[metric]
+    a, b = _edge_index(edges, clip_lo), _edge_index(edges, clip_hi)
+    if a is None or b is None:
+        return None
+    nb = len(edges) + 1
+    cnt = cube[[f"{metric}__n{j}" for j in range(nb)]].to_numpy(dtype=float)
+    tot = cube[[f"{metric}__s{j}" for j in range(nb)]].to_numpy(dtype=float)
+    # bucket j <= a: x < lo;  a < j <= b: lo <= x < hi;  j > b: x >= hi
+    s = (cnt[:, :a + 1].sum(axis=1) * clip_lo
+         + tot[:, a + 1:b + 1].sum(axis=1)
+         + cnt[:, b + 1:].sum(axis=1) * clip_hi)
+    return cnt.sum(axis=1), s
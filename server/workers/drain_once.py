@@ -1,12 +1,8 @@
-import json
-from pathlib import Path
-from datetime import datetime
 import pandas as pd
 import redis
 
-REPO_ROOT = Path(__file__).resolve().parents[2]
-OUTDIR = REPO_ROOT / "data" / "parquet"
-OUTDIR.mkdir(parents=True, exist_ok=True)
+from .rawstore import RAW_DIR as OUTDIR, write_events
+from ..codec import decode
 
 r = redis.Redis(host="localhost", port=6379, db=0, decode_responses=False)
 QUEUE = "events"
@@ -19,19 +15,17 @@ def main():
         if raw is None:
             break
         try:
-            batch.append(json.loads(raw))
+            batch.extend(decode(raw))
         except Exception as e:
-            print("skip bad json:", e)
+            print("skip bad entry:", e)
 
     if not batch:
         print("[drain] queue empty — nothing to write.")
         return
 
     df = pd.DataFrame(batch)
-    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
-    path = OUTDIR / f"events_{stamp}.parquet"
-    df.to_parquet(path, index=False)
-    print(f"[drain] wrote {len(df)} rows → {path}")
+    paths = write_events(df, tag="drain")
+    print(f"[drain] wrote {len(df)} rows → {len(paths)} partition file(s) under {OUTDIR}")
 
 if __name__ == "__main__":
     main()
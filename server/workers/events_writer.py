@@ -1,33 +1,42 @@
-import json
+import argparse
+import os
+import socket
 import time
+from multiprocessing import Process
 from pathlib import Path
-from datetime import datetime
 
 import pandas as pd
 import redis
 
-# ---------- Paths ----------
-# .../visageux/server/workers/events_writer.py → repo root is 3 levels up
-REPO_ROOT = Path(__file__).resolve().parents[2]
-OUTDIR = REPO_ROOT / "data" / "parquet"
-OUTDIR.mkdir(parents=True, exist_ok=True)
+from ..streams import STREAM_KEY, GROUP, FIELD, ensure_group
+from ..codec import decode
+from .rawstore import RAW_DIR as OUTDIR, write_events
+from .arrow_writer import PartitionWriter, entries_table
 
 # ---------- Queue ----------
 QUEUE_NAME = "events"
-r = redis.Redis(host="localhost", port=6379, db=0, decode_responses=False)
+REDIS_URL = os.environ.get("VISAGEUX_REDIS_URL", "redis://localhost:6379/0")   # as server/app.py
+r = redis.Redis.from_url(REDIS_URL, decode_responses=False)
 
 # ---------- Flush policy ----------
 BATCH_SIZE = 100          # write every 100 events
 FLUSH_SECONDS = 10        # or every 10s, whichever first
 
-def write_batch(batch):
+# ---------- Stream mode ----------
+READ_COUNT = 500          # entries per XREADGROUP
+BLOCK_MS = 1000
+CLAIM_IDLE_MS = 60_000    # pending this long → owner presumed dead, reclaim
+CLAIM_EVERY = 30          # seconds between reclaim sweeps
+
+# ---------- Arrow mode ----------
+ARROW_BATCH = 5000        # entries parsed into one Arrow table
+
+def write_batch(batch, tag=""):
     if not batch:
         return
     df = pd.DataFrame(batch)
-    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
-    path = OUTDIR / f"events_{stamp}.parquet"
-    df.to_parquet(path, engine="pyarrow", index=False)
-    print(f"[writer] wrote {len(batch)} → {path}")
+    paths = write_events(df, tag=tag, root=OUTDIR)
+    print(f"[writer] wrote {len(batch)} → {len(paths)} partition file(s) under {OUTDIR}")
 
 def run():
     print(f"[writer] watching Redis list '{QUEUE_NAME}'…")
@@ -40,15 +49,157 @@ def run():
         if item:
             _, raw = item
             try:
-                ev = json.loads(raw)
-                buf.append(ev)
+                buf.extend(decode(raw))
             except Exception as e:
-                print(f"[writer] JSON decode error: {e!r}")
+                print(f"[writer] decode error: {e!r}")
 
         if buf and (len(buf) >= BATCH_SIZE or (time.time() - last) >= FLUSH_SECONDS):
             write_batch(buf)
             buf.clear()
             last = time.time()
 
+def run_arrow():
+    # list mode without pandas: entries → Arrow table → partition files. Popped entries
+    # are gone from Redis, so every batch is closed into place before the next pop:
+    # a crash loses at most one batch (ARROW_BATCH entries or FLUSH_SECONDS), never a
+    # half-written .tmp- file's worth
+    print(f"[writer] watching Redis list '{QUEUE_NAME}' (arrow)…")
+    writer = PartitionWriter(root=OUTDIR, background=False)
+    raws, last = [], time.time()
+    try:
+        while True:
+            item = r.blpop(QUEUE_NAME, timeout=1)
+            if item:
+                raws.append(item[1])
+                raws.extend(r.lpop(QUEUE_NAME, READ_COUNT) or [])
+            if raws and (len(raws) >= ARROW_BATCH or (time.time() - last) >= FLUSH_SECONDS):
+                writer.write(entries_table(raws))
+                writer.flush()
+                raws, last = [], time.time()
+    finally:
+        if raws:
+            writer.write(entries_table(raws))
+        writer.close()
+        print(f"[writer] {writer.rows} events → {len(writer.closed)} file(s) under {OUTDIR}")
+
+class StreamWriter:
+    """
+    One consumer of the 'writers' group. Entries are XACKed (and XDELed) only
+    after the parquet file holding them is written, so a crash leaves them
+    pending; a live writer reclaims them with XAUTOCLAIM once they have been
+    idle for CLAIM_IDLE_MS. With `arrow=True` the raw entries are kept and
+    parsed into one Arrow table per flush; its files are closed before the ack.
+    """
+    def __init__(self, client, consumer, batch_size=BATCH_SIZE, flush_seconds=FLUSH_SECONDS,
+                 read_count=READ_COUNT, block_ms=BLOCK_MS, claim_idle_ms=CLAIM_IDLE_MS, arrow=False):
+        self.r = client
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.read_count = read_count
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.writer = PartitionWriter(root=OUTDIR, tag=consumer, background=False) if arrow else None
+        self.buf, self.ids = [], []
+        self.last_flush = time.time()
+        self.last_claim = 0.0
+        ensure_group(self.r)
+
+    def _take(self, entries):
+        for eid, fields in entries:
+            self.ids.append(eid)
+            if self.writer is not None:
+                self.buf.append(fields[FIELD])
+                continue
+            try:
+                self.buf.extend(decode(fields[FIELD]))
+            except Exception as e:
+                # poison entries are acked with the batch so they don't cycle forever
+                print(f"[writer:{self.consumer}] decode error {eid!r}: {e!r}")
+
+    def reclaim(self):
+        start = "0-0"
+        while True:
+            res = self.r.xautoclaim(STREAM_KEY, GROUP, self.consumer, self.claim_idle_ms,
+                                    start_id=start, count=self.read_count)
+            start, entries = res[0], res[1]
+            self._take(entries)
+            if not entries or start in (b"0-0", "0-0"):
+                break
+        self.last_claim = time.time()
+
+    def poll(self):
+        if time.time() - self.last_claim >= CLAIM_EVERY:
+            self.reclaim()
+        resp = self.r.xreadgroup(GROUP, self.consumer, {STREAM_KEY: ">"},
+                                 count=self.read_count, block=self.block_ms)
+        for _, entries in resp or []:
+            self._take(entries)
+        # batch entries hold many events: count both
+        if self.ids and (max(len(self.ids), len(self.buf)) >= self.batch_size or
+                         time.time() - self.last_flush >= self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        if self.buf and self.writer is not None:
+            self.writer.write(entries_table(self.buf))
+            self.writer.flush()
+        elif self.buf:
+            write_batch(self.buf, tag=self.consumer)
+        if self.ids:
+            pipe = self.r.pipeline(transaction=False)
+            pipe.xack(STREAM_KEY, GROUP, *self.ids)
+            pipe.xdel(STREAM_KEY, *self.ids)
+            pipe.execute()
+        self.buf, self.ids = [], []
+        self.last_flush = time.time()
+
+    def resume(self):
+        # entries this consumer name read but never acked (restart with same name)
+        last = "0"
+        while True:
+            resp = self.r.xreadgroup(GROUP, self.consumer, {STREAM_KEY: last}, count=self.read_count)
+            entries = resp[0][1] if resp else []
+            if not entries:
+                break
+            self._take(entries)
+            last = entries[-1][0]
+            if max(len(self.ids), len(self.buf)) >= self.batch_size:
+                self.flush()
+
+def run_stream(consumer=None, arrow=False):
+    consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+    client = redis.Redis.from_url(REDIS_URL, decode_responses=False)
+    w = StreamWriter(client, consumer, batch_size=ARROW_BATCH if arrow else BATCH_SIZE, arrow=arrow)
+    print(f"[writer:{consumer}] reading stream '{STREAM_KEY}' as group '{GROUP}'…")
+    w.resume()
+    try:
+        while True:
+            w.poll()
+    finally:
+        w.flush()
+
+def main():
+    global OUTDIR
+    ap = argparse.ArgumentParser(description="Redis → parquet event writer")
+    ap.add_argument("--stream", action="store_true", help="consume the Redis stream via a consumer group")
+    ap.add_argument("--procs", type=int, default=1, help="writer processes (stream mode)")
+    ap.add_argument("--consumer", default=None, help="consumer name prefix (stream mode)")
+    ap.add_argument("--arrow", action="store_true", help="parse entries into Arrow and skip pandas")
+    ap.add_argument("--root", type=Path, default=None, help=f"raw store root (default {OUTDIR})")
+    args = ap.parse_args()
+    if args.root:
+        OUTDIR = args.root   # forked --procs children inherit it
+    if not args.stream:
+        run_arrow() if args.arrow else run()
+        return
+    if args.procs <= 1:
+        run_stream(args.consumer, args.arrow)
+        return
+    prefix = args.consumer or socket.gethostname()
+    procs = [Process(target=run_stream, args=(f"{prefix}-{i}", args.arrow)) for i in range(args.procs)]
+    for p in procs: p.start()
+    for p in procs: p.join()
+
 if __name__ == "__main__":
-    run()
+    main()
@@ -1,155 +1,317 @@
 from pathlib import Path
+import argparse
 import pandas as pd
 import numpy as np
-from math import hypot
+from .shards import write_frame
+from ..schema import flat_frame
 
-IN_PATH = Path(__file__).resolve().parents[2] / "data" / "features" / "events_sessionized.parquet"
-OUT_PATH = Path(__file__).resolve().parents[2] / "data" / "features" / "windows_5s.parquet"
+FEATURES_DIR = Path(__file__).resolve().parents[2] / "data" / "features"
+IN_PATH = FEATURES_DIR / "events_sessionized.parquet"
+OUT_PATH = FEATURES_DIR / "windows_5s.parquet"
 
 WINDOW = 5.0  # seconds
+SESSION = "session"  # resolution: one window per session
 RAGE_MS = 0.6
 RAGE_RADIUS = 50.0
 LOW_SPEED = 40.0  # px/s for hover-stall
 STALL_MS = 0.7
 NEAR_PX = 120.0
+STALL_LOOKBACK = 1.0  # seconds before a click scanned for slow cursor samples
+SAMPLE_DT = 0.05      # approx mousemove sampling period (~20Hz)
 
 ACTIONABLE_PREFIXES = ("button", "a", "input", "select", "textarea", "label")
 
-def _click_bursts(clicks):
-    # clicks: list of (t,x,y)
-    if len(clicks) < 3:
-        return 0
-    clicks = sorted(clicks)
-    rage = 0
-    for i in range(len(clicks)-2):
-        t0,x0,y0 = clicks[i]
-        t1,x1,y1 = clicks[i+1]
-        t2,x2,y2 = clicks[i+2]
-        if (t2 - t0) <= RAGE_MS and hypot(x2-x0, y2-y0) <= RAGE_RADIUS:
-            rage += 1
-    return rage
-
-def _direction_changes(seq):
-    # seq of scroll y positions with time; count sign changes in dy
-    if len(seq) < 3:
-        return 0
-    dirs = []
-    for i in range(1,len(seq)):
-        dy = seq[i][1] - seq[i-1][1]
-        if dy > 0: dirs.append(1)
-        elif dy < 0: dirs.append(-1)
-        else: dirs.append(0)
-    # count nonzero sign flips
-    flips = 0
-    last = 0
-    for d in dirs:
-        if d == 0: 
-            continue
-        if last != 0 and np.sign(d) != np.sign(last):
-            flips += 1
-        last = d
-    return flips
+WINDOW_COLUMNS = [
+    "sess_key", "w_start", "w_end",
+    "speed_mean", "speed_max", "speed_std",
+    "rage_clicks", "dead_clicks", "hover_stall",
+    "scroll_velocity", "scroll_oscillations", "scroll_depth",
+    "clicks", "moves",
+]
 
-def main():
-    df = pd.read_parquet(IN_PATH)
-    # ensure types
-    for c in ["x","y"]: 
+def count_before(elem_grp, elem_t, q_grp, q_t, inclusive=False):
+    """
+    For every query (q_grp, q_t) count the elements of the same group with
+    time < q_t (or <= q_t when inclusive). Both element arrays must be sorted
+    by (group, time). One lexsort over elements+queries, no per-group loop.
+    """
+    ne, nq = len(elem_t), len(q_t)
+    if nq == 0:
+        return np.zeros(0, dtype=np.int64)
+    grp = np.concatenate([elem_grp, q_grp])
+    t = np.concatenate([elem_t, q_t])
+    # tie order decides strictness: queries first → "<", elements first → "<="
+    kind = np.concatenate([np.zeros(ne, np.int8), np.ones(nq, np.int8)])
+    if not inclusive:
+        kind = 1 - kind
+    order = np.lexsort((kind, t, grp))
+    is_elem = np.zeros(ne + nq, dtype=np.int64)
+    is_elem[:ne] = 1
+    seen = np.cumsum(is_elem[order])
+    before = np.empty(ne + nq, dtype=np.int64)
+    before[order] = seen - is_elem[order]
+    # subtract elements that belong to earlier groups
+    grp_start = np.searchsorted(elem_grp, q_grp, side="left")
+    return before[ne:] - grp_start
+
+def _segment_max(vals, wid, n_win, empty=0.0):
+    # vals sorted by wid; empty windows → `empty`
+    out = np.full(n_win, empty, dtype=float)
+    if len(vals):
+        starts = np.flatnonzero(np.r_[True, wid[1:] != wid[:-1]])
+        out[wid[starts]] = np.maximum.reduceat(vals, starts)
+    return out
+
+def res_name(res) -> str:
+    return res if res == SESSION else f"{float(res):g}s"
+
+def parse_res(name: str):
+    # "5s" / "5" → 5.0, "session" → SESSION
+    name = name.strip()
+    return SESSION if name == SESSION else float(name.rstrip("s"))
+
+def window_path(res) -> Path:
+    return FEATURES_DIR / f"windows_{res_name(res)}.parquet"
+
+def _levels(resolutions):
+    """(res, parent res or None) in computation order; each level rolls up from its parent."""
+    fixed = sorted({float(r) for r in resolutions if r != SESSION}) or [WINDOW]
+    base, order = fixed[0], [(fixed[0], None)]
+    for r in fixed[1:]:
+        k = r / base
+        if abs(k - round(k)) > 1e-9:
+            raise ValueError(f"resolution {res_name(r)} is not a multiple of {res_name(base)}")
+        # coarsest finer level that divides r, so 30s rolls up from 5s rather than 1s
+        parent = max(p for p, _ in order if abs(r / p - round(r / p)) <= 1e-9)
+        order.append((r, parent))
+    if SESSION in resolutions:
+        order.append((SESSION, order[-1][0]))
+    return order
+
+def _grid(start, end, res):
+    # per-session windows, identical to np.arange(start, end + 1e-6, res) per session
+    n_per = np.ceil(((end + 1e-6) - start) / res).astype(np.int64)
+    delta = (start + res) - start
+    off = np.concatenate([[0], np.cumsum(n_per)])
+    sess = np.repeat(np.arange(len(start)), n_per)
+    i = np.arange(off[-1]) - off[sess]
+    return {"sess": sess, "off": off, "w_start": start[sess] + i * delta[sess], "i": i}
+
+def _rollup(st, child, parent, k):
+    """Level statistics of `parent` windows from those of `child` windows."""
+    if k is None:    # one window per session
+        p = child["sess"]
+    else:
+        n_per = np.diff(parent["off"])
+        p = parent["off"][child["sess"]] + np.minimum(child["i"] // k, n_per[child["sess"]] - 1)
+    n = len(parent["sess"])
+    add = lambda v: np.bincount(p, weights=v, minlength=n)
+    out = {"map": p[st["map"]]}
+    for c in ("clicks", "dead", "stall"):
+        out[c] = add(st[c])
+    # speed moments: Chan et al. pairwise merge of (count, mean, M2)
+    out["moves"] = add(st["moves"])
+    out["sp_mean"] = add(st["moves"] * st["sp_mean"]) / np.maximum(out["moves"], 1)
+    out["sp_m2"] = add(st["sp_m2"] + st["moves"] * (st["sp_mean"] - out["sp_mean"][p]) ** 2)
+    out["sp_max"] = _segment_max(st["sp_max"], p, n)
+    out["depth"] = _segment_max(st["depth"], p, n, empty=-np.inf)
+    # first/last scroll sample: from the first/last child window that has one
+    out["n_sc"] = add(st["n_sc"])
+    ne = np.flatnonzero(st["n_sc"] > 0)
+    pp = p[ne]
+    first = ne[np.r_[True, pp[1:] != pp[:-1]]] if len(ne) else ne
+    last = ne[np.r_[pp[1:] != pp[:-1], True]] if len(ne) else ne
+    for c, src in (("f_t", first), ("f_vy", first), ("l_t", last), ("l_vy", last)):
+        out[c] = np.zeros(n)
+        out[c][p[src]] = st[c][src]
+    return out
+
+def _frame(st, grid, sess_keys, spans, res, end):
+    n_win = len(grid["sess"])
+    # burst spans count in a window only when they lie inside it
+    count = lambda lo, hi: np.bincount(st["map"][hi][st["map"][lo] == st["map"][hi]], minlength=n_win)
+    vel = np.zeros(n_win)
+    multi = st["n_sc"] >= 2
+    span = st["l_t"][multi] - st["f_t"][multi]
+    vel[multi] = (st["l_vy"][multi] - st["f_vy"][multi]) / np.where(span == 0, 1e-6, span)
+    w_start = grid["w_start"]
+    return pd.DataFrame({
+        "sess_key": np.asarray(sess_keys)[grid["sess"]],
+        "w_start": w_start,
+        "w_end": end if res == SESSION else w_start + res,
+        "speed_mean": st["sp_mean"],
+        "speed_max": st["sp_max"],
+        "speed_std": np.sqrt(st["sp_m2"] / np.maximum(st["moves"], 1)),
+        "rage_clicks": count(*spans["rage"]).astype(np.int64),
+        "dead_clicks": st["dead"].astype(np.int64),
+        "hover_stall": st["stall"].astype(np.int64),
+        "scroll_velocity": vel,
+        "scroll_oscillations": count(*spans["flip"]).astype(np.int64),
+        "scroll_depth": np.where(np.isfinite(st["depth"]), st["depth"], 0.0),
+        "clicks": st["clicks"].astype(np.int64),
+        "moves": st["moves"].astype(np.int64),
+    }, columns=WINDOW_COLUMNS)
+
+def compute_resolutions(df: pd.DataFrame, resolutions=(WINDOW,)) -> dict:
+    """
+    Window primitives at several resolutions in one pass: {res_name: frame}.
+
+    Events are binned once into windows of the finest resolution with a
+    lexsort/searchsorted pass and aggregated with bincount/reduceat into
+    mergeable statistics (counts, speed count/mean/M2, max, first/last scroll
+    sample). Each coarser resolution is a rollup of the finest one that
+    divides it, and SESSION of the coarsest. Rage bursts and scroll direction
+    flips are kept as (first, last) window spans and count where they fit
+    inside one window, so every resolution matches a direct computation.
+    Resolutions must be multiples of the finest one.
+    """
+    levels = _levels(resolutions)
+    # frames written before the flat schema still carry a dict `view` column
+    df = flat_frame(df) if "view" in df else df.copy()
+    for c in ["x", "y"]:
         if c in df: df[c] = pd.to_numeric(df[c], errors="coerce")
     df["ts"] = pd.to_numeric(df["ts"], errors="coerce")
-    df = df.dropna(subset=["ts"]).sort_values(["sess_key","ts"]).reset_index(drop=True)
-
-    # compute windows
-    rows = []
-    for sess_key, g in df.groupby("sess_key", sort=False):
-        start = g["ts"].min()
-        end = g["ts"].max()
-        win_starts = np.arange(start, end + 1e-6, WINDOW)
-
-        # pre-extract per-type
-        moves = g[g["ev"]=="mousemove"][["ts","x","y"]].dropna().to_numpy()
-        clicks = g[g["ev"]=="click"][["ts","x","y","el"]].to_numpy()
-        scrolls = []
-        gv = g[g["ev"]=="scroll"]
-        for _, row in gv.iterrows():
-            vy = None
-            if isinstance(row.get("view"), dict):
-                vy = row["view"].get("y", None)
-            else:
-                # some rows might store JSON-like strings; ignore for now
-                pass
-            if vy is not None:
-                scrolls.append((row["ts"], float(vy)))
-
-        # precompute cursor speed
-        speeds = []
-        for i in range(1, len(moves)):
-            t0,x0,y0 = moves[i-1]
-            t1,x1,y1 = moves[i]
-            dt = max((t1 - t0), 1e-6)
-            d = hypot((x1-x0) or 0.0, (y1-y0) or 0.0)
-            speeds.append((t1, d/dt))  # speed at t1
-
-        # loop windows
-        for w in win_starts:
-            w0, w1 = w, w + WINDOW
-            # speeds
-            win_speeds = [s for (t,s) in speeds if w0 <= t < w1]
-            sp_mean = float(np.mean(win_speeds)) if win_speeds else 0.0
-            sp_max  = float(np.max(win_speeds))  if win_speeds else 0.0
-            sp_std  = float(np.std(win_speeds))  if win_speeds else 0.0
-
-            # clicks
-            cks = [(float(t), float(x or 0.0), float(y or 0.0), str(el) if el is not None else "") 
-                   for (t,x,y,el) in clicks if w0 <= t < w1]
-            rage = _click_bursts([(t,x,y) for (t,x,y,_) in cks])
-
-            dead = 0
-            for (_, _, _, el) in cks:
-                el_str = (el or "").lower()
-                if not el_str.startswith(ACTIONABLE_PREFIXES):
-                    dead += 1
-
-            # hover-stall proxy:
-            # if we have a click in window, look back 1s before it: if speeds < LOW_SPEED for >= STALL_MS and cursor near click coords
-            stall = 0
-            for (t,x,y,_) in cks:
-                near_samples = [ (tt,ss) for (tt,ss) in speeds if (t-1.0) <= tt < t and ss < LOW_SPEED ]
-                if near_samples:
-                    # assume near if we had any recent mousemove (we don't track distance to element center reliably)
-                    dur = len(near_samples) * 0.05  # approx if we sampled ~20Hz; conservative proxy
-                    if dur >= STALL_MS:
-                        stall += 1
-
-            # scroll
-            sw = [(t,vy) for (t,vy) in scrolls if w0 <= t < w1]
-            osc = _direction_changes(sw)
-            vel = 0.0
-            if len(sw) >= 2:
-                dt = (sw[-1][0] - sw[0][0]) or 1e-6
-                dy = (sw[-1][1] - sw[0][1])
-                vel = float(dy / dt)
-            depth = float(max([vy for (_,vy) in sw], default=0.0))
-
-            rows.append({
-                "sess_key": sess_key,
-                "w_start": w0,
-                "w_end": w1,
-                "speed_mean": sp_mean,
-                "speed_max": sp_max,
-                "speed_std": sp_std,
-                "rage_clicks": rage,
-                "dead_clicks": dead,
-                "hover_stall": stall,
-                "scroll_velocity": vel,
-                "scroll_oscillations": osc,
-                "scroll_depth": depth,
-                "clicks": len(cks),
-                "moves": int(np.sum([1 for (t,_) in speeds if w0 <= t < w1])),
-            })
-
-    out = pd.DataFrame(rows)
-    out.to_parquet(OUT_PATH, index=False)
-    print(f"[feature_primitives] wrote {len(out)} window rows → {OUT_PATH}")
+    df = df.dropna(subset=["ts", "sess_key"]).sort_values(["sess_key", "ts"]).reset_index(drop=True)
+    wanted = {res_name(r) for r in resolutions}
+    if df.empty:
+        return {name: pd.DataFrame(columns=WINDOW_COLUMNS) for name in wanted}
+
+    # sessions are contiguous and sorted → codes ascend with row order
+    sess_code, sess_keys = pd.factorize(df["sess_key"], sort=False)
+    ts = df["ts"].to_numpy(dtype=float)
+    ev = df["ev"].to_numpy()
+    n_sess = len(sess_keys)
+    first = np.searchsorted(sess_code, np.arange(n_sess), side="left")
+    last = np.searchsorted(sess_code, np.arange(n_sess), side="right") - 1
+    start, end = ts[first], ts[last]
+
+    # ---- finest windows ----
+    base = levels[0][0]
+    grid = _grid(start, end, base)
+    n_win = len(grid["sess"])
+    w_start = grid["w_start"]
+
+    def _wid(grp, t):
+        # window containing t: last w_start <= t within the same session
+        i = count_before(grid["sess"], w_start, grp, t, inclusive=True) - 1
+        return grid["off"][grp] + i
+
+    # ---- cursor speed at each mousemove (speed at t1 of consecutive pairs) ----
+    mv = df.loc[ev == "mousemove", ["ts", "x", "y"]].dropna()
+    m_sess = sess_code[mv.index.to_numpy()]
+    m_t, m_x, m_y = (mv[c].to_numpy(dtype=float) for c in ("ts", "x", "y"))
+    pair = m_sess[1:] == m_sess[:-1]
+    sp_t = m_t[1:][pair]
+    sp_sess = m_sess[1:][pair]
+    dt = np.maximum(m_t[1:] - m_t[:-1], 1e-6)[pair]
+    sp = np.hypot((m_x[1:] - m_x[:-1])[pair], (m_y[1:] - m_y[:-1])[pair]) / dt
+
+    sp_wid = _wid(sp_sess, sp_t)
+    moves = np.bincount(sp_wid, minlength=n_win)
+    nz = np.maximum(moves, 1)
+    sp_mean = np.bincount(sp_wid, weights=sp, minlength=n_win) / nz
+    sp_m2 = np.bincount(sp_wid, weights=(sp - sp_mean[sp_wid]) ** 2, minlength=n_win)
+
+    # ---- clicks ----
+    ck_rows = np.flatnonzero(ev == "click")
+    c_sess = sess_code[ck_rows]
+    c_t = ts[ck_rows]
+    c_x = df["x"].to_numpy(dtype=float)[ck_rows] if "x" in df else np.full(len(ck_rows), np.nan)
+    c_y = df["y"].to_numpy(dtype=float)[ck_rows] if "y" in df else np.full(len(ck_rows), np.nan)
+    c_wid = _wid(c_sess, c_t)
+
+    # dead: element not actionable (missing element counts as dead)
+    el = df["el"].iloc[ck_rows] if "el" in df else pd.Series([None] * len(ck_rows))
+    el = el.astype(object).where(el.notna(), "").astype(str).str.lower()
+    actionable = el.str.startswith(ACTIONABLE_PREFIXES).to_numpy(dtype=bool)
+
+    # rage: 3 consecutive (t,x,y)-sorted clicks within RAGE_MS and RAGE_RADIUS
+    o = np.lexsort((c_y, c_x, c_t, c_sess))
+    rs, rw, rt, rx, ry = c_sess[o], c_wid[o], c_t[o], c_x[o], c_y[o]
+    burst = (rs[2:] == rs[:-2]) & ((rt[2:] - rt[:-2]) <= RAGE_MS) & \
+            (np.hypot(rx[2:] - rx[:-2], ry[2:] - ry[:-2]) <= RAGE_RADIUS)
+
+    # hover-stall: enough slow cursor samples in the lookback before each click
+    slow = sp < LOW_SPEED
+    slow_sess, slow_t = sp_sess[slow], sp_t[slow]
+    n_slow = (count_before(slow_sess, slow_t, c_sess, c_t)
+              - count_before(slow_sess, slow_t, c_sess, c_t - STALL_LOOKBACK))
+    stalled = (n_slow > 0) & (n_slow * SAMPLE_DT >= STALL_MS)
+
+    # ---- scroll ----
+    sc_rows = np.flatnonzero(ev == "scroll")
+    vy = df["view_y"].to_numpy(dtype=float)[sc_rows] if "view_y" in df else np.full(len(sc_rows), np.nan)
+    has_y = ~np.isnan(vy)
+    vy, sc_rows = vy[has_y], sc_rows[has_y]
+    s_sess, s_t = sess_code[sc_rows], ts[sc_rows]
+    s_wid = _wid(s_sess, s_t)
+    n_sc = np.bincount(s_wid, minlength=n_win)
+
+    # direction flips between consecutive non-zero dy signs of a session, as
+    # spans from the first sample of one step to the last of the next
+    same = s_sess[1:] == s_sess[:-1]
+    d = np.sign(vy[1:] - vy[:-1])[same]
+    d_lo, d_hi, d_sess = s_wid[:-1][same], s_wid[1:][same], s_sess[1:][same]
+    keep = d != 0
+    d, d_lo, d_hi, d_sess = d[keep], d_lo[keep], d_hi[keep], d_sess[keep]
+    flip = (d_sess[1:] == d_sess[:-1]) & (d[1:] != d[:-1])
+
+    # first/last scroll sample of each window
+    f_t, f_vy, l_t, l_vy = (np.zeros(n_win) for _ in range(4))
+    if len(s_wid):
+        seg = np.flatnonzero(np.r_[True, s_wid[1:] != s_wid[:-1]])
+        seg_end = np.r_[seg[1:], len(s_wid)] - 1
+        f_t[s_wid[seg]], f_vy[s_wid[seg]] = s_t[seg], vy[seg]
+        l_t[s_wid[seg]], l_vy[s_wid[seg]] = s_t[seg_end], vy[seg_end]
+
+    st = {
+        "map": np.arange(n_win), "moves": moves, "sp_mean": sp_mean, "sp_m2": sp_m2,
+        "sp_max": _segment_max(sp, sp_wid, n_win),
+        "clicks": np.bincount(c_wid, minlength=n_win),
+        "dead": np.bincount(c_wid[~actionable], minlength=n_win),
+        "stall": np.bincount(c_wid[stalled], minlength=n_win),
+        "n_sc": n_sc, "depth": _segment_max(vy, s_wid, n_win, empty=-np.inf),
+        "f_t": f_t, "f_vy": f_vy, "l_t": l_t, "l_vy": l_vy,
+    }
+    spans = {"rage": (rw[:-2][burst], rw[2:][burst]), "flip": (d_lo[:-1][flip], d_hi[1:][flip])}
+
+    stats, grids, out = {base: st}, {base: grid}, {}
+    for res, parent in levels:
+        if parent is not None:
+            grids[res] = ({"sess": np.arange(n_sess), "off": np.arange(n_sess + 1),
+                           "w_start": start, "i": np.zeros(n_sess, dtype=np.int64)}
+                          if res == SESSION else _grid(start, end, res))
+            k = None if res == SESSION else int(round(res / parent))
+            stats[res] = _rollup(stats[parent], grids[parent], grids[res], k)
+        if res_name(res) in wanted:
+            out[res_name(res)] = _frame(stats[res], grids[res], sess_keys, spans, res, end)
+    return out
+
+def compute_windows(df: pd.DataFrame, window: float = WINDOW) -> pd.DataFrame:
+    """
+    Vectorized window primitives (default 5s) for every session in `df`.
+    Events are binned into per-session windows with a lexsort/searchsorted
+    pass and aggregated with bincount/reduceat, so cost is O(events log events)
+    instead of O(windows × events) per session.
+    """
+    return compute_resolutions(df, (window,))[res_name(window)]
+
+def main():
+    ap = argparse.ArgumentParser(description="Sessionized events → window primitives")
+    ap.add_argument("--workers", type=int, default=1, help=">1: process pool over sess_key shards (every --res)")
+    ap.add_argument("--res", default=res_name(WINDOW),
+                    help="comma-separated resolutions, e.g. 1s,5s,30s,session → windows_{res}.parquet")
+    args = ap.parse_args()
+    resolutions = [parse_res(r) for r in args.res.split(",")]
+    if args.workers > 1:
+        from .parallel import run
+        run(args.workers, metrics=False, resolutions=resolutions)
+        return
+    df = pd.read_parquet(IN_PATH)
+    for name, out in compute_resolutions(df, resolutions).items():
+        path = window_path(parse_res(name))
+        write_frame(out, path)
+        print(f"[feature_primitives] wrote {len(out)} window rows → {path}")
 
 if __name__ == "__main__":
     main()
@@ -1,20 +1,18 @@
-import redis, json, pandas as pd
-from pathlib import Path
+import redis, pandas as pd
 
-r = redis.Redis(host="localhost", port=6379, db=0)
+from .rawstore import write_events
+from ..codec import decode
 
-outdir = Path(__file__).resolve().parent.parent / "../data/parquet"
-outdir.mkdir(parents=True, exist_ok=True)
+r = redis.Redis(host="localhost", port=6379, db=0)
 
 def run_worker():
     buffer = []
     while True:
         _, raw = r.blpop("events")   # blocking pop
-        event = json.loads(raw)
-        buffer.append(event)
+        buffer.extend(decode(raw))
         if len(buffer) >= 10:   # write every 10 events
             df = pd.DataFrame(buffer)
-            df.to_parquet(outdir / "events.parquet", engine="pyarrow", append=True)
+            write_events(df, tag="features")
             print(f"Wrote {len(buffer)} events")
             buffer.clear()
 
@@ -0,0 +1,205 @@
+"""
+Incremental feature pipeline.
+
+Keeps a small state file with the raw parquet files already processed and the
+event-time watermark (max ts seen). Each run reads only the new raw files,
+re-sessionizes and re-windows / re-scores just the sessions that can have
+changed, and rewrites only the sess_key shards (workers/shards.py) of the
+events_sessionized / windows_5s / metrics_5s datasets that hold them; the
+cube gets the metrics change applied (cube.update_cube).
+
+A session can only change if it ends within SESSION_GAP of the earliest new
+event of its (uid, sid) pair: earlier sessions keep their events, their
+boundaries and therefore their sess_key numbering. The session index
+(INDEX_PATH) finds those sessions, and so the shards to read, without
+reading any events.
+
+    python -m server.workers.incremental          # incremental
+    python -m server.workers.incremental --full   # rebuild everything
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as pds
+
+from .sessionize import (RAW_DIR, OUT_DIR, SESSION_GAP, SESSIONS_PATH, raw_files, load_events,
+                         prepare_events, sessionize, session_lookup)
+from .rawstore import compacted_sources
+from .shards import N_SHARDS, shard_ids, shard_layout, read_shard, write_sharded, write_frame, dataset_version
+from .cube import CUBE_DIR, write_cube, update_cube
+from .feature_primitives import OUT_PATH as WIN_PATH, compute_windows
+from .metrics import OUT_PATH as MET_PATH, compute_metrics, write_metrics
+
+SESS_PATH = OUT_DIR / "events_sessionized.parquet"
+STATE_PATH = OUT_DIR / "_incremental_state.json"
+INDEX_PATH = OUT_DIR / "_incremental_sessions.parquet"   # one row per session: sess_key, uid, sid, last_ts
+
+def load_state() -> dict:
+    if STATE_PATH.exists():
+        with open(STATE_PATH) as f:
+            return json.load(f)
+    return {"files": [], "watermark": None}
+
+def save_state(state: dict):
+    tmp = STATE_PATH.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp, STATE_PATH)
+
+def _rel(f: Path) -> str:
+    return str(Path(f).relative_to(RAW_DIR))
+
+def _session_index(sess: pd.DataFrame) -> pd.DataFrame:
+    cols = {"uid": ("uid", "first"), "sid": ("sid", "first"), "last_ts": ("ts", "max")}
+    if "sess_id" in sess.columns:
+        cols["sess_id"] = ("sess_id", "first")
+    return sess.groupby("sess_key", sort=False).agg(**cols).reset_index()
+
+def load_index() -> pd.DataFrame:
+    if INDEX_PATH.exists():
+        return pd.read_parquet(INDEX_PATH)
+    # first incremental run over events written by sessionize.py: one projected pass
+    cols = [c for c in ("sess_key", "uid", "sid", "ts", "sess_id") if c in pds.dataset(SESS_PATH).schema.names]
+    return _session_index(pd.read_parquet(SESS_PATH, columns=cols))
+
+def _renumber(redo: pd.DataFrame, n_clean: pd.Series) -> pd.Series:
+    # sessionize numbers a pair's sessions from 0; these follow its n_clean earlier ones
+    first = redo.drop_duplicates("sess_key")
+    off = n_clean.reindex(pd.MultiIndex.from_frame(first[["uid", "sid"]]), fill_value=0).to_numpy()
+    if not off.any():
+        return redo["sess_key"]
+    head = first["sess_key"].str.rpartition(":")
+    keys = head[0] + ":" + (head[2].astype(np.int64) + off).astype(str)
+    return redo["sess_key"].map(dict(zip(first["sess_key"], keys)))
+
+def _read_shards(path: Path, shards, parts: dict = None) -> dict:
+    # {shard: rows or None}; shards already in `parts` are not read again
+    parts = {} if parts is None else parts
+    for s in shards:
+        if s not in parts:
+            parts[s] = read_shard(path, s)
+    return parts
+
+def _split(parts: dict, drop: set):
+    # (rows not in drop, rows in drop)
+    frames = [p for p in parts.values() if p is not None]
+    if not frames:
+        return pd.DataFrame(), pd.DataFrame()
+    old = pd.concat(frames, ignore_index=True)
+    hit = old["sess_key"].isin(drop).to_numpy()
+    return old[~hit], old[hit]
+
+def _merge(keep: pd.DataFrame, new: pd.DataFrame, by=("sess_key", "w_start")) -> pd.DataFrame:
+    parts = [d for d in (keep, new) if len(d)]
+    out = pd.concat(parts, ignore_index=True) if parts else new
+    return out.sort_values(list(by), kind="mergesort").reset_index(drop=True)
+
+def full_rebuild(files) -> dict:
+    ev = load_events(files)
+    sess = sessionize(ev)
+    w = compute_windows(sess)
+    m = compute_metrics(w)
+    write_sharded(sess, SESS_PATH)
+    write_sharded(w, WIN_PATH)
+    write_sharded(m, MET_PATH, writer=write_metrics)
+    write_cube(m, MET_PATH, cube_dir=CUBE_DIR)
+    write_frame(_session_index(sess), INDEX_PATH)
+    print(f"[incremental] full rebuild: {len(sess)} events, {len(w)} windows")
+    return {"files": [_rel(f) for f in files], "watermark": float(ev["ts"].max())}
+
+def run(full: bool = False):
+    files = raw_files()
+    state = load_state()
+    sharded = all(shard_layout(p) is not None for p in (SESS_PATH, WIN_PATH, MET_PATH))
+    if full or not state["files"] or not sharded:
+        save_state(full_rebuild(files))
+        return
+
+    done = set(state["files"])
+    new_files = [f for f in files if _rel(f) not in done]
+    # compaction output whose sources were all processed carries no new events
+    recompacted = [f for f in new_files if f.name.startswith("compacted-")
+                   and set(compacted_sources(f)) <= done]
+    if recompacted:
+        new_files = [f for f in new_files if f not in recompacted]
+        done.update(_rel(f) for f in recompacted)
+        state["files"] = sorted(f for f in done if (RAW_DIR / f).exists())
+        save_state(state)
+    if not new_files:
+        print("[incremental] no new raw files — nothing to do.")
+        return
+
+    new = load_events(new_files).dropna(subset=["ts"])
+    watermark = state.get("watermark")
+    if len(new) == 0:
+        state["files"] += [_rel(f) for f in new_files]
+        save_state(state)
+        return
+    late = int((new["ts"] < watermark).sum()) if watermark is not None else 0
+
+    # earliest new event per pair minus the gap: sessions ending before it are untouched,
+    # and since a pair's sessions are ordered in time the dirty ones are its last few
+    cutoff = new.groupby(["uid", "sid"])["ts"].min() - SESSION_GAP
+    index = load_index()
+    touched = pd.MultiIndex.from_frame(index[["uid", "sid"]]).isin(cutoff.index)
+    pairs = pd.MultiIndex.from_frame(index.loc[touched, ["uid", "sid"]])
+    is_dirty = np.zeros(len(index), dtype=bool)
+    is_dirty[touched] = index["last_ts"].to_numpy()[touched] >= cutoff.reindex(pairs).to_numpy()
+    dirty_old = set(index["sess_key"][is_dirty])
+    n_clean = index[touched & ~is_dirty].groupby(["uid", "sid"]).size()
+
+    # re-sessionize the dirty sessions' events with the new ones
+    ev_parts = _read_shards(SESS_PATH, np.unique(shard_ids(list(dirty_old))))
+    _, old_dirty = _split(ev_parts, dirty_old)
+    redo_in = old_dirty.drop(columns=["sess_key", "sess_id"], errors="ignore")
+    redo = sessionize(prepare_events(pd.concat([d for d in (redo_in, new) if len(d)], ignore_index=True)))
+    redo["sess_key"] = _renumber(redo, n_clean)
+    with_id = "sess_id" in index.columns
+    if with_id:
+        # known sessions keep their id, new ones get fresh ids (ids of vanished ones are not reused)
+        ids = dict(zip(index["sess_key"], index["sess_id"]))
+        fresh = [k for k in redo["sess_key"].unique() if k not in ids]
+        base = int(index["sess_id"].max()) + 1 if len(index) else 0
+        ids.update(zip(fresh, range(base, base + len(fresh))))
+        redo["sess_id"] = redo["sess_key"].map(ids).astype(np.int32)
+
+    drop = dirty_old | set(redo["sess_key"])
+    shards = np.unique(shard_ids(list(drop)))
+    keep_ev, _ = _split(_read_shards(SESS_PATH, shards, ev_parts), drop)
+    sess = _merge(keep_ev, redo, by=("uid", "sid", "ts"))
+
+    w_new = compute_windows(redo)
+    m_new = compute_metrics(w_new)
+    keep_w, _ = _split(_read_shards(WIN_PATH, shards), drop)
+    keep_m, m_old = _split(_read_shards(MET_PATH, shards), drop)
+    built_from = dataset_version(MET_PATH)
+
+    write_sharded(sess, SESS_PATH, shards=shards)
+    write_sharded(_merge(keep_w, w_new), WIN_PATH, shards=shards)
+    write_sharded(_merge(keep_m, m_new), MET_PATH, shards=shards, writer=write_metrics)
+    if not update_cube(m_old, m_new, built_from, MET_PATH, cube_dir=CUBE_DIR):
+        write_cube(pd.read_parquet(MET_PATH), MET_PATH, cube_dir=CUBE_DIR)
+    index = pd.concat([index[~index["sess_key"].isin(drop)], _session_index(redo)], ignore_index=True)
+    write_frame(index, INDEX_PATH)
+    if with_id:
+        write_frame(session_lookup(index), SESSIONS_PATH)
+
+    state["files"] += [_rel(f) for f in new_files]
+    state["watermark"] = float(np.nanmax([watermark if watermark is not None else -np.inf, new["ts"].max()]))
+    save_state(state)
+    print(f"[incremental] {len(new_files)} new files, {len(new)} events ({late} late), "
+          f"{redo['sess_key'].nunique()} sessions re-windowed → {len(w_new)} windows "
+          f"in {len(shards)}/{N_SHARDS} shards")
+
+def main():
+    ap = argparse.ArgumentParser(description="Incremental sessionize → windows → metrics")
+    ap.add_argument("--full", action="store_true", help="ignore state and rebuild all outputs")
+    args = ap.parse_args()
+    run(full=args.full)
+
+if __name__ == "__main__":
+    main()
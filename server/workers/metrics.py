@@ -1,37 +1,57 @@
 from pathlib import Path
+import argparse
 import pandas as pd
 import numpy as np
+from .shards import write_frame
+from .cube import write_cube
+from .feature_primitives import WINDOW, res_name, parse_res, window_path
 
-IN_PATH = Path(__file__).resolve().parents[2] / "data" / "features" / "windows_5s.parquet"
-OUT_PATH = Path(__file__).resolve().parents[2] / "data" / "metrics" / "metrics_5s.parquet"
+METRICS_DIR = Path(__file__).resolve().parents[2] / "data" / "metrics"
+IN_PATH = window_path(WINDOW)
+OUT_PATH = METRICS_DIR / "metrics_5s.parquet"
+ROW_GROUP_ROWS = 64_000   # small enough that a time filter skips most of a file
+
+def metrics_path(res) -> Path:
+    return METRICS_DIR / f"metrics_{res_name(res)}.parquet"
+
+# UFI and RCS are weighted sums of normalized [0, 1] components; the formula
+# lives here only (analysis/ablation.py evaluates other weightings of it)
+UFI_TERMS = ("rage", "dead", "stall", "osc", "jitter")
+UFI_WEIGHTS = np.array([0.35, 0.20, 0.15, 0.15, 0.15])
+RCS_TERMS = ("calm", "flow")
+RCS_WEIGHTS = np.array([0.6, 0.4])
 
 def sigmoid(x):
     return 1.0 / (1.0 + np.exp(-x))
 
-def main():
-    w = pd.read_parquet(IN_PATH).copy()
+def components(w: pd.DataFrame) -> pd.DataFrame:
+    speed_std = w["speed_std"].fillna(0.0)
+    return pd.DataFrame({
+        "rage": np.clip(w["rage_clicks"] / 2.0, 0, 1),
+        "dead": np.clip(w["dead_clicks"] / 2.0, 0, 1),
+        "stall": np.clip(w["hover_stall"] / 1.0, 0, 1),
+        "osc": np.clip(w["scroll_oscillations"] / 3.0, 0, 1),
+        "jitter": sigmoid(speed_std / 200.0) * (w["clicks"] == 0).astype(float),
+        # RCS: calm cursor and forward scrolling
+        "calm": sigmoid(-speed_std / 150.0),
+        "flow": sigmoid(w["scroll_velocity"].fillna(0.0) / 200.0),
+    }, index=w.index).astype(float)
 
-    # --- UFI components ---
-    rage_c = np.clip(w["rage_clicks"] / 2.0, 0, 1)
-    dead_c = np.clip(w["dead_clicks"] / 2.0, 0, 1)
-    stall_c = np.clip(w["hover_stall"] / 1.0, 0, 1)
-    osc_c = np.clip(w["scroll_oscillations"] / 3.0, 0, 1)
-    jitter_c = sigmoid((w["speed_std"].fillna(0.0)) / 200.0) * (w["clicks"] == 0).astype(float)
+def ufi_score(c_ufi: np.ndarray, weights=UFI_WEIGHTS) -> np.ndarray:
+    # c_ufi [N, UFI_TERMS]; weights [T] → [N], or [K, T] → [N, K]
+    return np.clip(c_ufi @ np.asarray(weights, dtype=float).T, 0, 1)
 
-    ufi = (
-        0.35 * rage_c +
-        0.20 * dead_c +
-        0.15 * stall_c +
-        0.15 * osc_c +
-        0.15 * jitter_c
-    )
-    ufi = np.clip(ufi, 0, 1)
+def rcs_score(c_rcs: np.ndarray, osc: np.ndarray, weights=RCS_WEIGHTS, penalty=1.0) -> np.ndarray:
+    # oscillation penalty scaled by `penalty` (0 drops it); weights [K, T] → [N, K]
+    base = np.clip(c_rcs @ np.asarray(weights, dtype=float).T, 0, 1)
+    pen = np.asarray(penalty, dtype=float)
+    return base * (1.0 - (osc[:, None] if base.ndim == 2 else osc) * pen)
 
-    # --- RCS ---
+def compute_metrics(w: pd.DataFrame) -> pd.DataFrame:
+    c = components(w)
+    ufi = ufi_score(c[list(UFI_TERMS)].to_numpy())
     # higher when speed_std low and scroll_velocity positive & smooth; penalize oscillations
-    rcs = (0.6 * sigmoid(-(w["speed_std"].fillna(0.0)) / 150.0) +
-           0.4 * sigmoid((w["scroll_velocity"].fillna(0.0)) / 200.0))
-    rcs = np.clip(rcs, 0, 1) * (1.0 - np.clip(w["scroll_oscillations"] / 3.0, 0, 1))
+    rcs = rcs_score(c[list(RCS_TERMS)].to_numpy(), c["osc"].to_numpy())
 
     # --- MIV proxy ---
     # decision latency: if clicks>0 in window, we estimate "scroll stop" as low |scroll_velocity|
@@ -39,7 +59,7 @@ def main():
     # NOTE: This is a coarse proxy; later we’ll refine using raw events.
     stopped = (w["scroll_velocity"].abs() < 20.0).astype(float)
     # assume first click happens mid-window when clicks>0; better: carry over click timestamps later
-    approx_first_click_at = w["w_start"] + 2.5
+    approx_first_click_at = w["w_start"] + (w["w_end"] - w["w_start"]) / 2
     miv = np.where(w["clicks"] > 0,
                    np.where(stopped > 0, approx_first_click_at - w["w_start"], np.nan),
                    np.nan)
@@ -56,10 +76,32 @@ def main():
     out["scroll_velocity"] = w["scroll_velocity"]
     out["speed_std"] = w["speed_std"]
     out["clicks"] = w["clicks"]
+    return out
 
-    OUT_PATH.parent.mkdir(parents=True, exist_ok=True)
-    out.to_parquet(OUT_PATH, index=False)
-    print(f"[metrics] wrote {len(out)} rows → {OUT_PATH}")
+def write_metrics(m: pd.DataFrame, path: Path):
+    """
+    Rows in w_start order, ROW_GROUP_ROWS per row group: each row group then
+    covers a narrow time span, and w_start filters on the file (e.g.
+    analysis/baselines_vs_metrics.py) skip the others using their min/max
+    statistics.
+    """
+    m = m.sort_values("w_start", kind="stable")
+    write_frame(m, path, row_group_size=ROW_GROUP_ROWS)
+
+def main():
+    ap = argparse.ArgumentParser(description="Window primitives → UFI/RCS/MIV metrics")
+    ap.add_argument("--res", default=res_name(WINDOW),
+                    help="comma-separated resolutions, windows_{res} → metrics_{res}")
+    args = ap.parse_args()
+    for res in map(parse_res, args.res.split(",")):
+        w = pd.read_parquet(window_path(res))
+        out = compute_metrics(w)
+        path = metrics_path(res)
+        write_metrics(out, path)
+        if path == OUT_PATH:
+            # DP queries (privacy/aggregator.py) run on the 5s metrics
+            write_cube(out, path)
+        print(f"[metrics] wrote {len(out)} rows → {path}")
 
 if __name__ == "__main__":
     main()
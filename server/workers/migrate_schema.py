@@ -0,0 +1,48 @@
+"""
+Rewrite raw event files written before the current schema (server/schema.py).
+
+Each older file is conformed (nested view/perf flattened, ev/el
+dictionary-encoded) and atomically replaced under the same name, keeping its
+row order, row-group size and compaction metadata, so the incremental state
+and compacted-file source lists stay valid. Like compaction, run it between
+incremental runs.
+
+    python -m server.workers.migrate_schema [--dry-run]
+"""
+import argparse
+
+import pyarrow.parquet as pq
+
+from ..schema import SCHEMA_VERSION, schema_version
+from .rawstore import RAW_DIR, SOURCES_KEY, OUTPUTS_KEY, list_files, read_table, _atomic_write
+
+def migrate_file(path) -> int:
+    pf = pq.ParquetFile(path)
+    md = pf.schema_arrow.metadata or {}
+    rows_per_group = pf.metadata.row_group(0).num_rows if pf.metadata.num_row_groups > 1 else None
+    table = read_table(path)
+    keep = {k: md[k] for k in (SOURCES_KEY, OUTPUTS_KEY) if k in md}
+    if keep:
+        table = table.replace_schema_metadata({**table.schema.metadata, **keep})
+    _atomic_write(table, path, row_group_size=rows_per_group)
+    return table.num_rows
+
+def run(root=RAW_DIR, dry_run: bool = False):
+    old = [f for f in list_files(root=root) if schema_version(pq.read_schema(f)) < SCHEMA_VERSION]
+    rows = 0
+    for f in old:
+        if dry_run:
+            print(f"[migrate] would rewrite {f.relative_to(root)}")
+            continue
+        rows += migrate_file(f)
+    if not dry_run:
+        print(f"[migrate] rewrote {len(old)} file(s) to schema v{SCHEMA_VERSION} ({rows} rows) under {root}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Migrate raw event files to the current schema")
+    ap.add_argument("--dry-run", action="store_true", help="list the files that would be rewritten")
+    args = ap.parse_args()
+    run(dry_run=args.dry_run)
+
+if __name__ == "__main__":
+    main()
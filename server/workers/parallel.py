@@ -0,0 +1,106 @@
+"""
+Process-pool windows + metrics over sess_key shards.
+
+events_sessionized is written sharded (workers/shards.py): each task gets a
+shard number, reads only that shard's part, and writes the same part of the
+windows_{res} datasets (5s unless `resolutions` says otherwise) and of
+metrics_5s. Nothing but paths and shard numbers crosses
+the process boundary. The part directories are staged next to the outputs
+and swapped in when every shard has finished; pd.read_parquet reads the
+resulting directories like the single files.
+
+    python -m server.workers.parallel --workers 8
+    python -m server.workers.parallel --bench 1,2,4,8
+"""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from .feature_primitives import (IN_PATH, OUT_PATH as WIN_PATH, WINDOW, compute_resolutions, compute_windows,
+                                 parse_res, res_name, window_path)
+from .metrics import OUT_PATH as MET_PATH, compute_metrics, write_metrics
+from .cube import write_cube
+from .shards import PART, shard_layout, read_shard, write_sharded, mark_sharded, replace_path, remove_path
+
+def _staging(path: Path) -> Path:
+    d = path.with_name(path.name + ".staging")
+    if d.exists():
+        remove_path(d)
+    d.mkdir(parents=True)
+    mark_sharded(d)
+    return d
+
+def _shard_task(in_path, shard, win_dirs, met_dir):
+    # win_dirs: {res name: staging dir}; metrics come from the 5s windows
+    ev = read_shard(in_path, shard)
+    out = compute_resolutions(ev, [parse_res(r) for r in win_dirs])
+    name = PART.format(shard)
+    for res, w in out.items():
+        if len(w):
+            w.to_parquet(Path(win_dirs[res]) / name, index=False)
+    w = out.get(res_name(WINDOW))
+    if met_dir and w is not None and len(w):
+        write_metrics(compute_metrics(w), Path(met_dir) / name)
+    return len(ev), sum(len(w) for w in out.values())
+
+def run(workers: int, in_path: Path = IN_PATH, win_path: Path = WIN_PATH,
+        met_path: Path = MET_PATH, metrics: bool = True, resolutions=(WINDOW,)):
+    layout = shard_layout(in_path)
+    if layout is None:
+        # one-off: rewrite a legacy single file in the sharded layout
+        write_sharded(pd.read_parquet(in_path), in_path)
+        layout = shard_layout(in_path)
+
+    resolutions = list(resolutions) + ([WINDOW] if metrics and WINDOW not in resolutions else [])
+    outs = {res_name(r): win_path if r == WINDOW else window_path(r) for r in resolutions}
+    win_dirs = {name: _staging(path) for name, path in outs.items()}
+    met_dir = _staging(met_path) if metrics else None
+    # resolutions cross the process boundary as their names
+    tasks = [(str(in_path), s, {n: str(d) for n, d in win_dirs.items()}, str(met_dir) if met_dir else None)
+             for s in sorted(layout)]
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        done = list(ex.map(_shard_task, *zip(*tasks))) if tasks else []
+    n_ev = sum(d[0] for d in done); n_w = sum(d[1] for d in done)
+    # keep the outputs readable when there is nothing to window
+    empty = compute_windows(pd.DataFrame(columns=["sess_key", "ts", "ev"]))
+    for d in win_dirs.values():
+        if not any(d.glob("*.parquet")):
+            empty.to_parquet(d / PART.format(0), index=False)
+    if met_dir and not any(met_dir.glob("*.parquet")):
+        compute_metrics(empty).to_parquet(met_dir / PART.format(0), index=False)
+
+    for name, d in win_dirs.items():
+        replace_path(d, outs[name])
+    if met_dir:
+        replace_path(met_dir, met_path)
+        write_cube(pd.read_parquet(met_path), met_path)
+    dt = time.perf_counter() - t0
+    print(f"[parallel] {len(tasks)} shards, {workers} workers: {n_ev} events → {n_w} windows in {dt:.2f}s")
+    return dt
+
+def bench(worker_counts, **kw):
+    rows = []
+    for n in worker_counts:
+        rows.append({"workers": n, "seconds": run(n, **kw)})
+    out = pd.DataFrame(rows)
+    out["speedup"] = out["seconds"].iloc[0] / out["seconds"]
+    print(out.to_string(index=False))
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="Sharded windows/metrics on a process pool")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--no-metrics", action="store_true", help="only write windows_5s")
+    ap.add_argument("--bench", default=None, help="comma-separated worker counts, e.g. 1,2,4,8")
+    args = ap.parse_args()
+    if args.bench:
+        bench([int(x) for x in args.bench.split(",")], metrics=not args.no_metrics)
+    else:
+        run(args.workers, metrics=not args.no_metrics)
+
+if __name__ == "__main__":
+    main()
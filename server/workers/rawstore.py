@@ -0,0 +1,195 @@
+"""
+Raw event store: a hive-partitioned parquet dataset under data/parquet.
+
+    data/parquet/date=2025-09-02/hour=12/part-20250902T125037-<uuid>.parquet
+    data/parquet/date=2025-09-02/hour=12/uid_bucket=07/compacted-20250902T130000-<uuid>.parquet
+
+Partitions come from the event time (UTC). Writers flush into the hour
+partition itself, one file per hour per flush; only compaction splits an
+hour further by a stable crc32 bucket of uid, once its files are merged
+into large ones. File names carry a uuid so concurrent flushes never collide, and files are
+written under a temporary name and renamed into place, so readers only ever
+see complete files. `compacted-*.parquet` files are produced by
+workers/compact.py and list the files they replace (relative to the root) in
+their parquet metadata, together with every output of the same compaction
+write. The sources are hidden only once all of those outputs are in place;
+until then the outputs are hidden instead (see list_files).
+Legacy flat `events_*.parquet` files at the root are still read.
+Files are written in the flat, typed schema of server/schema.py; files from
+before it are conformed on read (workers/migrate_schema.py rewrites them).
+"""
+import json
+import os
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ..schema import SCHEMA_VERSION, EVENT_COLUMNS, conform, from_frame, schema_version
+
+RAW_DIR = Path(__file__).resolve().parents[2] / "data" / "parquet"
+
+UID_BUCKETS = 16
+HOUR = 3600.0
+SOURCES_KEY = b"visageux.sources"
+OUTPUTS_KEY = b"visageux.outputs"   # all files of one compaction write, relative to the root
+READ_THREADS = 8
+
+def uid_bucket(uid: pd.Series) -> np.ndarray:
+    # crc32 is stable across processes (unlike hash()); computed once per distinct uid
+    codes, uniq = pd.factorize(uid.astype(str), sort=False)
+    buckets = np.array([zlib.crc32(u.encode("utf-8")) % UID_BUCKETS for u in uniq], dtype=np.int64)
+    return buckets[codes] if len(uniq) else np.zeros(len(uid), dtype=np.int64)
+
+def partition_dir(date: str, hour: int, bucket: int = None, root: Path = RAW_DIR) -> Path:
+    # bucket None: the hour partition that writers flush into
+    d = root / f"date={date}" / f"hour={hour:02d}"
+    return d if bucket is None else d / f"uid_bucket={bucket:02d}"
+
+def _partition_start(path: Path):
+    # epoch start of the hour partition a file lives in, None for legacy flat files
+    parts = dict(p.split("=", 1) for p in path.parent.parts[-3:] if "=" in p)
+    if "date" not in parts or "hour" not in parts:
+        return None
+    d = datetime.strptime(parts["date"], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return d.timestamp() + int(parts["hour"]) * HOUR
+
+def _atomic_write(table: pa.Table, path: Path, **kw):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".tmp-{path.name}")
+    pq.write_table(table, tmp, **kw)
+    os.replace(tmp, path)
+
+def _name(prefix: str, tag: str = "") -> str:
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    tag = f"-{tag}" if tag else ""
+    return f"{prefix}-{stamp}{tag}-{uuid.uuid4().hex}.parquet"
+
+def write_events(df: pd.DataFrame, tag: str = "", root: Path = RAW_DIR,
+                 prefix: str = "part", sources=None, row_group_size=None, by_uid: bool = False) -> list:
+    """
+    Split a batch by (date, hour) and write one new file per partition; with
+    `by_uid` (compaction) each hour is split further into UID_BUCKETS.
+    `sources` (paths relative to root) is recorded in the file metadata by compaction.
+    """
+    if df.empty:
+        return []
+    df = df.reset_index(drop=True)
+    ts = pd.to_numeric(df["ts"], errors="coerce")
+    when = pd.to_datetime(ts.fillna(0.0), unit="s", utc=True)
+    keys = pd.DataFrame({
+        "date": when.dt.strftime("%Y-%m-%d"),
+        "hour": when.dt.hour.astype(int),
+        "bucket": uid_bucket(df["uid"]) if by_uid else -1,
+    }, index=df.index)
+    events = from_frame(df)
+    groups = keys.groupby(["date", "hour", "bucket"], sort=True).indices
+    paths = [partition_dir(date, int(hour), None if bucket < 0 else int(bucket), root) / _name(prefix, tag)
+             for date, hour, bucket in groups]
+    extra = {}
+    if sources is not None:
+        extra[SOURCES_KEY] = json.dumps(list(sources)).encode("utf-8")
+        extra[OUTPUTS_KEY] = json.dumps([str(p.relative_to(root)) for p in paths]).encode("utf-8")
+    for idx, path in zip(groups.values(), paths):
+        table = events.take(pa.array(idx))
+        if extra:
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}), **extra})
+        _atomic_write(table, path, row_group_size=row_group_size)
+    return paths
+
+def compacted_sources(path: Path) -> list:
+    md = pq.read_schema(path).metadata or {}
+    return json.loads(md.get(SOURCES_KEY, b"[]"))
+
+def _compaction_state(parts, root: Path):
+    """
+    (superseded sources, partial outputs) of the compacted files in `parts`.
+    A compaction write is complete when all its outputs exist; only then are
+    its sources superseded. The outputs of an incomplete write (interrupted
+    run) are partial while any of its sources is still on disk.
+    """
+    superseded, partial = set(), set()
+    for f in parts:
+        if not f.name.startswith("compacted-"):
+            continue
+        md = pq.read_schema(f).metadata or {}
+        sources = [root / s for s in json.loads(md.get(SOURCES_KEY, b"[]"))]
+        outputs = json.loads(md.get(OUTPUTS_KEY, b"[]"))   # files from before OUTPUTS_KEY: []
+        if all((root / o).exists() for o in outputs):
+            superseded.update(sources)
+        elif any(s.exists() for s in sources):
+            partial.add(f)
+    return superseded, partial
+
+def _partition_files(root: Path, start: float = None, end: float = None) -> list:
+    parts = []
+    hot, bucketed = root.glob("date=*/hour=*/*.parquet"), root.glob("date=*/hour=*/uid_bucket=*/*.parquet")
+    for f in sorted([*hot, *bucketed]):
+        if f.name.startswith("."):
+            continue
+        p0 = _partition_start(f)
+        if p0 is not None:
+            if start is not None and p0 + HOUR <= start:
+                continue
+            if end is not None and p0 >= end:
+                continue
+        parts.append(f)
+    return parts
+
+def list_files(start: float = None, end: float = None, root: Path = RAW_DIR) -> list:
+    """
+    All readable raw files, pruned to hour partitions overlapping [start, end).
+    Files merged into a complete compaction (left behind by an interrupted
+    run) are skipped, and so are the outputs of an incomplete one.
+    """
+    legacy = sorted(root.glob("events_*.parquet"))
+    parts = _partition_files(root, start, end)
+    superseded, partial = _compaction_state(parts, root)
+    return [f for f in legacy + parts if f not in superseded and f not in partial]
+
+def partial_compactions(root: Path = RAW_DIR) -> list:
+    """Outputs of interrupted compaction writes; compact.py removes them before rewriting their sources."""
+    return sorted(_compaction_state(_partition_files(root), root)[1])
+
+def time_filters(col: str, start: float = None, end: float = None):
+    # pyarrow filters → row groups are skipped using their min/max statistics
+    flt = []
+    if start is not None: flt.append((col, ">=", float(start)))
+    if end is not None: flt.append((col, "<", float(end)))
+    return flt or None
+
+def parse_time(s):
+    # epoch seconds or ISO-8601 (naive → UTC)
+    if s is None:
+        return None
+    try:
+        return float(s)
+    except ValueError:
+        d = datetime.fromisoformat(s)
+        if d.tzinfo is None:
+            d = d.replace(tzinfo=timezone.utc)
+        return d.timestamp()
+
+def read_table(f: Path, start: float = None, end: float = None, columns=None) -> pa.Table:
+    # one raw file in the current schema; older files are read whole and conformed
+    flt = time_filters("ts", start, end)
+    if schema_version(pq.read_schema(f)) >= SCHEMA_VERSION:
+        return conform(pq.read_table(f, columns=columns, filters=flt))
+    return conform(pq.read_table(f, filters=flt))
+
+def read_files(files, start: float = None, end: float = None, columns=None) -> pd.DataFrame:
+    files = list(files)
+    # parquet decoding releases the GIL; small-file latency overlaps across threads
+    with ThreadPoolExecutor(max_workers=READ_THREADS) as ex:
+        tables = [t for t in ex.map(lambda f: read_table(f, start, end, columns), files) if t.num_rows]
+    if not tables:
+        return pd.DataFrame(columns=columns or EVENT_COLUMNS)
+    # one table → `ev`/`el` come back as a single Categorical each
+    table = pa.concat_tables(tables)
+    return table.select(columns).to_pandas() if columns else table.to_pandas()
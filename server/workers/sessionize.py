@@ -2,46 +2,91 @@ from pathlib import Path
 import pandas as pd
 import numpy as np
 import json
+import argparse
+from .rawstore import RAW_DIR, list_files, read_files
+from .shards import write_sharded, write_frame
+from ..schema import flat_frame
 
-RAW_DIR = Path(__file__).resolve().parents[2] / "data" / "parquet"
 OUT_DIR = Path(__file__).resolve().parents[2] / "data" / "features"
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 SESSION_GAP = 30 * 60  # 30 minutes in seconds
+SESSIONS_PATH = OUT_DIR / "sessions.parquet"  # sess_id lookup (--sess-id)
 
-def load_events() -> pd.DataFrame:
-    files = sorted(RAW_DIR.glob("events_*.parquet"))
+def raw_files(start=None, end=None):
+    return list_files(start, end)
+
+def load_events(files=None, start=None, end=None) -> pd.DataFrame:
+    # start/end (epoch s) prune hour partitions and parquet row groups
+    files = raw_files(start, end) if files is None else list(files)
     if not files:
         raise FileNotFoundError(f"No raw event parquet files in {RAW_DIR}")
-    df = pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
-    # normalize columns that may be missing
-    for col in ["sid","uid","ts","ev","x","y","el","dom","view","aff","perf"]:
-        if col not in df.columns: df[col] = np.nan
+    df = read_files(files, start, end)
+    return prepare_events(df)
+
+def prepare_events(df: pd.DataFrame) -> pd.DataFrame:
+    # canonical flat columns (dict view/perf from in-memory batches are expanded)
+    df = flat_frame(df)
     # ensure numeric
     df["ts"] = pd.to_numeric(df["ts"], errors="coerce")
     # sort
     df = df.sort_values(["uid","sid","ts"], kind="mergesort").reset_index(drop=True)
     return df
 
-def sessionize(df: pd.DataFrame) -> pd.DataFrame:
-    # new session when gap > SESSION_GAP or uid/sid changes
-    grp = df.groupby(["uid","sid"], sort=False)
-    parts = []
-    for (uid,sid), g in grp:
-        g = g.copy()
-        gap = g["ts"].diff().fillna(0.0)
-        new_flag = (gap > SESSION_GAP).astype(int)
-        sess_incr = new_flag.cumsum()
-        g["sess_key"] = g["uid"].astype(str) + "@" + g["sid"].astype(str) + ":" + sess_incr.astype(str)
-        parts.append(g)
-    out = pd.concat(parts, ignore_index=True)
+def sessionize(df: pd.DataFrame, with_id: bool = False) -> pd.DataFrame:
+    """
+    New session when gap > SESSION_GAP or uid/sid changes.
+    Single vectorized pass: session starts are the (uid, sid) group boundaries
+    plus gaps inside a group, and a cumulative sum over them gives an integer
+    session id. sess_key strings are built once per session, not per row.
+    with_id=True also adds a compact int32 `sess_id` (see session_lookup).
+    """
+    code = df.groupby(["uid","sid"], sort=False).ngroup().to_numpy()
+    keep = code >= 0  # rows with missing uid/sid belong to no session
+    if not keep.all() or (np.diff(code) < 0).any():
+        # not grouped yet: stable reorder into groupby order
+        order = np.flatnonzero(keep)[np.argsort(code[keep], kind="stable")]
+        df, code = df.iloc[order], code[order]
+    out = df.copy(deep=False)
+    out.index = pd.RangeIndex(len(out))
+    if len(out) == 0:
+        out["sess_key"] = pd.Series([], dtype=object)
+        if with_id: out["sess_id"] = np.zeros(0, dtype=np.int32)
+        return out
+
+    ts = out["ts"].to_numpy(dtype=float)
+    grp_start = np.r_[True, code[1:] != code[:-1]]
+    gap_break = np.r_[False, (ts[1:] - ts[:-1]) > SESSION_GAP] & ~grp_start
+    sess_start = grp_start | gap_break
+    sess_id = np.cumsum(sess_start) - 1
+    # per-pair session counter: gap breaks since the pair's first row
+    brk = np.cumsum(gap_break)
+    incr = brk - np.maximum.accumulate(np.where(grp_start, brk, 0))
+
+    starts = np.flatnonzero(sess_start)
+    keys = (out["uid"].iloc[starts].astype(str).to_numpy(dtype=object) + "@"
+            + out["sid"].iloc[starts].astype(str).to_numpy(dtype=object) + ":"
+            + incr[starts].astype(str).astype(object))
+    out["sess_key"] = keys[sess_id]
+    if with_id:
+        out["sess_id"] = sess_id.astype(np.int32)
     return out
 
+def session_lookup(sess: pd.DataFrame) -> pd.DataFrame:
+    """sess_id → sess_key/uid/sid table for frames produced with with_id=True."""
+    first = sess.drop_duplicates("sess_id")
+    return first[["sess_id","sess_key","uid","sid"]].sort_values("sess_id").reset_index(drop=True)
+
 def main():
+    ap = argparse.ArgumentParser(description="Raw events → sessionized events")
+    ap.add_argument("--sess-id", action="store_true", help="add int sess_id and write sessions.parquet lookup")
+    args = ap.parse_args()
     df = load_events()
-    sess = sessionize(df)
+    sess = sessionize(df, with_id=args.sess_id)
     path = OUT_DIR / "events_sessionized.parquet"
-    sess.to_parquet(path, index=False)
+    write_sharded(sess, path)
+    if args.sess_id:
+        write_frame(session_lookup(sess), SESSIONS_PATH)
     print(f"[sessionize] wrote {len(sess)} rows → {path}")
 
 if __name__ == "__main__":
@@ -0,0 +1,121 @@
+"""
+Sharded parquet layout for per-session stages.
+
+Rows are assigned to one of N_SHARDS by a stable hash of sess_key and each
+shard is its own file, `<dataset>/part-NNNNN.parquet` (SHARDS_FILE records the
+key and shard count). A worker reads only its shard's part, and incremental
+runs rewrite only the parts whose sessions changed. pd.read_parquet reads the
+directory like a single file.
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+N_SHARDS = 64
+ROW_GROUP_ROWS = 256_000
+SHARDS_FILE = "_shards.json"   # "_" prefix: skipped by parquet dataset readers
+PART = "part-{:05d}.parquet"
+
+def shard_ids(keys, n_shards: int = N_SHARDS) -> np.ndarray:
+    # pandas' hash uses a fixed key → identical in every process
+    h = pd.util.hash_pandas_object(pd.Series(keys).astype(str), index=False).to_numpy()
+    return (h % np.uint64(n_shards)).astype(np.int64)
+
+def part_path(path: Path, shard: int) -> Path:
+    return Path(path) / PART.format(shard)
+
+def mark_sharded(path: Path, key: str = "sess_key", n_shards: int = N_SHARDS):
+    # a directory of parts written shard by shard (shard_layout)
+    (Path(path) / SHARDS_FILE).write_text(json.dumps({"key": key, "n_shards": n_shards}))
+
+def _write_part(df: pd.DataFrame, path: Path, row_group_rows: int):
+    df.to_parquet(path, index=False, row_group_size=row_group_rows)
+
+def write_sharded(df: pd.DataFrame, path: Path, key: str = "sess_key", n_shards: int = N_SHARDS,
+                  row_group_rows: int = ROW_GROUP_ROWS, shards=None, writer=None):
+    """
+    Write `df` as one part per shard of `key`. With `shards`, only those parts
+    of an existing dataset are replaced (each atomically; a shard without rows
+    loses its part) and `df` must hold exactly their rows. Without, the whole
+    dataset is staged and swapped in. `writer(frame, file)` writes one part.
+    """
+    path = Path(path)
+    writer = writer or (lambda part, f: _write_part(part, f, row_group_rows))
+    shard = shard_ids(df[key], n_shards)
+    order = np.argsort(shard, kind="stable")
+    bounds = np.searchsorted(shard[order], np.arange(n_shards + 1), side="left")
+    df = df.iloc[order]
+
+    if shards is None:
+        out = path.with_name(path.name + ".tmp")
+        if out.exists():
+            remove_path(out)
+        out.mkdir(parents=True)
+        mark_sharded(out, key, n_shards)
+        todo = [s for s in range(n_shards) if bounds[s + 1] > bounds[s]] or [0]   # keep it readable
+    else:
+        out, todo = path, sorted(set(int(s) for s in shards))
+    for s in todo:
+        part = df.iloc[int(bounds[s]):int(bounds[s + 1])]
+        f = part_path(out, s)
+        if len(part) or shards is None:
+            tmp = f.with_name("." + f.name + ".tmp")   # hidden from readers until renamed
+            writer(part.reset_index(drop=True), tmp)
+            os.replace(tmp, f)
+        elif f.exists():
+            f.unlink()
+    if shards is None:
+        replace_path(out, path)
+
+def replace_path(src: Path, dst: Path):
+    """
+    Move src into place at dst. File → file is a single atomic rename; when
+    either side is a dataset directory the old dst is moved aside first.
+    """
+    src, dst = Path(src), Path(dst)
+    if dst.exists() and (dst.is_dir() or src.is_dir()):
+        old = dst.with_name(dst.name + ".old")
+        if old.exists():
+            remove_path(old)
+        os.replace(dst, old)
+        os.replace(src, dst)
+        remove_path(old)
+    else:
+        os.replace(src, dst)
+
+def remove_path(p: Path):
+    shutil.rmtree(p) if p.is_dir() else p.unlink()
+
+def write_frame(df: pd.DataFrame, path: Path, **kw):
+    # single-file output that may replace a sharded dataset directory (kw → to_parquet)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    df.to_parquet(tmp, index=False, **kw)
+    replace_path(tmp, path)
+
+def dataset_version(path: Path) -> tuple:
+    """Cheap change token for a parquet file or a directory of parts."""
+    path = Path(path)
+    st = os.stat(path)
+    if not path.is_dir():
+        return (st.st_mtime_ns, st.st_size)
+    parts = [os.stat(p) for p in path.glob("*.parquet")]
+    return (st.st_mtime_ns, len(parts), max((p.st_mtime_ns for p in parts), default=0),
+            sum(p.st_size for p in parts))
+
+def shard_layout(path: Path, n_shards: int = N_SHARDS):
+    """{shard: part file} of a dataset written by write_sharded, or None (legacy single file)."""
+    meta = Path(path) / SHARDS_FILE
+    if not meta.exists() or json.loads(meta.read_text())["n_shards"] != n_shards:
+        return None
+    return {s: f for s in range(n_shards) if (f := part_path(path, s)).exists()}
+
+def read_shard(path: Path, shard: int, columns=None) -> pd.DataFrame:
+    """One shard's rows (None when the shard has no part)."""
+    f = part_path(path, shard)
+    return pd.read_parquet(f, columns=columns) if f.exists() else None
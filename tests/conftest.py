@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# run from anywhere: `python -m pytest tests`
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,108 @@
+"""
+DP aggregate inputs: filter pushdown against pandas, and the in-memory
+metrics snapshot (memoized statistics, atomic swap on a new file version).
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as pds
+import pytest
+
+from server.privacy import aggregator
+from server.privacy.aggregator import MetricsCache, pushdown_filter
+from server.workers.metrics import write_metrics
+
+T0 = 1_750_032_000.0   # a day boundary (UTC)
+HOUR, DAY = 3600.0, 86400.0
+
+def _metrics(n=5000, seed=0, shift=0.0):
+    rng = np.random.default_rng(seed)
+    w = T0 + np.sort(rng.uniform(-DAY, 2 * DAY, n)) + shift
+    return pd.DataFrame({"sess_key": rng.choice([f"u{i}@s:0" for i in range(20)], n), "w_start": w, "w_end": w + 5.0,
+                         "UFI": rng.uniform(0, 1, n), "RCS": rng.uniform(0, 1, n), "MIV": rng.uniform(0, 5, n),
+                         "clicks": rng.integers(0, 4, n)})
+
+def _filtered(df, **kw):
+    t = pa.Table.from_pandas(df, preserve_index=False)
+    out = pds.dataset(t).to_table(filter=pushdown_filter(t.schema, **kw)).to_pandas()
+    return out.sort_values(["w_start", "sess_key"]).reset_index(drop=True)
+
+@pytest.mark.parametrize("kw, mask", [
+    ({}, lambda d: np.ones(len(d), bool)),
+    ({"start": T0}, lambda d: d.w_start >= T0),
+    ({"end": T0 + 5 * HOUR}, lambda d: d.w_start < T0 + 5 * HOUR),
+    ({"start": T0 - 7.5, "end": T0 + 99.5}, lambda d: (d.w_start >= T0 - 7.5) & (d.w_start < T0 + 99.5)),
+    ({"where": {"sess_key": "u3@s:0"}}, lambda d: d.sess_key == "u3@s:0"),
+    ({"where": {"clicks": "2"}}, lambda d: d.clicks == 2),
+    ({"where": {"hour": T0 + 3 * HOUR}}, lambda d: np.floor(d.w_start / HOUR) * HOUR == T0 + 3 * HOUR),
+    ({"where": {"day": T0}, "start": T0 + HOUR}, lambda d: (np.floor(d.w_start / DAY) * DAY == T0)
+                                                         & (d.w_start >= T0 + HOUR)),
+])
+def test_pushdown_filter_matches_pandas(kw, mask):
+    df = _metrics()
+    ref = df[mask(df)].sort_values(["w_start", "sess_key"]).reset_index(drop=True)
+    assert len(ref) > 0 or not kw
+    pd.testing.assert_frame_equal(_filtered(df, **kw), ref, check_dtype=False)
+
+def test_pushdown_filter_rejects_bad_filters():
+    schema = pa.Table.from_pandas(_metrics(10), preserve_index=False).schema
+    for where in ({"hour": T0 + 1.0}, {"page": "x"}, {"clicks": "many"}):
+        with pytest.raises(ValueError):
+            pushdown_filter(schema, where=where)
+
+@pytest.fixture
+def scans(monkeypatch):
+    # parquet reads (datasets opened from a path, not from the in-memory table)
+    calls = []
+    real = aggregator.ds.dataset
+    def dataset(source, *a, **kw):
+        if not isinstance(source, pa.Table):
+            calls.append(source)
+        return real(source, *a, **kw)
+    monkeypatch.setattr(aggregator.ds, "dataset", dataset)
+    return calls
+
+def test_queries_are_served_from_the_snapshot(tmp_path, scans):
+    path = tmp_path / "metrics_5s.parquet"
+    df = _metrics()
+    write_metrics(df, path)
+    cache = MetricsCache(path)
+    clips = [("UFI", 0.0, 1.0), ("MIV", 0.0, 5.0)]
+    first = cache.batch_stats(["sess_key"], clips)
+    assert cache.batch_stats(["sess_key"], clips) is first        # memo hit
+    # a cold query (new range and filter) filters the snapshot, no parquet read
+    hour = cache.batch_stats(["hour"], clips[:1], start=T0, end=T0 + DAY, where={"clicks": 1})
+    assert len(scans) == 1 and cache.loads == 1
+    ref = df[(df.w_start >= T0) & (df.w_start < T0 + DAY) & (df.clicks == 1)]
+    assert hour["rows"].sum() == len(ref)
+    np.testing.assert_allclose(hour["sum0"].sum(), ref["UFI"].sum())
+    assert first["rows"].sum() == len(df)
+
+def test_new_version_swaps_atomically(tmp_path):
+    path = tmp_path / "metrics_5s.parquet"
+    old, new = _metrics(4000, seed=1), _metrics(6000, seed=2)
+    write_metrics(old, path)
+    cache = MetricsCache(path)
+    cache.batch_stats(["day"], [("UFI", 0.0, 1.0)])
+    seen, stop = set(), threading.Event()
+
+    def query():
+        while not stop.is_set():
+            seen.add(int(cache.batch_stats(["day"], [("UFI", 0.0, 1.0)])["rows"].sum()))
+
+    threads = [threading.Thread(target=query) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for i in range(6):
+        write_metrics(new if i % 2 == 0 else old, path)
+        cache.get()
+    stop.set()
+    for t in threads:
+        t.join()
+    # every answer came from one complete table, and the memo was cleared on each swap
+    assert seen <= {len(old), len(new)}
+    assert cache.loads >= 2
+    assert int(cache.batch_stats(["day"], [("UFI", 0.0, 1.0)])["rows"].sum()) == len(old)
+    assert len(cache._stats) == 1
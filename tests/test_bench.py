@@ -0,0 +1,14 @@
+"""
+bench.run streams the generated events into shards: the stage row counts do
+not depend on how many shards the run is split into.
+"""
+from server.analysis import bench
+
+def test_sharded_run_matches_single_shard(tmp_path, monkeypatch):
+    one = bench.run(20_000, seed=1, out=tmp_path / "one.json")
+    monkeypatch.setattr(bench, "SHARD_EVENTS", 5_000)
+    four = bench.run(20_000, seed=1, out=tmp_path / "four.json")
+    assert (one["meta"]["shards"], four["meta"]["shards"]) == (1, 4)
+    rows = lambda r: {k: v["rows"] for k, v in r["stages"].items()}
+    assert rows(four) == rows(one)
+    assert rows(one)["generate"] > 0 and rows(one)["inference"] > 0
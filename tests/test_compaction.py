@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from server.workers import compact, rawstore
+from server.workers.rawstore import list_files, read_files
+
+HOUR = 3600.0
+
+def _legacy(root, n_hours=4):
+    # one flat legacy file whose rows fall into n_hours partitions
+    df = pd.DataFrame({"sid": "s", "uid": "u", "ts": [1_700_000_000.0 + h * HOUR for h in range(n_hours)],
+                       "ev": "click", "x": 1.0, "y": 2.0})
+    path = root / "events_legacy.parquet"
+    df.to_parquet(path, index=False)
+    return path
+
+@pytest.fixture
+def no_state(monkeypatch):
+    monkeypatch.setattr(compact, "load_state", lambda: {"files": [], "watermark": None})
+
+def test_interrupted_compaction_keeps_sources_visible(tmp_path, monkeypatch, no_state):
+    legacy = _legacy(tmp_path)
+    real_write, calls = rawstore._atomic_write, []
+
+    def crash_after_two(table, path, **kw):
+        if len(calls) == 2:
+            raise RuntimeError("killed")
+        calls.append(path)
+        real_write(table, path, **kw)
+
+    monkeypatch.setattr(rawstore, "_atomic_write", crash_after_two)
+    with pytest.raises(RuntimeError):
+        compact._rewrite([legacy], compact.ROW_GROUP_BYTES, root=tmp_path)
+    monkeypatch.setattr(rawstore, "_atomic_write", real_write)
+
+    # two of four outputs are in place: they are hidden, the legacy file is not
+    assert legacy.exists() and len(calls) == 2
+    assert list_files(root=tmp_path) == [legacy]
+    assert len(read_files(list_files(root=tmp_path))) == 4
+
+    compact.run(root=tmp_path)
+    files = list_files(root=tmp_path)
+    assert not legacy.exists()
+    assert len(files) == 4 and all(f.name.startswith("compacted-") for f in files)
+    assert not any(p.exists() for p in calls)      # partial outputs removed
+    assert sorted(read_files(files)["ts"]) == [1_700_000_000.0 + h * HOUR for h in range(4)]
+
+def test_missing_output_hides_the_whole_write(tmp_path):
+    # a compaction write whose source is still on disk loses one of its four
+    # outputs: the other three stay hidden and the source is read instead
+    legacy = _legacy(tmp_path)
+    out = rawstore.write_events(read_files([legacy]), root=tmp_path, prefix="compacted",
+                                sources=[legacy.name])
+    assert len(out) == 4 and list_files(root=tmp_path) == out
+    out[1].unlink()
+    assert list_files(root=tmp_path) == [legacy]
+    assert len(read_files(list_files(root=tmp_path))) == 4
+
+def test_complete_compaction_supersedes_sources(tmp_path, no_state):
+    legacy = _legacy(tmp_path, n_hours=2)
+    out = compact._rewrite([legacy], compact.ROW_GROUP_BYTES, root=tmp_path)
+    assert not legacy.exists() and list_files(root=tmp_path) == sorted(out)
+    # a sibling merged on later (sources gone) leaves the other output valid
+    out[0].unlink()
+    assert list_files(root=tmp_path) == [out[1]]
+
+def test_hot_writes_are_bucketed_only_by_compaction(tmp_path, no_state):
+    # 40 users in one hour: one file per flush, split by uid only when compacted
+    df = pd.DataFrame({"sid": "s", "uid": [f"u{i}" for i in range(40)],
+                       "ts": 1_700_000_000.0 + np.arange(40.0), "ev": "click"})
+    hot = [rawstore.write_events(df.iloc[i::2], root=tmp_path) for i in range(2)]
+    assert [len(p) for p in hot] == [1, 1] and hot[0][0].parent == hot[1][0].parent
+    assert hot[0][0].parent.name.startswith("hour=")
+
+    compact.run(root=tmp_path)
+    files = list_files(root=tmp_path)
+    assert all(f.name.startswith("compacted-") and f.parent.name.startswith("uid_bucket=") for f in files)
+    assert len({f.parent for f in files}) == len(set(rawstore.uid_bucket(df["uid"])))
+    assert sorted(read_files(files)["uid"]) == sorted(df["uid"])
@@ -0,0 +1,41 @@
+"""
+prepare() gives the same training arrays whether windows_5s is sharded like
+the events, a single file (split by shard in one pass), or the events are a
+legacy single file.
+"""
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+from server.models.dataset import prepare
+from server.synthetic.scale import generate
+from server.workers.feature_primitives import compute_windows
+from server.workers.sessionize import prepare_events, sessionize
+from server.workers.shards import write_sharded
+
+ARRAYS = ("X.npy", "y.npy", "sessions.npy")
+
+def _by_session(out):
+    # sessions as (labels, is_val, features), comparable whatever order they were written in
+    X, Y, S = (np.load(out / a) for a in ARRAYS)
+    return sorted((tuple(Y[a:a + n]), v, X[a:a + n].round(6).tobytes()) for a, n, v in S)
+
+def test_prepare_is_layout_independent(tmp_path):
+    sess = sessionize(prepare_events(generate(20000, seed=2)))
+    w = compute_windows(sess)
+    write_sharded(sess, tmp_path / "ev_sharded")
+    sess.to_parquet(tmp_path / "ev.parquet", index=False)
+    write_sharded(w, tmp_path / "win_sharded")
+    w.to_parquet(tmp_path / "win.parquet", index=False)
+
+    metas = {}
+    for name, ev, win in [("sharded", "ev_sharded", "win_sharded"), ("bucketed", "ev_sharded", "win.parquet"),
+                          ("legacy", "ev.parquet", "win.parquet")]:
+        metas[name] = prepare(out_dir=tmp_path / name, win_path=tmp_path / win, ev_path=tmp_path / ev)
+    assert {m["n_windows"] for m in metas.values()} == {len(w)}
+    assert not (tmp_path / "bucketed" / "_windows_by_shard").exists()
+    # the sharded layouts visit sessions in the same order
+    for a in ARRAYS:
+        np.testing.assert_array_equal(np.load(tmp_path / "sharded" / a), np.load(tmp_path / "bucketed" / a))
+    assert _by_session(tmp_path / "sharded") == _by_session(tmp_path / "legacy")
@@ -0,0 +1,144 @@
+"""
+Redis → parquet writers (workers/events_writer.py) against fakeredis.
+"""
+import json
+import time
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from server.streams import xadd_events
+from server.workers import events_writer
+from server.workers.rawstore import list_files, read_files
+
+def _event(i):
+    return {"sid": "s", "uid": f"u{i % 7}", "ts": 1_750_000_000.0 + i, "ev": "click", "x": 1, "y": 2}
+
+class Stop(Exception):
+    pass
+
+def test_list_mode_arrow_closes_every_batch_before_popping_more(tmp_path, monkeypatch):
+    client = fakeredis.FakeRedis()
+    client.rpush(events_writer.QUEUE_NAME, *[json.dumps(_event(i)) for i in range(35)])
+    monkeypatch.setattr(events_writer, "r", client)
+    monkeypatch.setattr(events_writer, "OUTDIR", tmp_path)
+    monkeypatch.setattr(events_writer, "ARROW_BATCH", 10)
+    real_blpop, checked = client.blpop, []
+
+    def blpop(key, timeout=0):
+        item = real_blpop(key, timeout=0.01)
+        if item is None:
+            # queue drained: whatever was popped must already be in finished files,
+            # a SIGKILL here would lose nothing
+            assert not list(tmp_path.rglob(".tmp-*"))
+            checked.append(len(read_files(list_files(root=tmp_path))))
+            raise Stop
+        return item
+
+    monkeypatch.setattr(client, "blpop", blpop)
+    with pytest.raises(Stop):
+        events_writer.run_arrow()
+    assert checked == [35]
+
+# ---------- stream mode ----------
+
+@pytest.fixture
+def stream(tmp_path, monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(events_writer, "OUTDIR", tmp_path)
+    return lambda: fakeredis.FakeRedis(server=server)
+
+def _fill(client, n, start=0):
+    xadd_events(client, [json.dumps(_event(i)).encode() for i in range(start, start + n)])
+
+def _writer(client, name, **kw):
+    kw = {"batch_size": 10, "flush_seconds": 3600, "block_ms": 1, "claim_idle_ms": 50, **kw}
+    return events_writer.StreamWriter(client, name, **kw)
+
+def _stored(root):
+    files = list_files(root=root)
+    return read_files(files)["ts"].tolist() if files else []
+
+def _pending(client):
+    return client.xpending(events_writer.STREAM_KEY, events_writer.GROUP)["pending"]
+
+def _crash_on_flush(monkeypatch):
+    def crash(*a, **kw):
+        raise Stop
+    monkeypatch.setattr(events_writer, "write_batch", crash)
+
+def test_crash_before_ack_leaves_entries_pending(stream, tmp_path, monkeypatch):
+    client = stream()
+    w = _writer(client, "a")
+    _fill(client, 25)
+    _crash_on_flush(monkeypatch)
+    with pytest.raises(Stop):
+        w.poll()
+    assert _pending(client) == 25 and _stored(tmp_path) == []
+
+def test_reclaim_after_idle(stream, tmp_path, monkeypatch):
+    client = stream()
+    dead = _writer(client, "dead")
+    _fill(client, 25)
+    real = events_writer.write_batch
+    _crash_on_flush(monkeypatch)
+    with pytest.raises(Stop):
+        dead.poll()
+    monkeypatch.setattr(events_writer, "write_batch", real)
+
+    live = _writer(client, "live", claim_idle_ms=60_000)
+    live.reclaim()
+    assert live.ids == []                    # not idle long enough yet
+    live.claim_idle_ms = 50
+    time.sleep(0.06)
+    live.reclaim()
+    live.flush()
+    assert _pending(client) == 0 and client.xlen(events_writer.STREAM_KEY) == 0
+    assert sorted(_stored(tmp_path)) == [_event(i)["ts"] for i in range(25)]
+
+def test_resume_picks_up_own_pending(stream, tmp_path, monkeypatch):
+    client = stream()
+    w = _writer(client, "a")
+    _fill(client, 25)
+    real = events_writer.write_batch
+    _crash_on_flush(monkeypatch)
+    with pytest.raises(Stop):
+        w.poll()
+    monkeypatch.setattr(events_writer, "write_batch", real)
+    again = _writer(client, "a")             # restart under the same name
+    again.resume()
+    again.flush()
+    assert _pending(client) == 0 and len(_stored(tmp_path)) == 25
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_consumers_write_every_entry_exactly_once(stream, tmp_path, monkeypatch, arrow):
+    n = 600
+    writers = [_writer(stream(), f"w{i}", read_count=37, arrow=arrow) for i in range(3)]
+    _fill(stream(), n)
+    # w0 dies holding a batch: its entries stay pending until the others reclaim them
+    real_flush = events_writer.StreamWriter.flush
+    def dying_flush(self):
+        if self.consumer == "w0":
+            raise Stop
+        real_flush(self)
+    monkeypatch.setattr(events_writer.StreamWriter, "flush", dying_flush)
+    with pytest.raises(Stop):
+        writers[0].poll()
+    assert len(writers[0].ids) == 37
+    monkeypatch.setattr(events_writer.StreamWriter, "flush", real_flush)
+    alive = writers[1:]
+    client = stream()
+    deadline = time.time() + 30
+    while client.xlen(events_writer.STREAM_KEY) and time.time() < deadline:
+        for w in alive:
+            w.poll()
+            w.flush()
+        if client.xlen(events_writer.STREAM_KEY) == _pending(client):
+            # only w0's entries are left: wait them idle, then reclaim
+            time.sleep(0.06)
+            alive[0].reclaim()
+            alive[0].flush()
+    ts = _stored(tmp_path)
+    assert _pending(client) == 0 and client.xlen(events_writer.STREAM_KEY) == 0
+    assert len(ts) == n and sorted(ts) == [_event(i)["ts"] for i in range(n)]
@@ -0,0 +1,116 @@
+"""
+The vectorized window engine against the original per-session loop
+(tests/baseline_windows.py) on small synthetic fixtures and the committed
+sample sessions, and the rolled-up resolutions of compute_resolutions
+against compute_windows run directly at each resolution.
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from server.synthetic.scale import generate
+from server.workers.feature_primitives import (SESSION, WINDOW_COLUMNS, compute_resolutions, compute_windows,
+                                              res_name)
+from server.workers.sessionize import prepare_events, sessionize
+from server.workers.shards import write_sharded
+from server.workers import parallel
+
+from baseline_windows import baseline_windows
+
+SAMPLE = Path(__file__).resolve().parents[1] / "data" / "features" / "events_sessionized.parquet"
+
+def _with_view(sess: pd.DataFrame) -> pd.DataFrame:
+    # the baseline reads scroll y from the pre-flat `view` dict
+    if "view" in sess:
+        return sess
+    out = sess.copy()
+    out["view"] = [None if pd.isna(v) else {"y": float(v)} for v in out["view_y"]]
+    return out
+
+def _assert_parity(sess: pd.DataFrame):
+    keys = ["sess_key", "w_start"]
+    new = compute_windows(sess)[WINDOW_COLUMNS].sort_values(keys).reset_index(drop=True)
+    old = baseline_windows(_with_view(sess))[WINDOW_COLUMNS].sort_values(keys).reset_index(drop=True)
+    assert len(new) > 0
+    pd.testing.assert_frame_equal(new, old, check_dtype=False, rtol=1e-9, atol=1e-9)
+
+@pytest.mark.parametrize("seed", [0, 7])
+def test_windows_match_baseline_on_synthetic(seed):
+    _assert_parity(sessionize(prepare_events(generate(6000, seed=seed))))
+
+@pytest.mark.skipif(not SAMPLE.exists(), reason="no sample sessions")
+def test_windows_match_baseline_on_sample():
+    _assert_parity(pd.read_parquet(SAMPLE))
+
+def _sorted(df):
+    return df[WINDOW_COLUMNS].sort_values(["sess_key", "w_start"]).reset_index(drop=True)
+
+def _assert_rollup_parity(sess: pd.DataFrame):
+    # 30s rolls up from 5s, session from 30s: means/stds through the Chan
+    # merge, counts by summing, rage/flip bursts by their window spans
+    out = compute_resolutions(sess, (5.0, 30.0, SESSION))
+    rolled, direct = _sorted(out["30s"]), _sorted(compute_windows(sess, 30.0))
+    assert len(direct) < len(out["5s"])
+    pd.testing.assert_frame_equal(rolled, direct, check_dtype=False, rtol=1e-9, atol=1e-9)
+
+    # one window longer than any session is the session computed directly
+    # (w_end differs: the session frame ends at its last event)
+    rolled = _sorted(out["session"])
+    direct = _sorted(compute_windows(sess, 1e7))
+    assert len(rolled) == sess["sess_key"].nunique()
+    cols = [c for c in WINDOW_COLUMNS if c != "w_end"]
+    pd.testing.assert_frame_equal(rolled[cols], direct[cols], check_dtype=False, rtol=1e-9, atol=1e-9)
+    last = sess.groupby("sess_key")["ts"].max()
+    assert (rolled["w_end"].to_numpy() == last.loc[rolled["sess_key"]].to_numpy()).all()
+    return out
+
+def _handmade(n_sess: int = 3, secs: float = 70.0) -> pd.DataFrame:
+    # 20Hz cursor alternating slow (stalls) and fast stretches, a click every
+    # 2.5s plus rage triplets and scroll direction flips that straddle the
+    # 5s/30s window edges
+    rows = []
+    for k in range(n_sess):
+        t0, key, x = 1000.0 + 500 * k, f"u{k}@s{k}:0", 100.0
+        for i in range(int(secs / 0.05)):
+            x += 1.0 if (i // 40) % 2 else 8.0 + k
+            rows.append((key, t0 + i * 0.05, "mousemove", x, 300.0, None, None))
+        for i, t in enumerate(np.arange(1.2, secs, 2.5)):
+            rows.append((key, t0 + t, "click", 200.0, 300.0, "button#ok" if i % 3 else "div#x", None))
+        for t in (4.8, 29.8, 59.9):
+            rows += [(key, t0 + t + d, "click", 400.0, 200.0, "div#dead", None) for d in (0.0, 0.2, 0.4)]
+        for i in range(int(secs)):
+            y = i % 7 if (i // 7) % 2 else 7 - i % 7
+            rows.append((key, t0 + i + 0.5, "scroll", None, None, None, 100.0 * y))
+    return pd.DataFrame(rows, columns=["sess_key", "ts", "ev", "x", "y", "el", "view_y"])
+
+def test_rollups_match_direct_windows_on_handmade_sessions():
+    out = _assert_rollup_parity(_handmade())
+    # every rolled-up statistic is exercised, and bursts across window edges
+    # count only at the resolutions whose windows hold them whole
+    for c in ("speed_std", "rage_clicks", "scroll_oscillations", "hover_stall", "dead_clicks"):
+        assert (out["30s"][c] > 0).any(), c
+    for c in ("rage_clicks", "scroll_oscillations"):
+        assert out["5s"][c].sum() < out["30s"][c].sum() <= out["session"][c].sum(), c
+
+@pytest.mark.parametrize("seed", [0, 7])
+def test_rollups_match_direct_windows_on_synthetic(seed):
+    _assert_rollup_parity(sessionize(prepare_events(generate(6000, seed=seed))))
+
+@pytest.mark.skipif(not SAMPLE.exists(), reason="no sample sessions")
+def test_rollups_match_direct_windows_on_sample():
+    _assert_rollup_parity(pd.read_parquet(SAMPLE))
+
+def test_workers_write_every_resolution(tmp_path, monkeypatch):
+    # --workers N --res 5s,30s,session: the shard pool writes what one pass does
+    monkeypatch.setattr(parallel, "window_path", lambda res: tmp_path / f"windows_{res_name(res)}.parquet")
+    sess = sessionize(prepare_events(generate(6000, seed=3)))
+    write_sharded(sess, tmp_path / "sess.parquet")
+    parallel.run(2, in_path=tmp_path / "sess.parquet", win_path=tmp_path / "w5.parquet",
+                 met_path=tmp_path / "m5.parquet", metrics=False, resolutions=(5.0, 30.0, SESSION))
+    want = compute_resolutions(sess, (5.0, 30.0, SESSION))
+    outputs = {"5s": "w5.parquet", "30s": "windows_30s.parquet", "session": "windows_session.parquet"}
+    for name, path in outputs.items():
+        pd.testing.assert_frame_equal(_sorted(pd.read_parquet(tmp_path / path)), _sorted(want[name]),
+                                      check_dtype=False)
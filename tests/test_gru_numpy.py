@@ -0,0 +1,45 @@
+"""
+The NumPy GRU runtime against the torch model it was exported from, and the
+batch scorer that runs it.
+"""
+import subprocess
+import sys
+
+import pytest
+
+from server.models.gru_numpy import CHK, NPZ, REPO, NumpyGRU, check, export, is_stale
+from server.models.infer_dropper import load_model
+
+pytest.importorskip("torch")
+pytestmark = pytest.mark.skipif(not CHK.exists(), reason="no dropper_gru.pt checkpoint")
+
+# max |p_numpy − p_torch| allowed per stored weight precision
+TOLERANCE = {"float32": 1e-6, "float16": 1e-3, "int8": 1e-3}
+
+@pytest.mark.parametrize("precision", sorted(TOLERANCE))
+def test_export_matches_torch(tmp_path, precision):
+    path = export(out=tmp_path / f"dropper_gru.{precision}.npz", precision=precision)
+    assert not is_stale(NumpyGRU.load(path))
+    assert check(path, n=1024) < TOLERANCE[precision]
+
+@pytest.mark.skipif(not NPZ.exists(), reason="no exported dropper_gru.npz")
+def test_committed_export_is_current():
+    assert not is_stale(NumpyGRU.load(NPZ))
+    assert check(NPZ, n=1024) < TOLERANCE["float32"]
+
+def test_batch_inference_runs_without_torch():
+    # infer_dropper scores with the NumPy runtime; importing it must not load torch
+    code = "import sys, server.models.infer_dropper; sys.exit('torch' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code], cwd=REPO).returncode == 0
+
+def test_stale_export_is_redone(tmp_path):
+    import torch
+    npz, chk = tmp_path / "dropper_gru.npz", tmp_path / "dropper_gru.pt"
+    ck = torch.load(CHK, map_location="cpu", weights_only=False)
+    torch.save(ck, chk)
+    first = load_model(npz, chk)                     # no export yet
+    assert not is_stale(first, chk)
+    torch.save({**ck, "config": {**ck["config"], "retrained": True}}, chk)
+    assert is_stale(NumpyGRU.load(npz), chk)
+    second = load_model(npz, chk)                    # checkpoint changed since
+    assert not is_stale(second, chk) and second.config["retrained"]
@@ -0,0 +1,22 @@
+"""
+Conforming tables and frames to EVENT_SCHEMA.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from server.schema import EVENT_SCHEMA, conform, from_frame
+
+def test_all_null_float_column_casts_to_dictionary():
+    # pandas gives float64 for an all-NaN column; `el` is dictionary-encoded
+    t = pa.table({"sid": ["s", "s"], "uid": ["u", "u"], "ts": [1.0, 2.0], "ev": ["click", "scroll"],
+                  "el": pa.array([None, None], pa.float64())})
+    out = conform(t)
+    assert out.schema.equals(EVENT_SCHEMA)
+    assert out.column("el").type == EVENT_SCHEMA.field("el").type and out.column("el").null_count == 2
+
+def test_all_nan_frame_columns():
+    df = pd.DataFrame({"sid": ["s"], "uid": ["u"], "ts": [1.0], "ev": ["click"], "el": [np.nan], "dom": [np.nan]})
+    out = from_frame(df)
+    assert out.schema.equals(EVENT_SCHEMA)
+    assert out.column("el").null_count == 1 and out.column("dom").null_count == 1
@@ -0,0 +1,9 @@
+"""
+API cold start against bench.STARTUP_BUDGET (import time, peak RSS, and no
+analytics modules pulled in by `server.app`).
+"""
+from server.analysis import bench
+
+def test_api_cold_start_within_budget(capsys):
+    ok = bench.startup(runs=3)
+    assert ok, capsys.readouterr().out